@@ -0,0 +1,285 @@
+"""
+service_metrics.py - Metriche in-process in formato Prometheus
+==============================================================
+Registry minimale (counter, gauge, histogram con label) condiviso da
+tool_server.py e tasker_service.py, esposto su GET /metrics nel formato
+testuale di Prometheus (text/plain; version=0.0.4). Nessuna dipendenza
+esterna: prometheus_client non è nei requirements dell'eseguibile.
+
+Uso:
+    REQUESTS = metrics.counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+    REQUESTS.labels("GET", "/status", "200").inc()
+    LATENCY = metrics.histogram("http_request_duration_seconds", "Latency", ["route"])
+    LATENCY.labels("/status").observe(0.012)
+    QUEUE = metrics.gauge("notify_queue_depth", "Pending notifications")
+    QUEUE.set_function(lambda: len(queue))     # letto ad ogni scrape
+
+    app.add_middleware(MetricsMiddleware, registry=metrics)
+    @app.get("/metrics")
+    async def get_metrics():
+        return Response(metrics.render(), media_type=CONTENT_TYPE)
+"""
+
+import math
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: from a cached snapshot (~ms) to a slow upstream call
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes: snapshot text, encoded screenshots
+DEFAULT_SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values, **kwargs) -> "_Metric":
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self) -> "_Metric":
+        return type(self)(self.name, self.documentation)
+
+    @abstractmethod
+    def _samples(self, names: Sequence[str], key: Tuple[str, ...]) -> List[Tuple[str, str, float]]:
+        """(suffix, label text, value) of one series"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            series = sorted(self._children.items())
+        else:
+            series = [((), self)]
+        for key, metric in series:
+            for suffix, labels, value in metric._samples(self.labelnames, key):
+                lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Value read at scrape time from a monotonic count kept elsewhere (client stats)"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return math.nan
+        return self._value
+
+    def _samples(self, names, key):
+        return [("", _label_text(names, key), self.get())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Value computed at scrape time (queue depths, session counts)"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return math.nan
+        return self._value
+
+    def _samples(self, names, key):
+        return [("", _label_text(names, key), self.get())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(b for b in buckets if b != math.inf)) + (math.inf,)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def time(self) -> "_Timer":
+        """with HIST.labels(...).time(): ..."""
+        return _Timer(self)
+
+    def _samples(self, names, key):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            samples.append(("_bucket", _label_text(names, key, ("le", _format_value(bound))), cumulative))
+        samples.append(("_sum", _label_text(names, key), total))
+        samples.append(("_count", _label_text(names, key), count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """Named metrics of one process, rendered together for /metrics"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # Registered twice (e.g. a second middleware instance)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self.prefix + name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: per-route request count, latency and in-flight.
+    The route label is the matched path template (/browser/har/{session_id}),
+    so session ids do not explode the label set; unmatched paths are "other".
+    Streaming responses (SSE, MJPEG) are timed until the stream ends.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests by method, route and status", ["method", "route", "status"])
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by route", ["method", "route"])
+        self.in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being served")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "other"
+            method = scope.get("method", "")
+            self.latency.labels(method, template).observe(time.perf_counter() - start)
+            self.requests.labels(method, template, str(status["code"])).inc()
@@ -42,6 +42,11 @@ Versioni:
 - v8.0.0: SDK ALIGNMENT - Usa AsyncDefaultAgent invece di loop manuale con AsyncActor,
           temperature default 0.1 (LOW), thinker max_steps=100 (default)/120 (hard limit),
           actor max_steps=20 (default)/30 (hard limit), costanti importate da oagi.constants
+- v8.1.0: POPUP CLIENT - Messaggi popup Claude Launcher inviati da un thread di background
+          condiviso (keep-alive, coda limitata drop-oldest, sessione in cache, soppressione
+          se il launcher non risponde): gli step Lux non aspettano più il launcher
+- v8.2.0: METRICS - GET /metrics in formato Prometheus (service_metrics.py): richieste,
+          latenza e in-flight per route, task in esecuzione, coda popup launcher
 """
 
 import asyncio
@@ -52,6 +57,10 @@ import os
 import sys
 import time
 import subprocess
+import threading
+import http.client
+import urllib.parse
+from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
@@ -59,15 +68,17 @@ from pathlib import Path
 from typing import Any, Optional, Literal, List
 
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
+from service_metrics import MetricsRegistry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
-SERVICE_VERSION = "8.0.0"
+SERVICE_VERSION = "8.2.0"
 SERVICE_PORT = 8765
 
 # ==========================================================================
@@ -111,6 +122,149 @@ ANALYSIS_DIR.mkdir(parents=True, exist_ok=True)
 EXECUTION_LOGS_DIR = Path(__file__).parent / "execution_logs"
 EXECUTION_LOGS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Claude Launcher popup (v8.1.0)
+LAUNCHER_API_URL = "http://localhost:3847/api"
+LAUNCHER_QUEUE_SIZE = 100          # Messaggi in coda oltre questo: scarta i più vecchi
+LAUNCHER_SESSION_TTL = 30.0        # s - sessione launcher ri-verificata dopo questo
+LAUNCHER_FAILURE_THRESHOLD = 3     # Errori consecutivi prima della soppressione
+LAUNCHER_SUPPRESS_SECONDS = 30.0   # s - nessun invio mentre il launcher è giù
+
+# ============================================================================
+# LAUNCHER POPUP CLIENT (v8.1.0)
+# ============================================================================
+
+class LauncherPopupClient:
+    """
+    Client condiviso (process-wide) per i messaggi popup di Claude Launcher.
+
+    send() accoda e ritorna subito; un thread daemon invia con una connessione
+    HTTP keep-alive. Funziona da qualsiasi thread/event loop (step loop Lux,
+    observer callbacks, endpoint FastAPI).
+    - coda limitata: se piena scarta il messaggio più vecchio
+    - sessione launcher risolta una volta e tenuta in cache per LAUNCHER_SESSION_TTL
+    - dopo LAUNCHER_FAILURE_THRESHOLD errori i messaggi vengono scartati per
+      LAUNCHER_SUPPRESS_SECONDS (launcher giù = nessun timeout ripetuto)
+    """
+
+    def __init__(self, api_url: str = LAUNCHER_API_URL, queue_size: int = LAUNCHER_QUEUE_SIZE):
+        url = urllib.parse.urlsplit(api_url)
+        self.host = url.hostname or "localhost"
+        self.port = url.port or 80
+        self.base_path = url.path.rstrip("/")
+        self._queue: deque = deque(maxlen=queue_size)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._session_id: Optional[str] = None
+        self._session_checked = 0.0
+        self._failures = 0
+        self._suppressed_until = 0.0
+        self.stats = {"queued": 0, "sent": 0, "dropped": 0, "failed": 0}
+
+    @property
+    def suppressed(self) -> bool:
+        return time.monotonic() < self._suppressed_until
+
+    def send(self, text: str, fallback_session_id: Optional[str] = None) -> bool:
+        """Accoda un messaggio già formattato. False se scartato (launcher soppresso)."""
+        if self.suppressed:
+            self.stats["dropped"] += 1
+            return False
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.stats["dropped"] += 1  # deque(maxlen) scarta il più vecchio
+            self._queue.append((text, fallback_session_id))
+            self.stats["queued"] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="launcher-popup", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                text, fallback_session_id = self._queue.popleft()
+            if self.suppressed:
+                self.stats["dropped"] += 1
+                continue
+            try:
+                session_id = self._resolve_session() or fallback_session_id
+                if not session_id:
+                    self.stats["dropped"] += 1
+                    continue
+                status, _ = self._request("POST", f"/sessions/{session_id}/input", {"input": text})
+                if status == 404:
+                    self._session_checked = 0.0  # Sessione chiusa: ri-scopri al prossimo invio
+                if status >= 500:
+                    raise ConnectionError(f"HTTP {status}")
+                self.stats["sent"] += 1
+                self._failures = 0
+            except Exception:
+                # Silent fail - don't interrupt execution for popup errors
+                self.stats["failed"] += 1
+                self._failures += 1
+                if self._failures >= LAUNCHER_FAILURE_THRESHOLD:
+                    self._failures = 0
+                    self._session_checked = 0.0
+                    self._suppressed_until = time.monotonic() + LAUNCHER_SUPPRESS_SECONDS
+                    with self._cond:
+                        self.stats["dropped"] += len(self._queue)
+                        self._queue.clear()
+
+    def _resolve_session(self) -> Optional[str]:
+        """Prima sessione 'running' del launcher, in cache per LAUNCHER_SESSION_TTL"""
+        now = time.monotonic()
+        if now - self._session_checked < LAUNCHER_SESSION_TTL:
+            return self._session_id
+        status, body = self._request("GET", "/sessions")  # Solleva se il launcher è giù
+        self._session_checked = now
+        self._session_id = None
+        if status == 200:
+            sessions = json.loads(body.decode() or "{}")
+            for sid, info in sessions.items():
+                if info.get("status") == "running":
+                    self._session_id = sid
+                    break
+        return self._session_id
+
+    def _request(self, method: str, path: str, payload: Optional[dict] = None) -> tuple:
+        """Richiesta sulla connessione keep-alive; un retry se il server l'ha chiusa"""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=2)
+            try:
+                self._conn.request(method, self.base_path + path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                return response.status, response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+            except Exception:
+                self._conn.close()
+                self._conn = None
+                raise
+
+launcher_popup = LauncherPopupClient()
+
+# v8.2.0: Metriche Prometheus (per-route request/latency/in-flight dal MetricsMiddleware)
+metrics = MetricsRegistry()
+LAUNCHER_QUEUE_DEPTH = metrics.gauge("tasker_launcher_popup_queue_depth", "Popup messages waiting for the launcher")
+LAUNCHER_QUEUE_DEPTH.set_function(lambda: launcher_popup.queue_depth)
+LAUNCHER_POPUPS = metrics.counter("tasker_launcher_popups_total", "Launcher popup messages by result", ["result"])
+for _result in ("queued", "sent", "dropped", "failed"):
+    LAUNCHER_POPUPS.labels(_result).set_function(lambda r=_result: launcher_popup.stats[r])
+
 # ============================================================================
 # LOGGING - Sistema Isolato per Esecuzione (v7.5.0)
 # ============================================================================
@@ -121,8 +275,7 @@ class ExecutionContext:
     Risolve race condition: ogni task ha il suo logger/directory.
     """
 
-    # Claude Launcher API configuration (for popup notifications)
-    LAUNCHER_API_URL = "http://localhost:3847/api"
+    # Claude Launcher API configuration (for popup notifications) - v8.1.0: see LauncherPopupClient
     LAUNCHER_ENABLED = True  # Set to False to disable popup notifications
 
     def __init__(self, mode: str, task_description: str):
@@ -149,9 +302,6 @@ class ExecutionContext:
         self.success = False
         self.error: Optional[str] = None
 
-        # Launcher session (for popup)
-        self._launcher_session_id: Optional[str] = None
-
         # Scrivi header
         self._write_header()
 
@@ -223,61 +373,27 @@ class ExecutionContext:
         """
         Send a message to Claude Launcher's Tool Popup system.
         The message will appear in the Lux popup (if visible).
+        v8.1.0: Non-blocking, delivered by the shared launcher_popup client.
         Note: This is for web app integration - desktop popup may cover screen during Lux operation.
         """
         if not self.LAUNCHER_ENABLED:
             return
 
-        try:
-            import urllib.request
-            import urllib.error
-
-            # Discover active session if not cached
-            if not self._launcher_session_id:
-                try:
-                    req = urllib.request.Request(f"{self.LAUNCHER_API_URL}/sessions")
-                    req.add_header("Content-Type", "application/json")
-                    with urllib.request.urlopen(req, timeout=1) as response:
-                        sessions = json.loads(response.read().decode())
-                        # Find first running session
-                        for sid, info in sessions.items():
-                            if info.get("status") == "running":
-                                self._launcher_session_id = sid
-                                break
-                except:
-                    # No session found, use execution_id
-                    self._launcher_session_id = self.execution_id
-
-            # Format message as [Lux] prefix for Tool pattern matching
-            if msg_type == "success":
-                formatted_text = f"[Lux OK] {text}"
-            elif msg_type == "error":
-                formatted_text = f"[Lux ERROR] {text}"
-            elif msg_type == "warning":
-                formatted_text = f"[Lux WARNING] {text}"
-            elif msg_type == "action":
-                formatted_text = f"[Lux ACTION] {text}"
-            else:
-                formatted_text = f"[Lux] {text}"
-
-            # Send to /sessions/{id}/input endpoint
-            payload = {
-                "input": formatted_text
-            }
-
-            req = urllib.request.Request(
-                f"{self.LAUNCHER_API_URL}/sessions/{self._launcher_session_id}/input",
-                data=json.dumps(payload).encode('utf-8'),
-                method='POST'
-            )
-            req.add_header("Content-Type", "application/json")
+        # Format message as [Lux] prefix for Tool pattern matching
+        if msg_type == "success":
+            formatted_text = f"[Lux OK] {text}"
+        elif msg_type == "error":
+            formatted_text = f"[Lux ERROR] {text}"
+        elif msg_type == "warning":
+            formatted_text = f"[Lux WARNING] {text}"
+        elif msg_type == "action":
+            formatted_text = f"[Lux ACTION] {text}"
+        else:
+            formatted_text = f"[Lux] {text}"
 
-            with urllib.request.urlopen(req, timeout=2) as response:
-                pass  # Fire and forget
-
-        except Exception as e:
-            # Silent fail - don't interrupt execution for popup errors
-            pass
+        # v8.1.0: Fire and forget - queued on the shared popup client, never blocks the step loop.
+        # Without a running launcher session the message goes to this execution_id (as before).
+        launcher_popup.send(formatted_text, fallback_session_id=self.execution_id)
 
     def log(self, message: str, level: str = "INFO"):
         """Log con timestamp - scrive su file E console"""
@@ -2363,8 +2479,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, registry=metrics)
 
 is_running = False
+TASK_RUNNING = metrics.gauge("tasker_task_running", "1 while a task is executing")
+TASK_RUNNING.set_function(lambda: 1 if is_running else 0)
 # Executor globale per mantenere il browser aperto tra i task
 global_hybrid_executor: Optional[HybridModeExecutor] = None
 
@@ -2429,6 +2548,12 @@ async def root():
     return {"service": "Architect's Hand Tasker", "version": SERVICE_VERSION}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """v8.2.0: Metriche in formato Prometheus"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/status", response_model=StatusResponse)
 async def get_status():
     """Stato del servizio"""
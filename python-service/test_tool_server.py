@@ -89,6 +89,137 @@ def test_health():
         fail(f"Health endpoint: {e}")
         return False
 
+def test_logs_stream():
+    """Test GET /logs/stream - backlog of 1 server line over SSE (v10.28.0)"""
+    try:
+        with requests.get(
+            f"{TOOL_SERVER_URL}/logs/stream",
+            params={"source": "server", "backlog": 1},
+            stream=True,
+            timeout=TIMEOUT
+        ) as r:
+            if r.status_code != 200 or not r.headers.get("content-type", "").startswith("text/event-stream"):
+                fail(f"Logs stream: HTTP {r.status_code} {r.headers.get('content-type')}")
+                return False
+            for line in r.iter_lines(decode_unicode=True):
+                if line and line.startswith("data: "):
+                    event = json.loads(line[6:])
+                    ok(f"Logs stream: seq {event['seq']} [{event['level']}] {event['text'][:60]}")
+                    return True
+                if line and line.startswith("retry:"):
+                    break  # Backlog done
+        warn("Logs stream: no backlog line (empty buffer)")
+        return True
+    except Exception as e:
+        fail(f"Logs stream: {e}")
+        return False
+
+def test_fake_desktop_backend():
+    """Test desktop click/type/hold_key/screenshot through DesktopWorker + FakeDesktopBackend (v10.19.0, in-process)"""
+    import asyncio
+    import tool_server as ts
+
+    fake = ts.FakeDesktopBackend(width=800, height=600)
+    worker = ts.DesktopWorker(fake)
+    original, ts.desktop = ts.desktop, worker
+
+    async def scenario():
+        results = [
+            await ts.do_click(ts.ClickRequest(scope="desktop", x=100, y=200, coordinate_origin="screen")),
+            await ts.do_type(ts.TypeRequest(scope="desktop", text="hello", method="keystrokes")),
+            await ts.do_hold_key(ts.HoldKeyRequest(scope="desktop", key="Shift", duration=0.05)),
+            await ts.take_screenshot(ts.ScreenshotRequest(scope="desktop", format="jpeg")),
+        ]
+        return results, worker._thread.name if worker._thread else None
+
+    try:
+        results, thread_name = asyncio.run(scenario())
+    except Exception as e:
+        fail(f"Fake desktop backend: {e}")
+        return False
+    finally:
+        ts.desktop = original
+        worker.stop()
+
+    errors = [r.error for r in results if not r.success]
+    expected = [
+        ("click", (100, 200, "single")),
+        ("type_text", ("hello", "keystrokes")),
+        ("key_down", ("shift",)),
+        ("key_up", ("shift",)),
+        ("screenshot", ()),
+    ]
+    shot = results[-1]
+    if errors or fake.calls != expected or thread_name != "desktop-worker" or (shot.width, shot.height) != (800, 600):
+        fail(f"Fake desktop backend: errors={errors} calls={fake.calls} thread={thread_name} "
+             f"screenshot={shot.width}x{shot.height}")
+        return False
+    ok(f"Fake desktop backend: {len(fake.calls)} calls recorded on {thread_name}, screenshot {shot.width}x{shot.height}")
+    return True
+
+def test_log_reader():
+    """Test the reverse /logs/read reader on temp files: whole records, level/time filters, backups (v10.27.0, in-process)"""
+    import tempfile
+    from pathlib import Path
+    import tool_server as ts
+
+    def record(second, level, traceback_lines=0):
+        return (f"[2026-10-16 10:00:{second:02d}.000] [{level}] msg {second}\n"
+                + "".join(f"  more {second}.{k}\n" for k in range(traceback_lines)))
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            log = Path(tmp) / "test.log"
+            # Backup .1 holds the older records, the current file the newer ones
+            log.with_name("test.log.1").write_text("".join(record(s, "ERROR", 2) for s in range(0, 10)))
+            log.write_text("".join(record(s, "ERROR" if s % 2 else "INFO", 2 if s % 2 else 0) for s in range(10, 30)))
+
+            checks = []
+            # 7 lines of 3-line ERROR records: two whole records, no orphan traceback line
+            out, count = ts._read_log_file(log, 7, "ERROR", None, backups=1)
+            lines = out.splitlines()
+            checks.append(("whole records", count == 6 and lines[0].endswith("msg 27") and lines[-1] == "  more 29.1"))
+            # Newest record is returned whole even when longer than N
+            out, count = ts._read_log_file(log, 2, "ERROR", None, backups=1)
+            checks.append(("oversized newest record", count == 3 and out.splitlines()[0].endswith("msg 29")))
+            # Time range spanning the rotation boundary
+            out, count = ts._read_log_file(log, 100, None, None, since="2026-10-16 10:00:08",
+                                           until="2026-10-16 10:00:11", backups=1)
+            heads = [l for l in out.splitlines() if l.startswith("[")]
+            checks.append(("since/until across backups", [h.split()[-1] for h in heads] == ["8", "9", "10", "11"]))
+            # Date-only until covers the whole day; timestamps that do not parse are rejected
+            out, count = ts._read_log_file(log, 100, "ERROR", None, until="2026-10-16", backups=1)
+            checks.append(("date-only until", "msg 29" in out))
+            try:
+                ts._log_filter_ts("yesterday")
+                checks.append(("invalid timestamp rejected", False))
+            except ValueError:
+                checks.append(("invalid timestamp rejected", True))
+
+        failed = [name for name, passed in checks if not passed]
+        if failed:
+            fail(f"Log reader: {', '.join(failed)}")
+            return False
+        ok(f"Log reader: {len(checks)} checks (whole records, level/time filters, timestamps, rotated backup)")
+        return True
+    except Exception as e:
+        fail(f"Log reader: {e}")
+        return False
+
+def test_metrics():
+    """Test GET /metrics - Prometheus text format (v10.29.0)"""
+    try:
+        requests.get(f"{TOOL_SERVER_URL}/status", timeout=TIMEOUT)
+        r = requests.get(f"{TOOL_SERVER_URL}/metrics", timeout=TIMEOUT)
+        if r.status_code == 200 and 'http_requests_total{method="GET",route="/status"' in r.text:
+            ok(f"Metrics: {sum(1 for l in r.text.splitlines() if l.startswith('# TYPE'))} metrics")
+            return True
+        fail(f"Metrics: HTTP {r.status_code} - {r.text[:200]}")
+        return False
+    except Exception as e:
+        fail(f"Metrics: {e}")
+        return False
+
 def test_browser_start(url=TEST_URL):
     """Test POST /browser/start"""
     try:
@@ -172,6 +303,265 @@ def test_screenshot(session_id, scope="browser"):
         fail(f"Screenshot ({scope}): {e}")
         return False
 
+def test_screenshot_encoding(session_id):
+    """Test /screenshot format/quality/max_width options (v10.15.0)"""
+    try:
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/screenshot",
+            json={"scope": "browser", "session_id": session_id,
+                  "format": "jpeg", "quality": 70, "max_width": 640},
+            timeout=TIMEOUT
+        )
+        data = r.json() if r.status_code == 200 else {}
+        if (data.get("success") and data.get("media_type") == "image/jpeg" and data.get("width", 0) <= 640
+                and data.get("lux_scale_x") == 1.0 and data.get("image_scale_x", 0) > 1.0):
+            timings = data.get("timings") or {}
+            ok(f"Screenshot encoding: {data['width']}x{data['height']} jpeg {data.get('bytes', 0)//1024}KB "
+               f"(capture {timings.get('capture')}ms, encode {timings.get('encode')}ms, "
+               f"image scale {data.get('image_scale_x')}, lux scale {data.get('lux_scale_x')})")
+            return True
+        fail(f"Screenshot encoding: {data.get('error') or r.text[:200]}")
+        return False
+    except Exception as e:
+        fail(f"Screenshot encoding: {e}")
+        return False
+
+def test_screenshot_binary(session_id):
+    """Test Accept: image/* raw screenshot transport (v10.16.0)"""
+    try:
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/screenshot",
+            json={"scope": "browser", "session_id": session_id, "format": "jpeg"},
+            headers={"Accept": "image/*"},
+            timeout=TIMEOUT
+        )
+        if r.status_code == 200 and r.headers.get("content-type", "").startswith("image/jpeg"):
+            ok(f"Screenshot binary: {r.headers.get('X-Image-Width')}x{r.headers.get('X-Image-Height')}, "
+               f"{len(r.content)//1024}KB raw (image scale {r.headers.get('X-Image-Scale-X')}, "
+               f"lux scale {r.headers.get('X-Lux-Scale-X')})")
+            return True
+        fail(f"Screenshot binary: HTTP {r.status_code} {r.headers.get('content-type')} - {r.text[:200]}")
+        return False
+    except Exception as e:
+        fail(f"Screenshot binary: {e}")
+        return False
+
+def test_screenshot_unchanged(session_id):
+    """Test if_changed_since perceptual dedupe (v10.17.0)"""
+    try:
+        payload = {"scope": "browser", "session_id": session_id}
+        r = requests.post(f"{TOOL_SERVER_URL}/screenshot", json=payload, timeout=TIMEOUT)
+        phash = r.json().get("phash") if r.status_code == 200 else None
+        if not phash:
+            warn("Screenshot dedupe: no phash (PIL not available?)")
+            return True
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/screenshot",
+            json={**payload, "if_changed_since": phash, "change_threshold": 4},
+            timeout=TIMEOUT
+        )
+        data = r.json()
+        if not data.get("unchanged"):
+            warn(f"Screenshot dedupe: page changed between shots (distance {data.get('distance')})")
+            return True
+        # Accept: image/* gets a 304 with the phash headers instead of a JSON body
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/screenshot",
+            json={**payload, "if_changed_since": phash, "change_threshold": 4},
+            headers={"Accept": "image/*"},
+            timeout=TIMEOUT
+        )
+        if r.status_code != 304 or r.headers.get("X-Unchanged") != "true":
+            fail(f"Screenshot dedupe: image Accept got HTTP {r.status_code} {r.headers.get('content-type')}")
+            return False
+        ok(f"Screenshot dedupe: unchanged (distance {data.get('distance')}, no image; 304 for image/*)")
+        return True
+    except Exception as e:
+        fail(f"Screenshot dedupe: {e}")
+        return False
+
+def test_screencast_mjpeg(session_id):
+    """Test GET /browser/screencast/{id}/mjpeg - reads the first frame (v10.18.0)"""
+    try:
+        with requests.get(
+            f"{TOOL_SERVER_URL}/browser/screencast/{session_id}/mjpeg",
+            params={"max_fps": 5, "quality": 50},
+            stream=True,
+            timeout=TIMEOUT
+        ) as r:
+            if r.status_code != 200:
+                fail(f"Screencast MJPEG: HTTP {r.status_code} - {r.text[:200]}")
+                return False
+            buf = b""
+            for chunk in r.iter_content(chunk_size=16384):
+                buf += chunk
+                if b"\xff\xd9" in buf:  # JPEG end marker
+                    break
+            if b"Content-Type: image/jpeg" in buf:
+                ok(f"Screencast MJPEG: first frame {len(buf)//1024}KB")
+                return True
+            fail("Screencast MJPEG: no JPEG frame received")
+            return False
+    except Exception as e:
+        fail(f"Screencast MJPEG: {e}")
+        return False
+
+def test_network_cursor(session_id):
+    """Test /browser/network since/cursor reads (v10.24.0)"""
+    try:
+        r = requests.post(f"{TOOL_SERVER_URL}/browser/network",
+                          json={"session_id": session_id, "limit": 5}, timeout=TIMEOUT)
+        data = r.json()
+        if not data.get("success") or "cursor" not in data:
+            fail(f"Network cursor: {data}")
+            return False
+        cursor = data["cursor"]
+        r = requests.post(f"{TOOL_SERVER_URL}/browser/network",
+                          json={"session_id": session_id, "since": cursor}, timeout=TIMEOUT)
+        data = r.json()
+        if data.get("success") and data.get("cursor", -1) >= cursor:
+            ok(f"Network cursor: {cursor} -> {data['cursor']} ({data['count']} new, {data.get('missed')} missed)")
+            return True
+        fail(f"Network cursor: {data}")
+        return False
+    except Exception as e:
+        fail(f"Network cursor: {e}")
+        return False
+
+def test_har_recording():
+    """Test HAR start -> navigate -> stop -> download after /browser/stop (v10.25.0)"""
+    # Own session: the main one must stay on TEST_URL for the element/click/type tests
+    try:
+        r = requests.post(f"{TOOL_SERVER_URL}/browser/start",
+                          json={"headless": True, "backend": "shared"}, timeout=60)
+        session_id = r.json().get("session_id") if r.status_code == 200 else None
+        if not session_id:
+            fail(f"HAR recording: session start HTTP {r.status_code} - {r.text[:200]}")
+            return False
+        try:
+            r = requests.post(f"{TOOL_SERVER_URL}/browser/har/start", json={"session_id": session_id}, timeout=TIMEOUT)
+            if not r.json().get("success"):
+                fail(f"HAR recording: start {r.json()}")
+                return False
+            requests.post(f"{TOOL_SERVER_URL}/browser/navigate",
+                          json={"session_id": session_id, "url": "https://example.com"}, timeout=TIMEOUT)
+            stop = requests.post(f"{TOOL_SERVER_URL}/browser/har/stop", json={"session_id": session_id}, timeout=TIMEOUT).json()
+            if not stop.get("success"):
+                fail(f"HAR recording: stop {stop}")
+                return False
+        finally:
+            requests.post(f"{TOOL_SERVER_URL}/browser/stop", params={"session_id": session_id}, timeout=TIMEOUT)
+        r = requests.get(f"{TOOL_SERVER_URL}/browser/har/{session_id}", timeout=TIMEOUT)
+        entries = r.json()["log"]["entries"] if r.status_code == 200 else None
+        if entries is None:
+            fail(f"HAR recording: download after stop HTTP {r.status_code}")
+            return False
+        requests.delete(f"{TOOL_SERVER_URL}/browser/har/{session_id}", timeout=TIMEOUT)
+        ok(f"HAR recording: {len(entries)} entries, {stop.get('bytes', 0)//1024}KB on disk")
+        return True
+    except Exception as e:
+        fail(f"HAR recording: {e}")
+        return False
+
+def test_snapshot_policy(session_id):
+    """Test snapshot policies none/lazy, session default and snapshot ETag/304 (v10.13.0)"""
+    try:
+        # none: no snapshot at all (scroll down, then back up below: page left as found)
+        data = requests.post(
+            f"{TOOL_SERVER_URL}/scroll",
+            json={"scope": "browser", "session_id": session_id, "direction": "down", "amount": 100, "snapshot": "none"},
+            timeout=TIMEOUT
+        ).json()
+        if not data.get("success") or data.get("snapshot") or data.get("snapshot_diff"):
+            fail(f"Snapshot policy: none returned a snapshot ({data.get('error') or data.get('snapshot_policy')})")
+            return False
+
+        # lazy: only the generation token to fetch later
+        data = requests.post(
+            f"{TOOL_SERVER_URL}/scroll",
+            json={"scope": "browser", "session_id": session_id, "direction": "up", "amount": 100, "snapshot": "lazy"},
+            timeout=TIMEOUT
+        ).json()
+        if data.get("snapshot") or data.get("snapshot_generation") is None:
+            fail(f"Snapshot policy: lazy -> snapshot={bool(data.get('snapshot'))} generation={data.get('snapshot_generation')}")
+            return False
+
+        # Session default round trip
+        for policy in ("none", "full"):
+            r = requests.post(f"{TOOL_SERVER_URL}/browser/snapshot_policy",
+                              json={"session_id": session_id, "policy": policy}, timeout=TIMEOUT)
+            if r.json().get("policy") != policy:
+                fail(f"Snapshot policy: session default {policy} -> {r.json()}")
+                return False
+
+        # ETag / If-None-Match -> 304 while the page is unchanged
+        r = requests.get(f"{TOOL_SERVER_URL}/browser/snapshot", params={"session_id": session_id}, timeout=TIMEOUT)
+        etag = r.headers.get("ETag")
+        if not etag:
+            fail(f"Snapshot policy: no ETag on /browser/snapshot (HTTP {r.status_code})")
+            return False
+        r = requests.get(f"{TOOL_SERVER_URL}/browser/snapshot", params={"session_id": session_id},
+                         headers={"If-None-Match": etag}, timeout=TIMEOUT)
+        if r.status_code != 304:
+            if r.headers.get("ETag") != etag:
+                warn(f"Snapshot policy: page changed between snapshots ({etag} -> {r.headers.get('ETag')})")
+                return True
+            fail(f"Snapshot policy: If-None-Match {etag} -> HTTP {r.status_code}")
+            return False
+        # Another representation of the same generation is not "not modified"
+        r = requests.get(f"{TOOL_SERVER_URL}/browser/snapshot", params={"session_id": session_id, "format": "json"},
+                         headers={"If-None-Match": etag}, timeout=TIMEOUT)
+        if r.status_code == 304:
+            fail("Snapshot policy: format=json answered 304 for the text ETag")
+            return False
+
+        ok(f"Snapshot policy: none/lazy/session default OK, 304 for {etag}")
+        return True
+    except Exception as e:
+        fail(f"Snapshot policy: {e}")
+        return False
+
+def test_action_timings(session_id):
+    """Test request span timings in ActionResponse (v10.30.0)"""
+    try:
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/scroll",
+            json={"scope": "browser", "session_id": session_id, "direction": "down", "amount": 100},
+            timeout=TIMEOUT
+        )
+        timings = r.json().get("timings") or {}
+        if "action" in timings and "total" in timings:
+            ok(f"Action timings: {timings}")
+            return True
+        fail(f"Action timings: missing spans in {timings}")
+        return False
+    except Exception as e:
+        fail(f"Action timings: {e}")
+        return False
+
+def test_shared_session():
+    """Test a second concurrent session in the shared browser (v10.31.0)"""
+    try:
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/browser/start",
+            json={"start_url": TEST_URL, "headless": True, "backend": "shared"},
+            timeout=60
+        )
+        if r.status_code != 200:
+            fail(f"Shared session: HTTP {r.status_code} - {r.text[:200]}")
+            return False
+        data = r.json()
+        sid = data.get("session_id")
+        requests.post(f"{TOOL_SERVER_URL}/browser/stop", params={"session_id": sid}, timeout=TIMEOUT)
+        if data.get("backend") == "shared" and data.get("current_url"):
+            ok(f"Shared session: {sid} at {data['current_url']}")
+            return True
+        fail(f"Shared session: backend={data.get('backend')} url={data.get('current_url')}")
+        return False
+    except Exception as e:
+        fail(f"Shared session: {e}")
+        return False
+
 def test_dom_tree(session_id):
     """Test GET /browser/dom/tree"""
     try:
@@ -489,6 +879,98 @@ def test_keypress(session_id, key="Tab"):
         fail(f"Keypress: {e}")
         return False
 
+def test_snapshot_diff(session_id):
+    """Test snapshot generations + diff via snapshot_since (v10.8.0)"""
+    try:
+        r = requests.get(
+            f"{TOOL_SERVER_URL}/browser/snapshot",
+            params={"session_id": session_id},
+            timeout=TIMEOUT
+        )
+        generation = r.json().get("generation") if r.status_code == 200 else None
+        if not generation:
+            fail(f"Snapshot generation: missing - {r.text[:200]}")
+            return False
+        detail(f"Base generation: {generation}")
+
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/scroll",
+            json={
+                "scope": "browser",
+                "direction": "down",
+                "amount": 300,
+                "session_id": session_id,
+                "snapshot_since": generation
+            },
+            timeout=TIMEOUT
+        )
+        data = r.json()
+        diff = data.get("snapshot_diff")
+        if diff is not None:
+            ok(f"Snapshot diff: +{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['changed'])} (gen {data.get('snapshot_generation')})")
+            return True
+        if data.get("snapshot") is not None:
+            warn("Snapshot diff: full snapshot returned (base generation evicted or URL changed)")
+            return True
+        fail(f"Snapshot diff: no snapshot in response: {str(data)[:200]}")
+        return False
+    except Exception as e:
+        fail(f"Snapshot diff: {e}")
+        return False
+
+def test_wait_for_stable(session_id):
+    """Test POST /browser/wait_for_stable (v10.11.0)"""
+    try:
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/browser/wait_for_stable",
+            json={"session_id": session_id, "timeout": 5000},
+            timeout=TIMEOUT
+        )
+        if r.status_code == 200:
+            data = r.json()
+            details = data.get("details") or {}
+            if data.get("success"):
+                ok(f"Wait for stable: {details.get('elapsed_ms')}ms")
+            else:
+                warn(f"Wait for stable: not stable ({details.get('pending_requests')} pending requests)")
+            return True
+        else:
+            fail(f"Wait for stable: HTTP {r.status_code} - {r.text[:200]}")
+            return False
+    except Exception as e:
+        fail(f"Wait for stable: {e}")
+        return False
+
+def test_batch(session_id):
+    """Test POST /batch (v10.14.0)"""
+    try:
+        r = requests.post(
+            f"{TOOL_SERVER_URL}/batch",
+            json={
+                "session_id": session_id,
+                "steps": [
+                    {"action": "scroll", "params": {"direction": "up", "amount": 300}},
+                    {"action": "keypress", "params": {"key": "Tab"}, "wait_after_ms": 100},
+                    {"action": "wait", "params": {"duration": 0.2}}
+                ],
+                "include_screenshot": True
+            },
+            timeout=TIMEOUT
+        )
+        if r.status_code != 200:
+            fail(f"Batch: HTTP {r.status_code} - {r.text[:200]}")
+            return False
+        data = r.json()
+        if data.get("success") and data.get("completed") == 3 and data.get("screenshot_base64"):
+            steps_ms = [s.get("timings", {}).get("step") for s in data.get("results", [])]
+            ok(f"Batch: {data['completed']} steps {steps_ms}ms, snapshot {data.get('snapshot_ref_count')} refs")
+            return True
+        fail(f"Batch: {data.get('error')} (completed {data.get('completed')})")
+        return False
+    except Exception as e:
+        fail(f"Batch: {e}")
+        return False
+
 def test_navigate(session_id, url="https://www.bing.com"):
     """Test POST /browser/navigate"""
     try:
@@ -589,6 +1071,26 @@ def run_all_tests():
     
     test_health()  # Non critico
     
+    if test_logs_stream():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_metrics():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_fake_desktop_backend():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_log_reader():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
     # ──────────────────────────────────────────────────────
     # BROWSER TESTS
     # ──────────────────────────────────────────────────────
@@ -622,6 +1124,51 @@ def run_all_tests():
     else:
         results["failed"] += 1
     
+    if test_screenshot_encoding(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_screenshot_binary(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_screenshot_unchanged(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_screencast_mjpeg(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_network_cursor(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_har_recording():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_snapshot_policy(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_action_timings(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    if test_shared_session():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
     if test_desktop_screenshot():
         results["passed"] += 1
     else:
@@ -700,6 +1247,18 @@ def run_all_tests():
         results["passed"] += 1
     else:
         results["failed"] += 1
+
+    info("Snapshot diff (snapshot_since)...")
+    if test_snapshot_diff(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+
+    info("Batch (scroll + keypress + wait)...")
+    if test_batch(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
     
     # ──────────────────────────────────────────────────────
     # NAVIGATION
@@ -713,7 +1272,10 @@ def run_all_tests():
     else:
         results["failed"] += 1
     
-    time.sleep(2)
+    if test_wait_for_stable(session_id):
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
     
     # Verifica URL cambiato
     test_current_url(session_id)
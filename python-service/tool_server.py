@@ -26,6 +26,30 @@ CHANGELOG:
 - v10.6.0: Security hardening - auth obbligatoria per tutte le richieste sensibili
 - v10.6.1: Log file access - Claude Code può leggere autonomamente server/browser logs
 - v10.7.0: Gateway proxy - Tool Server come gateway centrale per Claude Launcher e Clawdbot
+- v10.8.0: Versioned snapshots - generation id + diff (added/removed/changed) via snapshot_since
+- v10.9.0: Stable refs - content-addressed refs (DOM path hash) that survive re-snapshots
+- v10.10.0: Snapshot cache - MutationObserver dirty counter + single-flight DOM extraction
+- v10.11.0: Adaptive settle - network idle + DOM quiet + rAF instead of fixed 0.3s sleeps
+- v10.12.0: Capture pipeline - one settle, concurrent screenshot + snapshot, phase timings
+- v10.13.0: Snapshot policy (none/lazy/diff/full) per request + session default, ETag/304 on /browser/snapshot
+- v10.14.0: /batch - ordered action steps in one round trip, per-step results + one final snapshot/screenshot
+- v10.15.0: Screenshot encoding - format/quality/scale/max_width/clip/full_page, PIL work in a bounded thread pool
+- v10.16.0: Binary screenshots - Accept: image/* (raw + X- headers) or multipart/mixed, base64 JSON kept as default
+- v10.17.0: Screenshot dedupe - dHash per page, if_changed_since=<phash> returns a tiny "unchanged" response
+- v10.18.0: Live screencast - CDP Page.startScreencast over WebSocket or MJPEG, ack-paced FPS cap, shared per session
+- v10.19.0: Desktop I/O worker - pyautogui/pyperclip + desktop screenshot encoding on one thread, fake backend for headless tests
+- v10.20.0: Clawdbot notifier - async queue, pooled client, burst coalescing, session TTL cache, circuit breaker
+- v10.21.0: Gateway pools - app-lifetime keep-alive httpx client per upstream, per-route timeouts, latency/pool stats
+- v10.22.0: Streaming proxy - request and response bodies (chunked/SSE) streamed through, no buffering
+- v10.23.0: Service health monitor - concurrent background probes, cached /services/status (?fresh=1), latency + history
+- v10.24.0: Console/network ring buffers (deque + in-flight index), timings from requestfinished/requestfailed, since/cursor reads, POST /browser/capture_policy
+- v10.25.0: HAR recorder - /browser/har/start|stop, entries streamed to JSONL by a background writer thread, GET /browser/har/{id} streams the HAR
+- v10.26.0: browser_console.log written by a batched background sink fed from every session's console events, rotated at 5MB x 3
+- v10.27.0: /logs/read tails backwards across .log/.1/.2/.3, block index (levels, timestamps) for filter_level + since/until; dated file log lines
+- v10.28.0: GET /logs/stream - SSE tail of server + browser console lines from an in-process log handler, filters, cursor/Last-Event-ID resume
+- v10.29.0: GET /metrics (service_metrics.py) - per-route count/latency/in-flight, sessions, snapshot/screenshot size+time, proxy latency, queue depths
+- v10.30.0: Request spans (resolve/action/settle/screenshot/encode/snapshot/notify) -> timings + Server-Timing, optional spans.jsonl trace file
+- v10.31.0: Concurrent sessions - shared browser with isolated contexts seeded from the profile storage_state, session backends, uuid session ids
 """
 
 import argparse
@@ -34,25 +58,34 @@ import base64
 import io
 import json
 import logging
+import random
 import logging.handlers
 import os
 import re
 import sys
 import time
+import uuid
 import atexit
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict, deque
 import webbrowser
 import threading
+import queue
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any, Optional, Literal, List, Dict, Tuple
 
 import uvicorn
 import httpx
-from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
+
+from service_metrics import MetricsRegistry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE, DEFAULT_SIZE_BUCKETS
 
 # ============================================================================
 # NGROK CONFIGURATION
@@ -72,7 +105,7 @@ except ImportError:
 # CONFIGURATION
 # ============================================================================
 
-SERVICE_VERSION = "10.7.0"  # Gateway proxy for Claude Launcher & Clawdbot
+SERVICE_VERSION = "10.31.0"  # Shared browser pool
 SERVICE_PORT = 8766
 
 # ============================================================================
@@ -151,6 +184,62 @@ NORMALIZED_COORD_MAX = 999
 # UNIFIED PROFILE: Same as tasker_service.py for LuxVision/Cloud Computer Use
 # This ensures all tools share: logins, cookies, sessions, browser state
 BROWSER_PROFILE_DIR = Path.home() / ".architect-hand-browser"
+BROWSER_LAUNCH_ARGS = ["--disable-blink-features=AutomationControlled", "--disable-infobars", "--no-first-run"]
+# v10.31.0: Session backends - "persistent" (the profile itself, one session at a time),
+# "shared" (isolated context in one shared browser), "auto" (profile if free, else shared)
+SESSION_BACKEND = os.environ.get("TOOL_SERVER_SESSION_BACKEND", "auto").lower()
+BROWSER_STORAGE_STATE_PATH = Path.home() / ".architect-hand-browser-state.json"  # Profile logins for shared contexts
+STORAGE_STATE_MAX_AGE = 300  # seconds - older exports are refreshed from the profile
+# v10.8.0: Number of snapshot generations kept per session for diffs
+SNAPSHOT_HISTORY_SIZE = 8
+# v10.9.0: Refs not seen for this many generations are dropped (e.g. scrolled away long ago)
+REF_RETENTION_GENERATIONS = 20
+# v10.11.0: Settle detection after actions (replaces the fixed 0.3s sleeps)
+SETTLE_QUIET_MS = 100          # DOM must be mutation-free this long
+SETTLE_NETWORK_IDLE_MS = 100   # ...and no request in flight this long
+SETTLE_TIMEOUT_MS = 1500       # deadline: capture anyway after this
+SETTLE_IGNORED_RESOURCE_TYPES = ("websocket", "eventsource", "media")
+SETTLE_MAX_REQUEST_AGE = 10.0  # seconds - older requests are long-polls, not page loading
+# v10.15.0: Screenshot encoding (resize/JPEG/WebP) runs off the event loop
+SCREENSHOT_ENCODE_WORKERS = 2
+SCREENSHOT_DEFAULT_QUALITY = 70  # jpeg/webp when quality is not given
+# v10.17.0: Perceptual dedupe for /screenshot?if_changed_since=<phash>
+SCREENSHOT_DHASH_SIZE = 16  # 16x16 = 256-bit difference hash (8x8 misses small UI changes)
+SCREENSHOT_UNCHANGED_DISTANCE = 0  # Default max Hamming distance still reported as unchanged
+# v10.18.0: Live CDP screencast defaults
+SCREENCAST_MAX_FPS = 10
+SCREENCAST_QUALITY = 60
+SCREENCAST_MAX_WIDTH = VIEWPORT_WIDTH
+SCREENCAST_MAX_HEIGHT = VIEWPORT_HEIGHT
+# v10.24.0: Console/network capture ring buffers + default capture policy
+CONSOLE_BUFFER_SIZE = 1000
+NETWORK_BUFFER_SIZE = 500
+DEFAULT_CAPTURE_POLICY: Dict[str, Any] = {
+    "console": True,
+    "console_types": None,    # None = all (log, warning, error, info, ...)
+    "network": True,
+    "resource_types": None,   # None = all (document, xhr, fetch, script, image, ...)
+    "capture_headers": True,
+    "sample_rate": 1.0,       # Fraction of network requests recorded
+}
+# v10.25.0: HAR recorder (opt-in per session, streamed to disk)
+HAR_DIR = Path.home() / ".architect-hand-har"
+HAR_MAX_BODY_BYTES = 64 * 1024   # Default cap per response body when include_bodies
+HAR_CONCURRENCY = 8              # Entries being assembled at once (sizes/body are CDP round trips)
+HAR_RETENTION_SECONDS = 24 * 3600  # Finished HAR files older than this are deleted
+HAR_MAX_FILES = 50                 # ...and only the newest this many are kept
+WRITER_QUEUE_SIZE = 10000        # Lines buffered per background writer before dropping
+WRITER_FLUSH_INTERVAL = 1.0      # seconds
+WRITER_FLUSH_BYTES = 64 * 1024   # ...or as soon as this much is pending
+# v10.26.0: browser_console.log sink, rotated like tool_server.log
+BROWSER_CONSOLE_LOG_MAX_BYTES = 5 * 1024 * 1024
+BROWSER_CONSOLE_LOG_BACKUPS = 3
+# v10.30.0: Request span traces (timings in responses; optional JSONL trace file)
+TRACE_FILE_PATH = Path.home() / ".tool_server_logs" / "spans.jsonl"
+TRACE_FILE_ENABLED = os.environ.get("TOOL_SERVER_TRACE_FILE", "").lower() in ("1", "true", "yes")
+TRACE_MAX_SPANS = 500  # Per request (a long /batch stops recording after this)
+# v10.19.0: Desktop backend for the desktop I/O worker: "pyautogui" (real) or "fake" (headless tests)
+DESKTOP_BACKEND = os.environ.get("TOOL_SERVER_DESKTOP_BACKEND", "pyautogui").lower()
 
 # ============================================================================
 # LOGGING
@@ -159,6 +248,7 @@ BROWSER_PROFILE_DIR = Path.home() / ".architect-hand-browser"
 # Log file path - accessibile per lettura esterna (es. Claude Code)
 LOG_FILE_PATH = Path.home() / ".tool_server_logs" / "tool_server.log"
 LOG_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
+LOG_FILE_BACKUPS = 3
 
 # Configure root logger with both console and file handlers
 logging.basicConfig(
@@ -172,17 +262,237 @@ logging.basicConfig(
         logging.handlers.RotatingFileHandler(
             LOG_FILE_PATH,
             maxBytes=5*1024*1024,  # 5 MB per file
-            backupCount=3,         # Mantieni 3 backup
+            backupCount=LOG_FILE_BACKUPS,  # Mantieni 3 backup
             encoding='utf-8'
         )
     ]
 )
+# v10.27.0: Il file ha anche la data, cosi' /logs/read puo' indicizzare e filtrare per intervallo
+for _handler in logging.getLogger().handlers:
+    if isinstance(_handler, logging.handlers.RotatingFileHandler):
+        _handler.setFormatter(logging.Formatter('[%(asctime)s.%(msecs)03d] [%(levelname)s] %(message)s',
+                                                datefmt='%Y-%m-%d %H:%M:%S'))
 logger = logging.getLogger(__name__)
 logging.getLogger("pyngrok").setLevel(logging.WARNING)
+# v10.23.0: httpx logs every request at INFO - the health poller alone would flood the log
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Browser console logs file - separato per chiarezza
 BROWSER_CONSOLE_LOG_PATH = Path.home() / ".tool_server_logs" / "browser_console.log"
 
+
+def ring_read(buffer: "deque[Dict[str, Any]]", seq: int, since: Optional[int], limit: int,
+              match=None) -> Tuple[List[Dict], int, int]:
+    """Read a ring buffer of entries carrying an increasing "seq" (v10.24.0).
+
+    since=None: the newest `limit` matching entries. since=N: matching entries
+    with seq > N, oldest first, so callers can page forward with the returned
+    cursor. Returns (entries, cursor, missed) where missed counts entries
+    evicted before the caller read them.
+    """
+    if since is None:
+        result: List[Dict] = []
+        for entry in reversed(buffer):
+            if match is None or match(entry):
+                result.append(entry)
+                if limit and len(result) >= limit:
+                    break
+        result.reverse()
+        return result, seq, 0
+
+    if since > seq:
+        since = 0  # v10.28.0: Cursor from before a restart - start over
+    oldest = buffer[0]["seq"] if buffer else since + 1
+    missed = max(0, oldest - since - 1)
+    # Scan back only as far as the cursor
+    pending: List[Dict] = []
+    for entry in reversed(buffer):
+        if entry["seq"] <= since:
+            break
+        pending.append(entry)
+    result = []
+    cursor = since
+    for entry in reversed(pending):
+        if limit and len(result) >= limit:
+            break
+        cursor = entry["seq"]
+        if match is None or match(entry):
+            result.append(entry)
+    if not limit or len(result) < limit:
+        cursor = max(cursor, seq)
+    return result, cursor, missed
+
+
+# v10.28.0: Live log stream - recent server/browser lines in memory for /logs/stream
+LOG_STREAM_BUFFER_SIZE = 2000
+LOG_STREAM_KEEPALIVE = 15.0  # seconds between SSE keep-alive comments
+
+
+class LogBroadcaster:
+    """
+    Ring buffer of recent log lines (server + browser console) with a seq
+    cursor. publish() may be called from any thread; /logs/stream readers
+    sleep on an asyncio.Event that is set on their own loop, then read
+    forward from their cursor with ring_read, so a slow reader only misses
+    what fell out of the buffer (reported as a gap) and never blocks logging.
+    """
+
+    def __init__(self, size: int = LOG_STREAM_BUFFER_SIZE):
+        self._buffer: "deque[Dict[str, Any]]" = deque(maxlen=size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._waiters: set = set()  # (loop, asyncio.Event)
+
+    def publish(self, source: str, level: str, text: str, ts: Optional[str] = None):
+        with self._lock:
+            self._seq += 1
+            self._buffer.append({
+                "seq": self._seq,
+                "source": source,
+                "level": level.upper(),
+                "ts": ts or datetime.now().isoformat(timespec="milliseconds"),
+                "text": text,
+            })
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # Loop closed
+
+    def read(self, since: Optional[int], limit: int = 500, match=None) -> Tuple[List[Dict], int, int]:
+        with self._lock:
+            return ring_read(self._buffer, self._seq, since, limit, match)
+
+    def register(self) -> Tuple[Any, asyncio.Event]:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        return waiter
+
+    def unregister(self, waiter: Tuple[Any, asyncio.Event]):
+        with self._lock:
+            self._waiters.discard(waiter)
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._waiters)
+
+
+class LogBroadcastHandler(logging.Handler):
+    """Feeds server log records to the LogBroadcaster (message only - level/ts are fields)"""
+
+    def __init__(self, broadcaster: LogBroadcaster):
+        super().__init__(level=logging.INFO)
+        self.broadcaster = broadcaster
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            text = record.getMessage()
+            if record.exc_info:
+                text += "\n" + logging.Formatter().formatException(record.exc_info)
+            ts = datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds")
+            self.broadcaster.publish("server", record.levelname, text, ts)
+        except Exception:
+            self.handleError(record)
+
+
+log_broadcaster = LogBroadcaster()
+logging.getLogger().addHandler(LogBroadcastHandler(log_broadcaster))
+
+# ============================================================================
+# v10.29.0: METRICS (Prometheus text format on GET /metrics)
+# ============================================================================
+
+metrics = MetricsRegistry()
+# Per-route requests/latency/in-flight come from MetricsMiddleware
+BROWSER_SESSIONS = metrics.gauge("tool_server_browser_sessions", "Open browser sessions")
+SNAPSHOT_SECONDS = metrics.histogram(
+    "tool_server_snapshot_extraction_seconds", "DOM snapshot extraction time", ["result"])
+SNAPSHOT_BYTES = metrics.histogram(
+    "tool_server_snapshot_bytes", "DOM snapshot text size", buckets=DEFAULT_SIZE_BUCKETS)
+SCREENSHOT_CAPTURE_SECONDS = metrics.histogram(
+    "tool_server_screenshot_capture_seconds", "Screenshot grab time", ["scope"])
+SCREENSHOT_ENCODE_SECONDS = metrics.histogram(
+    "tool_server_screenshot_encode_seconds", "Screenshot resize/encode time (0 on the Chromium fast path)", ["format"])
+SCREENSHOT_BYTES = metrics.histogram(
+    "tool_server_screenshot_bytes", "Encoded screenshot size", ["format"], buckets=DEFAULT_SIZE_BUCKETS)
+PROXY_UPSTREAM_SECONDS = metrics.histogram(
+    "tool_server_proxy_upstream_seconds", "Gateway proxy time to upstream response headers", ["service"])
+PROXY_UPSTREAM_ERRORS = metrics.counter(
+    "tool_server_proxy_upstream_errors_total", "Gateway proxy requests that failed", ["service"])
+NOTIFICATION_QUEUE_DEPTH = metrics.gauge(
+    "tool_server_notification_queue_depth", "Messages waiting in background senders/writers", ["queue"])
+LOG_STREAM_SUBSCRIBERS = metrics.gauge("tool_server_log_stream_subscribers", "Open /logs/stream readers")
+LOG_STREAM_SUBSCRIBERS.set_function(lambda: log_broadcaster.subscribers)
+
+# ============================================================================
+# v10.30.0: REQUEST SPANS
+# ============================================================================
+# TraceMiddleware opens a Trace per HTTP request in a contextvar; code on the
+# request path (and the tasks it spawns) times its phases with
+#     with span("action"): await page.mouse.click(x, y)
+# Phases: resolve, action, settle, screenshot (encode nested), snapshot, notify.
+# Outside a request span() is a no-op.
+
+class Trace:
+    """Spans of one HTTP request, shared by the tasks it spawns"""
+
+    def __init__(self, name: str):
+        self.id = secrets.token_hex(8)
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def add(self, name: str, start: float, end: float, attrs: Dict[str, Any]):
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            return
+        entry = {"name": name, "start_ms": round((start - self.start) * 1000, 1),
+                 "ms": round((end - start) * 1000, 1)}
+        if attrs:
+            entry["attrs"] = attrs
+        self.spans.append(entry)
+
+    def timings(self) -> Dict[str, float]:
+        """Total ms per phase (repeated phases add up) + request total so far"""
+        result: Dict[str, float] = {}
+        for entry in self.spans:
+            result[entry["name"]] = round(result.get(entry["name"], 0.0) + entry["ms"], 1)
+        result["total"] = round((time.perf_counter() - self.start) * 1000, 1)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"trace_id": self.id, "name": self.name, "started_at": self.started_at,
+                "ms": round((time.perf_counter() - self.start) * 1000, 1), "spans": self.spans}
+
+
+_current_trace: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("tool_server_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a phase of the current request (works around awaits)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), attrs)
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    """Phase timings of the current request, None outside a request or without spans"""
+    trace = _current_trace.get()
+    return trace.timings() if trace is not None and trace.spans else None
+
 # ============================================================================
 # DEPENDENCY CHECKS
 # ============================================================================
@@ -213,7 +523,7 @@ except ImportError:
     logger.warning("⚠️ PIL not available")
 
 try:
-    from playwright.async_api import async_playwright, BrowserContext, Page
+    from playwright.async_api import async_playwright, Browser, BrowserContext, Page
     PLAYWRIGHT_AVAILABLE = True
     logger.info("✅ Playwright available")
 except ImportError:
@@ -378,64 +688,190 @@ atexit.register(stop_claude_launcher)
 # Active session ID for Clawdbot messages (set when browser session starts)
 CLAWDBOT_ACTIVE_SESSION_ID: Optional[str] = None
 
-def send_clawdbot_message(text: str, msg_type: Literal["info", "success", "error"] = "info") -> bool:
-    """
-    Send a message to Claude Launcher's Clawdbot popup.
+# v10.20.0: Non-blocking dispatcher tuning
+CLAWDBOT_QUEUE_SIZE = 200           # Oldest messages dropped beyond this
+CLAWDBOT_COALESCE_MS = 150          # Burst window before a batch is sent
+CLAWDBOT_SESSION_TTL = 30.0         # s - discovered launcher session is re-checked after this
+CLAWDBOT_BREAKER_THRESHOLD = 3      # Consecutive failures that open the circuit
+CLAWDBOT_BREAKER_COOLDOWN = 30.0    # s - no attempts while open
 
+def _format_clawdbot_message(text: str, msg_type: str) -> str:
+    """
     Messages are formatted as:
     - [Clawdbot] text       -> info (→)
     - [Clawdbot OK] text    -> success (✓)
     - [Clawdbot ERROR] text -> error (✗)
+    """
+    if msg_type == "success":
+        return f"[Clawdbot OK] {text}"
+    elif msg_type == "error":
+        return f"[Clawdbot ERROR] {text}"
+    return f"[Clawdbot] {text}"
 
-    The Claude Launcher intercepts these and shows them in a dedicated popup.
+class ClawdbotNotifier:
+    """
+    Async queue in front of Claude Launcher's Clawdbot popup (v10.20.0).
+
+    - enqueue() never blocks: handlers fire and forget
+    - one background task sends with a pooled keep-alive httpx client
+    - bursts are coalesced: an info ("Clicking...") followed by a newer
+      message is dropped, duplicates collapse; success/error always go out
+    - launcher session discovery is cached for CLAWDBOT_SESSION_TTL
+    - circuit breaker: after CLAWDBOT_BREAKER_THRESHOLD failures the launcher
+      is considered down for CLAWDBOT_BREAKER_COOLDOWN and messages are dropped
     """
-    global CLAWDBOT_ACTIVE_SESSION_ID
 
-    if not CLAWDBOT_ACTIVE_SESSION_ID:
-        # Try to get active session from Claude Launcher
+    def __init__(self, port: int):
+        self.base_url = f"http://localhost:{port}/api"
+        self._queue: "deque[Tuple[str, str]]" = deque(maxlen=CLAWDBOT_QUEUE_SIZE)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._session_id: Optional[str] = None
+        self._session_checked = 0.0
+        self._failures = 0
+        self._open_until = 0.0
+        self.stats = {"enqueued": 0, "sent": 0, "coalesced": 0, "dropped": 0, "failed": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def circuit_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def enqueue(self, text: str, msg_type: str = "info") -> bool:
+        """Queue a message (call from the event loop thread). False if dropped."""
         try:
-            resp = requests.get(
-                f"http://localhost:{CLAUDE_LAUNCHER_PORT}/api/sessions",
-                timeout=2
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False  # No loop (CLI/startup code): nothing to deliver with
+        if self.circuit_open:
+            self.stats["dropped"] += 1
+            return False
+        if len(self._queue) == self._queue.maxlen:
+            self.stats["dropped"] += 1
+        self._queue.append((text, msg_type))
+        self.stats["enqueued"] += 1
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._wakeup.set()
+        return True
+
+    def _coalesce(self, batch: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        result: List[Tuple[str, str]] = []
+        for i, (text, msg_type) in enumerate(batch):
+            superseded = msg_type == "info" and i < len(batch) - 1
+            duplicate = result and result[-1] == (text, msg_type)
+            if superseded or duplicate:
+                self.stats["coalesced"] += 1
+                continue
+            result.append((text, msg_type))
+        return result
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await asyncio.sleep(CLAWDBOT_COALESCE_MS / 1000)
+            batch = list(self._queue)
+            self._queue.clear()
+            for text, msg_type in self._coalesce(batch):
+                if self.circuit_open:
+                    self.stats["dropped"] += 1
+                    continue
+                await self._send(_format_clawdbot_message(text, msg_type))
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(2.0, connect=0.5),
+                limits=httpx.Limits(max_connections=2, max_keepalive_connections=2),
             )
+        return self._client
+
+    async def _resolve_session(self) -> Optional[str]:
+        if CLAWDBOT_ACTIVE_SESSION_ID:
+            return CLAWDBOT_ACTIVE_SESSION_ID
+        now = time.monotonic()
+        if now - self._session_checked < CLAWDBOT_SESSION_TTL:
+            return self._session_id
+        self._session_id = None
+        resp = await self._http().get(f"{self.base_url}/sessions")  # Raises if the launcher is down
+        self._session_checked = now
+        if resp.status_code == 200:
+            for s in resp.json().get("sessions", []):
+                if s.get("status") == "ready":
+                    self._session_id = s.get("id")
+                    break
+        return self._session_id
+
+    async def _send(self, formatted: str):
+        try:
+            session_id = await self._resolve_session()
+            if not session_id:
+                logger.debug("No active Claude Launcher session for Clawdbot messages")
+                self.stats["dropped"] += 1
+                self._on_result(True)  # Launcher is up, just no session
+                return
+            resp = await self._http().post(f"{self.base_url}/sessions/{session_id}/message",
+                                           json={"message": formatted})
             if resp.status_code == 200:
-                sessions = resp.json().get("sessions", [])
-                # Find first active session
-                for s in sessions:
-                    if s.get("status") == "ready":
-                        CLAWDBOT_ACTIVE_SESSION_ID = s.get("id")
-                        break
+                logger.debug(f"Clawdbot message sent: {formatted[:50]}...")
+                self.stats["sent"] += 1
+                self._on_result(True)
+            else:
+                logger.warning(f"Clawdbot message failed: {resp.status_code}")
+                self.stats["failed"] += 1
+                if resp.status_code == 404:
+                    self._session_checked = 0.0  # Session gone: rediscover next time
+                self._on_result(resp.status_code < 500)
         except Exception as e:
-            logger.debug(f"Could not get active session: {e}")
-            return False
-
-    if not CLAWDBOT_ACTIVE_SESSION_ID:
-        logger.debug("No active Claude Launcher session for Clawdbot messages")
-        return False
+            logger.debug(f"Could not send Clawdbot message: {e}")
+            self.stats["failed"] += 1
+            self._on_result(False)
+
+    def _on_result(self, reachable: bool):
+        if reachable:
+            self._failures = 0
+            return
+        self._failures += 1
+        if self._failures >= CLAWDBOT_BREAKER_THRESHOLD:
+            self._open_until = time.monotonic() + CLAWDBOT_BREAKER_COOLDOWN
+            self._failures = 0
+            self._session_checked = 0.0
+            dropped = len(self._queue)
+            self._queue.clear()
+            self.stats["dropped"] += dropped
+            logger.info(f"🔌 Claude Launcher unreachable - Clawdbot messages paused for {CLAWDBOT_BREAKER_COOLDOWN:.0f}s")
+
+    def status(self) -> Dict[str, Any]:
+        return {**self.stats, "queue_depth": self.queue_depth, "circuit_open": self.circuit_open,
+                "session_id": CLAWDBOT_ACTIVE_SESSION_ID or self._session_id}
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+clawdbot_notifier = ClawdbotNotifier(CLAUDE_LAUNCHER_PORT)
+NOTIFICATION_QUEUE_DEPTH.labels("clawdbot").set_function(lambda: clawdbot_notifier.queue_depth)
 
-    # Format message based on type
-    if msg_type == "success":
-        formatted = f"[Clawdbot OK] {text}"
-    elif msg_type == "error":
-        formatted = f"[Clawdbot ERROR] {text}"
-    else:
-        formatted = f"[Clawdbot] {text}"
+def send_clawdbot_message(text: str, msg_type: Literal["info", "success", "error"] = "info") -> bool:
+    """
+    Send a message to Claude Launcher's Clawdbot popup.
+    The Claude Launcher intercepts these and shows them in a dedicated popup.
 
-    try:
-        resp = requests.post(
-            f"http://localhost:{CLAUDE_LAUNCHER_PORT}/api/sessions/{CLAWDBOT_ACTIVE_SESSION_ID}/message",
-            json={"message": formatted},
-            timeout=5
-        )
-        if resp.status_code == 200:
-            logger.debug(f"Clawdbot message sent: {formatted[:50]}...")
-            return True
-        else:
-            logger.warning(f"Clawdbot message failed: {resp.status_code}")
-            return False
-    except Exception as e:
-        logger.debug(f"Could not send Clawdbot message: {e}")
-        return False
+    v10.20.0: Only enqueues (never blocks the handler); delivery, coalescing
+    and retries are handled by clawdbot_notifier. Returns False if dropped.
+    """
+    with span("notify"):
+        return clawdbot_notifier.enqueue(text, msg_type)
 
 def set_clawdbot_session(session_id: str):
     """Set the active session ID for Clawdbot messages"""
@@ -643,11 +1079,46 @@ def parse_args():
 # PYDANTIC MODELS
 # ============================================================================
 
+# v10.13.0: What an action ships back as DOM snapshot
+#   none - no snapshot at all
+#   lazy - no extraction, only a generation token for /browser/snapshot?since=<token>
+#   diff - changes since snapshot_since (or since the last snapshot delivered)
+#   full - complete text snapshot
+SnapshotPolicy = Literal["none", "lazy", "diff", "full"]
+
+# v10.15.0: Screenshot encoding options
+class ScreenshotClip(BaseModel):
+    """Region to capture, in viewport (browser) or screen (desktop) pixels"""
+    x: float
+    y: float
+    width: float
+    height: float
+
+class ScreenshotOptions(BaseModel):
+    format: Literal["png", "jpeg", "webp"] = "png"
+    quality: Optional[int] = None  # 1-100, jpeg/webp only (default SCREENSHOT_DEFAULT_QUALITY)
+    scale: Optional[float] = None  # Downscale factor, e.g. 0.5
+    max_width: Optional[int] = None  # Downscale to at most this width (aspect preserved)
+    clip: Optional[ScreenshotClip] = None
+    full_page: bool = False  # Browser only
+
 class ScreenshotRequest(BaseModel):
     scope: Literal["browser", "desktop"] = "browser"
     session_id: Optional[str] = None
     include_lux_metadata: bool = True
+    # Deprecated (use max_width/scale): = max_width GEMINI_RECOMMENDED_WIDTH, which only
+    # shrinks desktop captures - the browser viewport is already narrower
     include_gemini_resize: bool = False
+    # v10.17.0: Skip the image if the frame still matches this phash (from a previous response)
+    if_changed_since: Optional[str] = None
+    change_threshold: int = SCREENSHOT_UNCHANGED_DISTANCE  # Max Hamming distance treated as unchanged
+    # v10.15.0: Encoding options (see ScreenshotOptions)
+    format: Literal["png", "jpeg", "webp"] = "png"
+    quality: Optional[int] = None
+    scale: Optional[float] = None
+    max_width: Optional[int] = None
+    clip: Optional[ScreenshotClip] = None
+    full_page: bool = False
 
 class ClickRequest(BaseModel):
     scope: Literal["browser", "desktop"] = "browser"
@@ -657,7 +1128,10 @@ class ClickRequest(BaseModel):
     click_type: Literal["single", "double", "right", "triple"] = "single"
     session_id: Optional[str] = None
     include_screenshot: bool = False  # v9.0.0: Auto-screenshot after action
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
     include_snapshot: bool = False  # v10.1.0: Auto-snapshot DOM after action
+    snapshot_since: Optional[int] = None  # v10.8.0: Return diff vs this snapshot generation
+    snapshot: Optional[SnapshotPolicy] = None  # v10.13.0: None = session default policy
 
 class TypeRequest(BaseModel):
     scope: Literal["browser", "desktop"] = "browser"
@@ -666,7 +1140,10 @@ class TypeRequest(BaseModel):
     session_id: Optional[str] = None
     selector: Optional[str] = None
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
     include_snapshot: bool = False  # v10.1.0: Auto-snapshot DOM after action
+    snapshot_since: Optional[int] = None  # v10.8.0: Return diff vs this snapshot generation
+    snapshot: Optional[SnapshotPolicy] = None  # v10.13.0: None = session default policy
 
 class ScrollRequest(BaseModel):
     scope: Literal["browser", "desktop"] = "browser"
@@ -674,14 +1151,20 @@ class ScrollRequest(BaseModel):
     amount: int = 300
     session_id: Optional[str] = None
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
     include_snapshot: bool = False  # v10.1.0: Auto-snapshot DOM after action
+    snapshot_since: Optional[int] = None  # v10.8.0: Return diff vs this snapshot generation
+    snapshot: Optional[SnapshotPolicy] = None  # v10.13.0: None = session default policy
 
 class KeypressRequest(BaseModel):
     scope: Literal["browser", "desktop"] = "browser"
     key: str
     session_id: Optional[str] = None
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
     include_snapshot: bool = False  # v10.1.0: Auto-snapshot DOM after action
+    snapshot_since: Optional[int] = None  # v10.8.0: Return diff vs this snapshot generation
+    snapshot: Optional[SnapshotPolicy] = None  # v10.13.0: None = session default policy
 
 # v9.0.0: New actions for Claude Computer Use compatibility
 class HoldKeyRequest(BaseModel):
@@ -690,10 +1173,12 @@ class HoldKeyRequest(BaseModel):
     duration: float = 1.0  # seconds
     session_id: Optional[str] = None
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
 
 class WaitRequest(BaseModel):
     duration: float = 1.0  # seconds
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
     session_id: Optional[str] = None  # For browser screenshot after wait
 
 # v10.3.0: Auto-pairing models
@@ -715,10 +1200,13 @@ class PairingStatusResponse(BaseModel):
 class ClickByRefRequest(BaseModel):
     """Click element by ref ID from accessibility snapshot"""
     session_id: str
-    ref: str  # e.g., "e3", "e15"
+    ref: str  # e.g., "e3f9a1c" (stable across snapshots since v10.9.0)
     click_type: Literal["single", "double", "right", "triple"] = "single"
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
     include_snapshot: bool = False  # v10.1.0: Auto-snapshot DOM after action
+    snapshot_since: Optional[int] = None  # v10.8.0: Return diff vs this snapshot generation
+    snapshot: Optional[SnapshotPolicy] = None  # v10.13.0: None = session default policy
 
 class HoverRequest(BaseModel):
     """Hover over element"""
@@ -729,6 +1217,7 @@ class HoverRequest(BaseModel):
     ref: Optional[str] = None  # Alternative: hover by ref
     selector: Optional[str] = None  # Alternative: hover by selector
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
 
 class DragRequest(BaseModel):
     """Drag from one position to another"""
@@ -740,6 +1229,7 @@ class DragRequest(BaseModel):
     end_y: int
     coordinate_origin: Literal["viewport", "screen", "lux_sdk", "normalized"] = "viewport"
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
 
 class SelectOptionRequest(BaseModel):
     """Select option from dropdown"""
@@ -750,6 +1240,7 @@ class SelectOptionRequest(BaseModel):
     label: Optional[str] = None  # Select by visible text
     index: Optional[int] = None  # Select by index
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
 
 class FileUploadRequest(BaseModel):
     """Upload file to input element"""
@@ -758,6 +1249,7 @@ class FileUploadRequest(BaseModel):
     ref: Optional[str] = None
     file_path: str  # Local path to file
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
 
 class WaitForSelectorRequest(BaseModel):
     """Wait for element to appear/disappear"""
@@ -766,6 +1258,7 @@ class WaitForSelectorRequest(BaseModel):
     state: Literal["attached", "detached", "visible", "hidden"] = "visible"
     timeout: int = 30000  # ms
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
 
 class WaitForLoadStateRequest(BaseModel):
     """Wait for page load state"""
@@ -773,10 +1266,58 @@ class WaitForLoadStateRequest(BaseModel):
     state: Literal["load", "domcontentloaded", "networkidle"] = "load"
     timeout: int = 30000  # ms
     include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
+
+# v10.11.0: Adaptive settle endpoints
+class WaitForStableRequest(BaseModel):
+    """Wait until the page is stable (no requests in flight + DOM quiet)"""
+    session_id: str
+    quiet_ms: int = 200  # DOM mutation-free window
+    network: bool = True  # Also require network idle
+    timeout: int = 5000  # ms
+    include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
+
+class WaitForNetworkIdleRequest(BaseModel):
+    """Wait until no request has been in flight for idle_ms"""
+    session_id: str
+    idle_ms: int = 500
+    timeout: int = 10000  # ms
+    include_screenshot: bool = False
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
 
 class BrowserStartRequest(BaseModel):
     start_url: Optional[str] = None
     headless: bool = False
+    snapshot_policy: SnapshotPolicy = "full"  # v10.13.0: Session default for actions
+    backend: Optional[Literal["persistent", "shared", "auto"]] = None  # v10.31.0: None = SESSION_BACKEND
+
+class SnapshotPolicyRequest(BaseModel):
+    """Change the session default snapshot policy (v10.13.0)"""
+    session_id: str
+    policy: SnapshotPolicy
+
+# v10.14.0: Batched actions - N steps in one round trip, one final capture
+BatchAction = Literal["click", "type", "scroll", "keypress", "hold_key", "wait", "click_by_ref",
+                      "hover", "drag", "select_option", "file_upload", "wait_for_selector",
+                      "wait_for_load_state", "wait_for_stable", "wait_for_network_idle"]
+
+class BatchStep(BaseModel):
+    """One step of /batch: params are the fields of the matching request model"""
+    action: BatchAction
+    params: Dict[str, Any] = {}
+    wait_after_ms: int = 0  # Fixed pause after the step
+    settle_after: bool = False  # Adaptive settle (network idle + DOM quiet) after the step
+
+class BatchRequest(BaseModel):
+    """Run steps in order against one browser session"""
+    session_id: str
+    steps: List[BatchStep]
+    stop_on_error: bool = True
+    include_screenshot: bool = True  # Final screenshot after the last step
+    screenshot_options: Optional[ScreenshotOptions] = None  # v10.15.0: format/quality/scale/clip
+    snapshot_since: Optional[int] = None  # Final snapshot as diff vs this generation
+    snapshot: Optional[SnapshotPolicy] = None  # Final snapshot policy, None = session default
 
 class NavigateRequest(BaseModel):
     session_id: str
@@ -816,12 +1357,23 @@ class TracingStopRequest(BaseModel):
     session_id: str
     output_path: Optional[str] = None  # Where to save trace, defaults to temp
 
+class HarStartRequest(BaseModel):
+    """v10.25.0: Start HAR recording for a session"""
+    session_id: str
+    include_bodies: bool = False
+    max_body_bytes: int = HAR_MAX_BODY_BYTES  # Per body, when include_bodies
+    resource_types: Optional[List[str]] = None  # None = all
+
+class HarStopRequest(BaseModel):
+    session_id: str
+
 class ConsoleRequest(BaseModel):
     """Get console messages from session"""
     session_id: str
     types: Optional[List[str]] = None  # Filter by type: log, warning, error, info
     limit: int = 100  # Max messages to return
     clear: bool = False  # Clear messages after returning
+    since: Optional[int] = None  # v10.24.0: Cursor - only messages after this seq (oldest first)
 
 class NetworkRequest(BaseModel):
     """Get network requests from session"""
@@ -830,6 +1382,18 @@ class NetworkRequest(BaseModel):
     status_filter: Optional[str] = None  # success, error, or status code range (e.g., "4xx", "5xx")
     limit: int = 100
     clear: bool = False
+    since: Optional[int] = None  # v10.24.0: Cursor - only requests started after this seq (oldest first)
+
+class CapturePolicyRequest(BaseModel):
+    """Per-session console/network capture policy (v10.24.0); omitted fields keep their value"""
+    session_id: str
+    console: Optional[bool] = None
+    console_types: Optional[List[str]] = None
+    network: Optional[bool] = None
+    resource_types: Optional[List[str]] = None
+    capture_headers: Optional[bool] = None
+    sample_rate: Optional[float] = None
+    reset: bool = False  # Back to DEFAULT_CAPTURE_POLICY first
 
 class VerifyElementRequest(BaseModel):
     """Verify element visibility/presence"""
@@ -880,6 +1444,25 @@ class ActionResponse(BaseModel):
     snapshot_url: Optional[str] = None
     snapshot_title: Optional[str] = None
     snapshot_ref_count: Optional[int] = None
+    # v10.8.0: Versioned snapshots (diff instead of full text when snapshot_since is known)
+    snapshot_generation: Optional[int] = None
+    snapshot_diff: Optional[Dict[str, Any]] = None
+    # v10.13.0: Snapshot policy applied; lazy -> fetch later via /browser/snapshot?since=snapshot_generation
+    snapshot_policy: Optional[str] = None
+    # v10.12.0: Post-action capture phase timings in ms (settle, screenshot, snapshot, capture)
+    # v10.30.0: + request spans (resolve, action, encode, notify, total) - see span()
+    timings: Optional[Dict[str, float]] = None
+    # v10.15.0: Encoded screenshot info (screenshot_width/height are the image pixels)
+    screenshot_media_type: Optional[str] = None
+    screenshot_bytes: Optional[int] = None
+    # v10.16.0: Captured image, base64-encoded only if the client negotiates JSON
+    _image: Any = PrivateAttr(default=None)
+
+class BatchResponse(ActionResponse):
+    """/batch result: per-step results + final capture in the inherited fields"""
+    results: List[ActionResponse] = []
+    completed: int = 0  # Steps executed (successful or not)
+    failed_step: Optional[int] = None  # Index of the first failed step
 
 class ScreenshotResponse(BaseModel):
     success: bool
@@ -889,6 +1472,20 @@ class ScreenshotResponse(BaseModel):
     height: Optional[int] = None
     lux_scale_x: Optional[float] = None
     lux_scale_y: Optional[float] = None
+    # v10.15.0: Encoding pipeline info
+    media_type: Optional[str] = None
+    bytes: Optional[int] = None  # Encoded size (before base64)
+    source_width: Optional[int] = None  # Captured region before downscale
+    source_height: Optional[int] = None
+    image_scale_x: Optional[float] = None  # Image pixels -> source pixels (1.0 unless downscaled)
+    image_scale_y: Optional[float] = None
+    timings: Optional[Dict[str, float]] = None  # capture, encode (ms)
+    # v10.17.0: Perceptual hash of this frame; unchanged=True -> no image, reuse the previous one
+    phash: Optional[str] = None
+    unchanged: Optional[bool] = None
+    distance: Optional[int] = None  # Hamming distance vs if_changed_since
+    # v10.16.0: Captured image, base64-encoded only if the client negotiates JSON
+    _image: Any = PrivateAttr(default=None)
 
 class ElementRectResponse(BaseModel):
     success: bool
@@ -940,71 +1537,1401 @@ class CoordinateConverter:
 # UTILITIES
 # ============================================================================
 
-def resize_image(image_bytes: bytes, tw: int, th: int) -> Tuple[str, int, int]:
-    img = Image.open(io.BytesIO(image_bytes))
-    resized = img.resize((tw, th), Image.Resampling.LANCZOS)
-    buffer = io.BytesIO()
-    resized.save(buffer, format='PNG')
-    return base64.b64encode(buffer.getvalue()).decode('utf-8'), tw, th
+# ============================================================================
+# v10.19.0: DESKTOP I/O WORKER
+# ============================================================================
+# pyautogui/pyperclip calls block for tens to hundreds of ms. They all run on
+# one dedicated thread (input must stay ordered anyway) and handlers await
+# the result, so browser requests keep flowing meanwhile.
 
-def type_via_clipboard(text: str):
-    if PYPERCLIP_AVAILABLE:
-        try:
-            old = pyperclip.paste()
-        except:
-            old = ""
-        pyperclip.copy(text)
-        pyautogui.hotkey('ctrl', 'v')
-        time.sleep(0.1)
-        try:
-            pyperclip.copy(old)
-        except:
-            pass
+class DesktopBackend:
+    """Real desktop via pyautogui/pyperclip. Only called from the DesktopWorker thread."""
+    name = "pyautogui"
+
+    @property
+    def available(self) -> bool:
+        return PYAUTOGUI_AVAILABLE
+
+    def size(self) -> Tuple[int, int]:
+        sw, sh = pyautogui.size()
+        return sw, sh
+
+    def click(self, x: int, y: int, click_type: str = "single"):
+        if click_type == "double":
+            pyautogui.doubleClick(x, y)
+        elif click_type == "triple":
+            pyautogui.tripleClick(x, y)
+        elif click_type == "right":
+            pyautogui.rightClick(x, y)
+        else:
+            pyautogui.click(x, y)
+
+    def type_text(self, text: str, method: str = "clipboard"):
+        if method == "clipboard" and PYPERCLIP_AVAILABLE:
+            try:
+                old = pyperclip.paste()
+            except:
+                old = ""
+            pyperclip.copy(text)
+            pyautogui.hotkey('ctrl', 'v')
+            time.sleep(0.1)
+            try:
+                pyperclip.copy(old)
+            except:
+                pass
+        elif method == "clipboard":
+            pyautogui.typewrite(text, interval=0.05)
+        else:
+            pyautogui.typewrite(text)
+
+    def scroll(self, clicks: int):
+        pyautogui.scroll(clicks)
+
+    def press(self, key: str):
+        """Single key or combo like 'ctrl+c'"""
+        if "+" in key:
+            pyautogui.hotkey(*key.split("+"))
+        else:
+            pyautogui.press(key)
+
+    def key_down(self, key: str):
+        pyautogui.keyDown(key)
+
+    def key_up(self, key: str):
+        pyautogui.keyUp(key)
+
+    def move_to(self, x: int, y: int):
+        pyautogui.moveTo(x, y)
+
+    def drag(self, start_x: int, start_y: int, end_x: int, end_y: int, duration: float = 0.5):
+        pyautogui.moveTo(start_x, start_y)
+        pyautogui.drag(end_x - start_x, end_y - start_y, duration=duration)
+
+    def screenshot(self):
+        return pyautogui.screenshot()
+
+class FakeDesktopBackend(DesktopBackend):
+    """Headless stand-in (TOOL_SERVER_DESKTOP_BACKEND=fake): records calls, blank screen"""
+    name = "fake"
+
+    def __init__(self, width: int = 1920, height: int = 1080):
+        self.width = width
+        self.height = height
+        self.calls: List[Tuple[str, tuple]] = []
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def _record(self, name: str, *args):
+        self.calls.append((name, args))
+        if len(self.calls) > 1000:
+            self.calls = self.calls[-500:]
+
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def click(self, x: int, y: int, click_type: str = "single"):
+        self._record("click", x, y, click_type)
+
+    def type_text(self, text: str, method: str = "clipboard"):
+        self._record("type_text", text, method)
+
+    def scroll(self, clicks: int):
+        self._record("scroll", clicks)
+
+    def press(self, key: str):
+        self._record("press", key)
+
+    def key_down(self, key: str):
+        self._record("key_down", key)
+
+    def key_up(self, key: str):
+        self._record("key_up", key)
+
+    def move_to(self, x: int, y: int):
+        self._record("move_to", x, y)
+
+    def drag(self, start_x: int, start_y: int, end_x: int, end_y: int, duration: float = 0.5):
+        self._record("drag", start_x, start_y, end_x, end_y, duration)
+
+    def screenshot(self):
+        self._record("screenshot")
+        if not PIL_AVAILABLE:
+            raise RuntimeError("PIL not available")
+        return Image.new("RGB", (self.width, self.height), "white")
+
+class DesktopWorker:
+    """
+    Single thread with a command queue that owns the desktop backend.
+    await desktop.run("click", x, y) runs backend.click on the worker thread;
+    run() also accepts a plain callable (e.g. desktop screenshot encoding).
+    """
+
+    def __init__(self, backend: DesktopBackend):
+        self.backend = backend
+        self._commands: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self.backend.available
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="desktop-worker", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            command = self._commands.get()
+            if command is None:
+                break
+            func, args, kwargs, loop, future = command
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                loop.call_soon_threadsafe(self._resolve, future, None, e)
+            else:
+                loop.call_soon_threadsafe(self._resolve, future, result, None)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def run(self, op: Any, *args, **kwargs) -> Any:
+        """Run a backend method (by name) or a callable on the worker thread"""
+        func = getattr(self.backend, op) if isinstance(op, str) else op
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._commands.put((func, args, kwargs, loop, future))
+        return await future
+
+    def stop(self):
+        if self._thread and self._thread.is_alive():
+            self._commands.put(None)
+
+desktop = DesktopWorker(FakeDesktopBackend() if DESKTOP_BACKEND == "fake" else DesktopBackend())
+
+# ============================================================================
+# v10.15.0: SCREENSHOT ENCODING PIPELINE
+# ============================================================================
+# Chromium encodes PNG/JPEG natively; PIL is only involved for downscaling,
+# WebP and desktop grabs. PIL work runs in a small dedicated thread pool so a
+# big full-page encode never blocks the event loop (and at most
+# SCREENSHOT_ENCODE_WORKERS encodes run at once).
+
+_screenshot_executor = ThreadPoolExecutor(max_workers=SCREENSHOT_ENCODE_WORKERS,
+                                          thread_name_prefix="screenshot-encode")
+
+SCREENSHOT_MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+class CapturedImage:
+    """Encoded screenshot plus the metadata needed to map image pixels back to the page"""
+
+    def __init__(self, data: bytes, fmt: str, width: int, height: int,
+                 source_width: int, source_height: int, capture_ms: float, encode_ms: float):
+        self.data = data
+        self.format = fmt
+        self.media_type = SCREENSHOT_MEDIA_TYPES[fmt]
+        self.width = width  # Encoded image pixels
+        self.height = height
+        self.source_width = source_width  # Captured region (viewport/screen pixels)
+        self.source_height = source_height
+        self.capture_ms = capture_ms
+        self.encode_ms = encode_ms
+
+    @property
+    def scale_x(self) -> float:
+        """Multiply image x coordinates by this to get page/screen coordinates"""
+        return self.source_width / self.width if self.width else 1.0
+
+    @property
+    def scale_y(self) -> float:
+        return self.source_height / self.height if self.height else 1.0
+
+    def b64(self) -> str:
+        return base64.b64encode(self.data).decode()
+
+def _screenshot_target_size(width: int, height: int, opts: 'ScreenshotOptions') -> Tuple[int, int]:
+    """Output size after scale/max_width (never upscales)"""
+    factor = min(opts.scale, 1.0) if opts.scale and opts.scale > 0 else 1.0
+    if opts.max_width and width * factor > opts.max_width:
+        factor = opts.max_width / width
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+def _encode_screenshot(source: Any, opts: 'ScreenshotOptions') -> Tuple[bytes, int, int, int, int]:
+    """
+    Resize + encode (runs in _screenshot_executor).
+    source: encoded image bytes or a PIL Image. Returns (data, w, h, source_w, source_h).
+    """
+    img = source if isinstance(source, Image.Image) else Image.open(io.BytesIO(source))
+    if opts.clip and isinstance(source, Image.Image):
+        c = opts.clip
+        img = img.crop((int(c.x), int(c.y), int(c.x + c.width), int(c.y + c.height)))
+    sw, sh = img.size
+    tw, th = _screenshot_target_size(sw, sh, opts)
+    if (tw, th) != (sw, sh):
+        img = img.resize((tw, th), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    if opts.format == "png":
+        img.save(buf, format="PNG")
     else:
-        pyautogui.typewrite(text, interval=0.05)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        quality = max(1, min(100, opts.quality or SCREENSHOT_DEFAULT_QUALITY))
+        img.save(buf, format=opts.format.upper(), quality=quality)
+    return buf.getvalue(), tw, th, sw, sh
+
+def compute_dhash(data: bytes, size: int = SCREENSHOT_DHASH_SIZE) -> str:
+    """Difference hash (sign of horizontal gradients on a size+1 x size thumbnail) as hex"""
+    img = Image.open(io.BytesIO(data))
+    img.draft("L", ((size + 1) * 8, size * 8))  # JPEG: decode at reduced scale
+    pixels = list(img.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        base = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[base + col] > pixels[base + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+def dhash_distance(a: str, b: str) -> Optional[int]:
+    """Hamming distance between two hashes, None if not comparable"""
+    if len(a) != len(b):
+        return None
+    try:
+        return bin(int(a, 16) ^ int(b, 16)).count("1")
+    except ValueError:
+        return None
+
+def _observe_screenshot(scope: str, fmt: str, capture_ms: float, encode_ms: float, size: int):
+    """v10.29.0: Screenshot metrics"""
+    SCREENSHOT_CAPTURE_SECONDS.labels(scope).observe(capture_ms / 1000)
+    SCREENSHOT_ENCODE_SECONDS.labels(fmt).observe(encode_ms / 1000)
+    SCREENSHOT_BYTES.labels(fmt).observe(size)
+
+async def capture_screenshot(session: Optional['BrowserSession'], scope: str = "browser",
+                             opts: Optional['ScreenshotOptions'] = None) -> CapturedImage:
+    """Capture + encode a screenshot according to opts (raises on failure)"""
+    opts = opts or ScreenshotOptions()
+    with span("screenshot"):
+        return await _capture_screenshot(session, scope, opts)
+
+async def _capture_screenshot(session: Optional['BrowserSession'], scope: str, opts: 'ScreenshotOptions') -> CapturedImage:
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+
+    if scope == "browser":
+        if not session or not session.is_alive():
+            raise RuntimeError("No active browser session")
+        kwargs: Dict[str, Any] = {}
+        if opts.clip:
+            kwargs["clip"] = {"x": opts.clip.x, "y": opts.clip.y,
+                              "width": opts.clip.width, "height": opts.clip.height}
+        if opts.full_page:
+            kwargs["full_page"] = True
+        resize = bool(opts.scale or opts.max_width)
+        if not resize and opts.format in ("png", "jpeg"):
+            # Fast path: Chromium encodes, no PIL round trip
+            if opts.format == "jpeg":
+                kwargs["quality"] = max(1, min(100, opts.quality or SCREENSHOT_DEFAULT_QUALITY))
+            data = await session.page.screenshot(type=opts.format, **kwargs)
+            capture_ms = round((time.monotonic() - start) * 1000, 1)
+            if opts.clip:
+                w, h = int(opts.clip.width), int(opts.clip.height)
+            elif opts.full_page and PIL_AVAILABLE:
+                w, h = Image.open(io.BytesIO(data)).size  # Header only, no decode
+            else:
+                w, h = await session.get_viewport_size()
+            _observe_screenshot(scope, opts.format, capture_ms, 0.0, len(data))
+            return CapturedImage(data, opts.format, w, h, w, h, capture_ms, 0.0)
+        if not PIL_AVAILABLE:
+            raise RuntimeError("PIL not available: scale/max_width/webp need Pillow")
+        source = await session.page.screenshot(type="png", **kwargs)
+    elif scope == "desktop" and desktop.available:
+        # v10.19.0: Grab + encode on the desktop worker thread
+        source = await desktop.run("screenshot")
+    else:
+        raise RuntimeError("Invalid scope or PyAutoGUI not available")
+
+    capture_ms = round((time.monotonic() - start) * 1000, 1)
+    t = time.monotonic()
+    with span("encode"):
+        if scope == "desktop":
+            data, w, h, sw, sh = await desktop.run(_encode_screenshot, source, opts)
+        else:
+            data, w, h, sw, sh = await loop.run_in_executor(_screenshot_executor, _encode_screenshot, source, opts)
+    encode_ms = round((time.monotonic() - t) * 1000, 1)
+    _observe_screenshot(scope, opts.format, capture_ms, encode_ms, len(data))
+    return CapturedImage(data, opts.format, w, h, sw, sh, capture_ms, encode_ms)
 
 # v9.0.0: Auto-screenshot helper
-async def take_auto_screenshot(session: Optional['BrowserSession'] = None, scope: str = "browser") -> Tuple[Optional[str], Optional[int], Optional[int]]:
-    """Take a screenshot and return (base64, width, height)"""
+async def take_auto_screenshot(session: Optional['BrowserSession'] = None, scope: str = "browser",
+                               settle: bool = True,
+                               opts: Optional['ScreenshotOptions'] = None) -> Optional[CapturedImage]:
+    """Take a screenshot after an action; None on failure (v10.15.0: returns CapturedImage)"""
     try:
         if scope == "browser" and session and session.is_alive():
-            # Small delay to let UI update
-            await asyncio.sleep(0.3)
-            data = await session.page.screenshot(type="png")
-            vp = await session.page.evaluate("() => ({w: window.innerWidth, h: window.innerHeight})")
-            return base64.b64encode(data).decode(), vp['w'], vp['h']
-        elif scope == "desktop" and PYAUTOGUI_AVAILABLE:
-            await asyncio.sleep(0.3)
-            shot = pyautogui.screenshot()
-            buf = io.BytesIO()
-            shot.save(buf, format='PNG')
-            sw, sh = pyautogui.size()
-            return base64.b64encode(buf.getvalue()).decode(), sw, sh
+            # v10.11.0: Wait for the page to settle instead of a fixed delay
+            if settle:
+                await session.wait_for_stable()
+            return await capture_screenshot(session, "browser", opts)
+        elif scope == "desktop" and desktop.available:
+            if settle:
+                await asyncio.sleep(0.3)
+            return await capture_screenshot(None, "desktop", opts)
     except Exception as e:
         logger.warning(f"⚠️ Auto-screenshot failed: {e}")
-    return None, None, None
+    return None
 
 # v10.1.0: Auto-snapshot helper for DOM structure after actions
-async def take_auto_snapshot(session: Optional['BrowserSession'] = None) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[int]]:
+async def take_auto_snapshot(session: Optional['BrowserSession'] = None, since: Optional[int] = None,
+                             settle: bool = True) -> Dict[str, Any]:
     """
-    Take a DOM snapshot and return (text_snapshot, url, title, ref_count).
+    Take a DOM snapshot and return the snapshot_* fields of ActionResponse.
     Returns the text representation of interactive elements for agent consumption.
+
+    v10.8.0: every snapshot carries a generation id. When `since` is a generation
+    still held by the session (and the page did not navigate), only the diff is
+    returned in snapshot_diff and snapshot is left empty.
     """
     try:
         if session and session.is_alive():
-            # Small delay to let UI update after action
-            await asyncio.sleep(0.3)
+            # v10.11.0: Wait for the page to settle instead of a fixed delay
+            if settle:
+                await session.wait_for_stable()
             tree = await session.get_accessibility_tree(include_refs=True)
             if tree and 'text_snapshot' in tree:
-                return (
-                    tree.get('text_snapshot', ''),
-                    tree.get('url', ''),
-                    tree.get('title', ''),
-                    tree.get('ref_count', 0)
-                )
+                generation = tree.get('generation')
+                diff = session.diff_snapshot(since, generation) if since is not None else None
+                session.last_delivered_generation = generation
+                return {
+                    "snapshot": None if diff is not None else tree.get('text_snapshot', ''),
+                    "snapshot_url": tree.get('url', ''),
+                    "snapshot_title": tree.get('title', ''),
+                    "snapshot_ref_count": tree.get('ref_count', 0),
+                    "snapshot_generation": generation,
+                    "snapshot_diff": diff,
+                }
     except Exception as e:
         logger.warning(f"⚠️ Auto-snapshot failed: {e}")
-    return None, None, None, None
+    return {}
+
+def apply_snapshot(response: 'ActionResponse', snap: Dict[str, Any]) -> None:
+    """Copy take_auto_snapshot() fields onto an ActionResponse"""
+    for key, value in snap.items():
+        setattr(response, key, value)
+
+# v10.12.0: Shared post-action capture stage for all action endpoints
+async def capture_after_action(response: 'ActionResponse', session: Optional['BrowserSession'] = None,
+                               scope: str = "browser", include_screenshot: bool = False,
+                               include_snapshot: bool = True, snapshot_since: Optional[int] = None,
+                               snapshot_policy: Optional[str] = None,
+                               screenshot_options: Optional['ScreenshotOptions'] = None) -> 'ActionResponse':
+    """
+    Settle once, then capture screenshot and DOM snapshot concurrently.
+    Per-phase durations (ms) are reported in response.timings.
+
+    v10.13.0: snapshot_policy (or the session default) decides whether the
+    snapshot is skipped (none), deferred (lazy), diffed (diff) or full.
+    """
+    browser = scope == "browser" and session is not None and session.is_alive()
+    include_snapshot = include_snapshot and browser
+    if include_snapshot:
+        policy = snapshot_policy or session.snapshot_policy
+        # v10.8.0 compatibility: snapshot_since without an explicit policy means diff
+        if snapshot_policy is None and snapshot_since is not None and policy == "full":
+            policy = "diff"
+        response.snapshot_policy = policy
+        if policy == "diff" and snapshot_since is None:
+            snapshot_since = session.last_delivered_generation
+        elif policy == "full":
+            snapshot_since = None
+        elif policy == "lazy":
+            # Token = latest generation known; the client diffs against it later
+            response.snapshot_generation = session.snapshot_generation
+            include_snapshot = False
+        elif policy == "none":
+            include_snapshot = False
+    if not include_screenshot and not include_snapshot:
+        return response
+
+    timings: Dict[str, float] = {}
+    start = time.monotonic()
+
+    async def timed(name: str, coro):
+        t = time.monotonic()
+        result = await coro
+        timings[name] = round((time.monotonic() - t) * 1000, 1)
+        return result
+
+    if browser:
+        await timed("settle", session.wait_for_stable())
+
+    jobs = []
+    if include_screenshot:
+        # Desktop has no settle engine: take_auto_screenshot keeps its own delay
+        jobs.append(timed("screenshot", take_auto_screenshot(session, scope, settle=not browser,
+                                                             opts=screenshot_options)))
+    if include_snapshot:
+        jobs.append(timed("snapshot", take_auto_snapshot(session, snapshot_since, settle=False)))
+    results = await asyncio.gather(*jobs)
+
+    if include_screenshot and results[0] is not None:
+        shot = results[0]
+        response._image = shot  # v10.16.0: base64 deferred to negotiate_response()
+        response.screenshot_width = shot.width
+        response.screenshot_height = shot.height
+        response.screenshot_media_type = shot.media_type
+        response.screenshot_bytes = len(shot.data)
+        timings["encode"] = shot.encode_ms
+    if include_snapshot:
+        apply_snapshot(response, results[-1])
+
+    timings["capture"] = round((time.monotonic() - start) * 1000, 1)
+    response.timings = timings
+    return response
+
+# ============================================================================
+# v10.16.0: SCREENSHOT TRANSPORT (content negotiation)
+# ============================================================================
+# Accept: application/json (default) -> JSON with base64 image, as before
+# Accept: image/*                    -> raw image body, metadata in X- headers
+# Accept: multipart/mixed            -> JSON part (no base64) + image part
+# Binary forms only apply when a screenshot was actually captured.
+
+def _preferred_transport(accept: str) -> str:
+    """'json', 'image' or 'multipart' from an Accept header (highest q wins, first listed on ties)"""
+    best, best_q = "json", 0.0
+    for part in accept.split(","):
+        fields = part.strip().split(";")
+        media = fields[0].strip().lower()
+        q = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media.startswith("image/"):
+            kind = "image"
+        elif media == "multipart/mixed":
+            kind = "multipart"
+        elif media in ("application/json", "application/*", "*/*"):
+            kind = "json"
+        else:
+            continue
+        if q > best_q:
+            best, best_q = kind, q
+    return best
+
+def _image_headers(response: BaseModel, image: CapturedImage) -> Dict[str, str]:
+    """Screenshot metadata as headers for the raw image / multipart forms"""
+    headers = {
+        "X-Success": str(bool(response.success)).lower(),
+        "X-Image-Width": str(image.width),
+        "X-Image-Height": str(image.height),
+        "X-Source-Width": str(image.source_width),
+        "X-Source-Height": str(image.source_height),
+        "X-Image-Scale-X": str(round(image.scale_x, 4)),
+        "X-Image-Scale-Y": str(round(image.scale_y, 4)),
+        "X-Capture-Ms": str(image.capture_ms),
+        "X-Encode-Ms": str(image.encode_ms),
+    }
+    # Lux scale = screen/viewport pixels per Lux SDK pixel, independent of the downscale
+    if getattr(response, "lux_scale_x", None) is not None:
+        headers["X-Lux-Scale-X"] = str(response.lux_scale_x)
+        headers["X-Lux-Scale-Y"] = str(response.lux_scale_y)
+    generation = getattr(response, "snapshot_generation", None)
+    if generation is not None:
+        headers["X-Snapshot-Generation"] = str(generation)
+    phash = getattr(response, "phash", None)
+    if phash:
+        headers["X-Phash"] = phash
+    return headers
+
+def negotiate_response(request: Optional[Request], response: BaseModel) -> Any:
+    """
+    Render an ActionResponse/ScreenshotResponse according to the Accept header.
+    request=None (internal calls, e.g. /batch steps) always yields the JSON model.
+    """
+    image: Optional[CapturedImage] = response._image
+    transport = "json"
+    if request is not None and image is not None:
+        transport = _preferred_transport(request.headers.get("accept", ""))
+    # v10.30.0: Request spans join the capture timings (not for /batch steps: request=None)
+    timings = current_timings() if request is not None else None
+    if timings:
+        response.timings = {**timings, **(response.timings or {})}
+
+    if transport == "json":
+        if image is not None:
+            field = "image_base64" if isinstance(response, ScreenshotResponse) else "screenshot_base64"
+            setattr(response, field, image.b64())
+        return response
+
+    headers = _image_headers(response, image)
+    if response.timings:
+        headers["Server-Timing"] = ", ".join(f"{k};dur={v}" for k, v in response.timings.items())
+    if transport == "image":
+        return Response(content=image.data, media_type=image.media_type, headers=headers)
+
+    boundary = f"toolserver-{secrets.token_hex(8)}"
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        response.model_dump_json().encode(),
+        f"\r\n--{boundary}\r\nContent-Type: {image.media_type}\r\n"
+        f"Content-Disposition: inline; filename=\"screenshot.{image.format}\"\r\n"
+        f"Content-Length: {len(image.data)}\r\n\r\n".encode(),
+        image.data,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return Response(content=body, media_type=f"multipart/mixed; boundary={boundary}", headers=headers)
+
+# ============================================================================
+# DOM SNAPSHOT SCRIPTS
+# ============================================================================
+
+# v10.10.0: Page-side "dirty" generation counter. Any DOM mutation, scroll,
+# resize, input, focus or hover change bumps it, so an unchanged counter
+# means a cached snapshot is still valid. Installed as init script on every
+# document of the context (guarded, so evaluating it twice is harmless).
+DOM_OBSERVER_SCRIPT = '''() => {
+    if (window.__ahObserver) return;
+    window.__ahDocId = Math.random().toString(36).slice(2);
+    window.__ahDirty = 1;
+    window.__ahLastMutation = performance.now();
+    const bump = () => {
+        window.__ahDirty++;
+        window.__ahLastMutation = performance.now();
+    };
+    window.__ahObserver = new MutationObserver(bump);
+    window.__ahObserver.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    for (const evt of ['scroll', 'resize', 'input', 'change', 'focusin', 'focusout',
+                       'mouseover', 'mouseout', 'transitionend', 'animationend', 'load']) {
+        window.addEventListener(evt, bump, {capture: true, passive: true});
+    }
+}'''
+
+# v10.13.0: Current dirty token of the page, compared with the one a ref was captured at
+PAGE_TOKEN_SCRIPT = '''() => window.__ahObserver ? {doc: window.__ahDocId, dirty: window.__ahDirty} : null'''
+
+# Interactive elements extraction (Playwright MCP style). Receives the token of
+# the cached extraction and returns {unchanged: true} if the page did not change.
+DOM_EXTRACTION_SCRIPT = '''(lastToken) => {
+    // v10.10.0: Page unchanged since the cached extraction -> skip the whole scan
+    const token = window.__ahObserver ? {doc: window.__ahDocId, dirty: window.__ahDirty} : null;
+    if (token && lastToken && lastToken.doc === token.doc && lastToken.dirty === token.dirty) {
+        return {unchanged: true, token: token};
+    }
+
+    // Get active element for [active] attribute
+    const activeElement = document.activeElement;
+
+    // v10.9.0: Stable DOM path, anchored at the nearest ancestor with an id
+    const domPath = (node) => {
+        const parts = [];
+        while (node && node.nodeType === 1) {
+            if (node.id) {
+                parts.unshift('#' + CSS.escape(node.id));
+                break;
+            }
+            const tag = node.tagName.toLowerCase();
+            if (tag === 'html' || tag === 'body') {
+                parts.unshift(tag);
+                break;
+            }
+            let nth = 1;
+            for (let sib = node.previousElementSibling; sib; sib = sib.previousElementSibling) {
+                if (sib.tagName === node.tagName) nth++;
+            }
+            parts.unshift(`${tag}:nth-of-type(${nth})`);
+            node = node.parentElement;
+        }
+        return parts.join(' > ');
+    };
+
+    // Get all interactive elements
+    const interactive = document.querySelectorAll(
+        'a, button, input, select, textarea, ' +
+        '[role="button"], [role="link"], [role="textbox"], [role="menuitem"], ' +
+        '[role="tab"], [role="checkbox"], [role="radio"], [role="switch"], ' +
+        '[role="option"], [role="combobox"], [role="listbox"], ' +
+        '[onclick], [tabindex]:not([tabindex="-1"]), ' +
+        'label, img[alt], [aria-label], h1, h2, h3, h4, h5, h6'
+    );
+    const elements = [];
+
+    interactive.forEach((el, index) => {
+        const rect = el.getBoundingClientRect();
+        const style = window.getComputedStyle(el);
+        const isVisible = style.display !== 'none' &&
+                         style.visibility !== 'hidden' &&
+                         rect.width > 0 && rect.height > 0;
+
+        if (isVisible && rect.top < window.innerHeight && rect.bottom > 0) {
+            const tag = el.tagName.toLowerCase();
+            const role = el.getAttribute('role') ||
+                        (tag === 'a' ? 'link' :
+                         tag === 'button' ? 'button' :
+                         tag === 'input' ? (el.type === 'checkbox' ? 'checkbox' :
+                                            el.type === 'radio' ? 'radio' : 'textbox') :
+                         tag === 'select' ? 'combobox' :
+                         tag === 'textarea' ? 'textbox' :
+                         tag.match(/^h[1-6]$/) ? 'heading' : tag);
+
+            const name = el.getAttribute('aria-label') ||
+                        el.getAttribute('title') ||
+                        el.getAttribute('placeholder') ||
+                        el.getAttribute('alt') ||
+                        (tag === 'input' && el.type === 'submit' ? el.value : null) ||
+                        (tag === 'label' ? el.textContent?.trim().slice(0, 50) : null) ||
+                        (tag === 'button' || tag === 'a' ? el.textContent?.trim().slice(0, 50) : null) ||
+                        (tag.match(/^h[1-6]$/) ? el.textContent?.trim().slice(0, 50) : null);
+
+            // Semantic attributes (Playwright MCP style)
+            const isActive = el === activeElement;
+            const isDisabled = el.disabled || el.getAttribute('aria-disabled') === 'true';
+            const isChecked = el.checked === true || el.getAttribute('aria-checked') === 'true';
+            const isExpanded = el.getAttribute('aria-expanded') === 'true';
+            const isSelected = el.getAttribute('aria-selected') === 'true';
+            const isRequired = el.required || el.getAttribute('aria-required') === 'true';
+            const isReadonly = el.readOnly || el.getAttribute('aria-readonly') === 'true';
+
+            elements.push({
+                _index: index,
+                tag: tag,
+                role: role,
+                name: name || null,
+                text: el.textContent?.trim().slice(0, 100) || null,
+                x: Math.round(rect.x + rect.width / 2),
+                y: Math.round(rect.y + rect.height / 2),
+                width: Math.round(rect.width),
+                height: Math.round(rect.height),
+                top: Math.round(rect.top),
+                left: Math.round(rect.left),
+                id: el.id || null,
+                className: el.className || null,
+                testId: el.getAttribute('data-testid') || null,
+                path: domPath(el),
+                value: el.value || null,
+                type: el.type || null,
+                href: el.href || null,
+                // Semantic attributes
+                active: isActive,
+                disabled: isDisabled,
+                checked: isChecked,
+                expanded: isExpanded,
+                selected: isSelected,
+                required: isRequired,
+                readonly: isReadonly,
+            });
+        }
+    });
+
+    return {
+        url: window.location.href,
+        title: document.title,
+        viewport: { width: window.innerWidth, height: window.innerHeight },
+        elements: elements,
+        token: token
+    };
+}'''
+
+# v10.11.0: Resolves once no DOM mutation happened for quietMs (checked after a
+# rendered frame) or when timeoutMs elapses. Relies on DOM_OBSERVER_SCRIPT's
+# __ahLastMutation; without the observer the page is considered quiet.
+DOM_SETTLE_SCRIPT = '''([quietMs, timeoutMs]) => new Promise((resolve) => {
+    const start = performance.now();
+    const check = () => {
+        const now = performance.now();
+        const quiet = now - (window.__ahLastMutation || 0);
+        if (quiet >= quietMs) return resolve({stable: true, quiet_ms: Math.round(quiet)});
+        if (now - start >= timeoutMs) return resolve({stable: false, quiet_ms: Math.round(quiet)});
+        setTimeout(check, 16);
+    };
+    // Wait for one rendered frame (setTimeout fallback: rAF is paused in hidden tabs)
+    let started = false;
+    const first = () => { if (!started) { started = true; check(); } };
+    requestAnimationFrame(first);
+    setTimeout(first, 100);
+})'''
+
+# ============================================================================
+# v10.25.0: BACKGROUND FILE WRITER + HAR RECORDER
+# ============================================================================
+
+class BackgroundLineWriter:
+    """
+    Appends lines to a file from a daemon thread: the event loop only enqueues.
+    Lines are written in batches and flushed every flush_interval or once
+    flush_bytes are pending; when the queue is full new lines are dropped (and
+    counted) instead of blocking. v10.26.0: with max_bytes the file rotates
+    like RotatingFileHandler (path.1 .. path.<backup_count>).
+    """
+
+    def __init__(self, path: Path, max_queue: int = WRITER_QUEUE_SIZE,
+                 flush_interval: float = WRITER_FLUSH_INTERVAL, flush_bytes: int = WRITER_FLUSH_BYTES,
+                 max_bytes: int = 0, backup_count: int = 0):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.rotations = 0
+        self.error: Optional[str] = None
+        self._closed = False
+        self._file = None
+        self._file_size = 0
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name=f"writer-{self.path.name}", daemon=True)
+        self._thread.start()
+
+    def write(self, line: str) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(line)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def write_json(self, obj: Any) -> bool:
+        return self.write(json.dumps(obj, ensure_ascii=False, default=str))
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._file_size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = self.path.with_name(f"{self.path.name}.{i}")
+                if src.exists():
+                    os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink(missing_ok=True)
+        self.rotations += 1
+        self._open()
+
+    def _flush(self):
+        self._file.flush()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def _write_lines(self, lines: List[str]):
+        data = "".join(line + "\n" for line in lines)
+        size = len(data.encode("utf-8"))
+        self._file.write(data)
+        self._file_size += size
+        self._unflushed += size
+        self.written += len(lines)
+        self.bytes += size
+
+    def _write_batch(self, batch: List[str]):
+        if not self.max_bytes:
+            self._write_lines(batch)
+        else:
+            # Split the batch where the file would exceed max_bytes
+            chunk: List[str] = []
+            chunk_size = 0
+            for line in batch:
+                size = len(line.encode("utf-8")) + 1
+                if self._file_size + chunk_size + size > self.max_bytes and (chunk or self._file_size):
+                    if chunk:
+                        self._write_lines(chunk)
+                        chunk, chunk_size = [], 0
+                    self._rotate()
+                chunk.append(line)
+                chunk_size += size
+            if chunk:
+                self._write_lines(chunk)
+        if self._unflushed >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush()
+
+    def _run(self):
+        try:
+            self._open()
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"❌ Writer {self.path}: {e}")
+            return
+        try:
+            stop = False
+            while not stop:
+                try:
+                    line = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    if self._unflushed:
+                        self._flush()
+                    continue
+                batch: List[str] = []
+                while line is not None:
+                    batch.append(line)
+                    try:
+                        line = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                stop = line is None
+                if batch:
+                    try:
+                        self._write_batch(batch)
+                    except Exception as e:
+                        self.dropped += len(batch)
+                        if self.error != str(e):
+                            self.error = str(e)
+                            logger.warning(f"⚠️ Writer {self.path}: {e}")
+                        if self._file.closed:
+                            try:
+                                self._open()  # Rotation failed half-way
+                            except Exception:
+                                pass
+        finally:
+            self._file.close()
+
+    def close(self, timeout: float = 5.0):
+        """Write what is queued, then stop (blocking - call via run_in_executor from async code)"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "written": self.written,
+            "dropped": self.dropped,
+            "bytes": self.bytes,
+            "rotations": self.rotations,
+            "pending": self.pending,
+            "error": self.error,
+        }
+
+
+def format_console_line(session_id: str, msg: Dict[str, Any]) -> str:
+    """browser_console.log line for a captured console message"""
+    location = msg.get("location") or {}
+    line = (f"[{msg.get('timestamp', datetime.now().isoformat())}] [{msg.get('type', 'log').upper()}] "
+            f"[{session_id[:8]}] {msg.get('text', '')}")
+    if location.get("url"):
+        line += f" @ {location['url']}:{location.get('line', 0)}"
+    return line
+
+
+# v10.26.0: One sink for the console messages of every session (replaces the
+# synchronous per-request append in /browser/console)
+browser_console_sink = BackgroundLineWriter(
+    BROWSER_CONSOLE_LOG_PATH,
+    max_bytes=BROWSER_CONSOLE_LOG_MAX_BYTES,
+    backup_count=BROWSER_CONSOLE_LOG_BACKUPS,
+)
+NOTIFICATION_QUEUE_DEPTH.labels("browser_console_log").set_function(lambda: browser_console_sink.pending)
+
+# v10.30.0: Optional request span trace file (TOOL_SERVER_TRACE_FILE=1)
+trace_writer: Optional[BackgroundLineWriter] = None
+if TRACE_FILE_ENABLED:
+    trace_writer = BackgroundLineWriter(TRACE_FILE_PATH, max_bytes=BROWSER_CONSOLE_LOG_MAX_BYTES,
+                                        backup_count=BROWSER_CONSOLE_LOG_BACKUPS)
+    NOTIFICATION_QUEUE_DEPTH.labels("trace_file").set_function(lambda: trace_writer.pending)
+
+
+def _har_headers(headers: Optional[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [{"name": k, "value": v} for k, v in (headers or {}).items()]
+
+
+def _har_timings(timing: Dict[str, float]) -> Tuple[Dict[str, float], float]:
+    """Playwright request.timing (ms relative to startTime, -1 = n/a) -> HAR timings + total"""
+    def span(start: str, end: str) -> float:
+        a, b = timing.get(start, -1), timing.get(end, -1)
+        return round(b - a, 3) if a >= 0 and b >= 0 else -1
+
+    ssl = span("secureConnectionStart", "connectEnd")
+    timings = {
+        "blocked": -1,
+        "dns": span("domainLookupStart", "domainLookupEnd"),
+        "connect": span("connectStart", "connectEnd"),
+        "ssl": ssl,
+        "send": 0,
+        "wait": span("requestStart", "responseStart"),
+        "receive": span("responseStart", "responseEnd"),
+    }
+    total = timing.get("responseEnd", -1)
+    if total < 0:
+        total = sum(v for k, v in timings.items() if v > 0 and k != "ssl")
+    return timings, round(total, 3)
+
+
+def _iter_file(path: Path, chunk_bytes: int = 64 * 1024):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_har_file(path: Path, chunk_bytes: int = 64 * 1024):
+    """Stream a HAR JSONL file as one HAR 1.2 document without loading it (v10.25.0)"""
+    yield ('{"log": {"version": "1.2", "creator": {"name": "tool_server", "version": "%s"}, '
+           '"pages": [], "entries": [\n' % SERVICE_VERSION)
+    buf: List[str] = []
+    size = 0
+    first = True
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            buf.append(line if first else ",\n" + line)
+            size += len(line)
+            first = False
+            if size >= chunk_bytes:
+                yield "".join(buf)
+                buf, size = [], 0
+    buf.append("\n]}}\n")
+    yield "".join(buf)
+
+
+class HarRecorder:
+    """
+    Opt-in HAR recording for one session. Finished/failed requests are turned
+    into HAR entries (timings, sizes, optionally capped bodies) in background
+    tasks and appended as JSONL by a BackgroundLineWriter, so memory stays
+    flat however long the session runs. iter_har_file assembles the HAR.
+    """
+
+    def __init__(self, session_id: str, path: Path, include_bodies: bool = False,
+                 max_body_bytes: int = HAR_MAX_BODY_BYTES, resource_types: Optional[List[str]] = None):
+        self.session_id = session_id
+        self.path = path
+        self.include_bodies = include_bodies
+        self.max_body_bytes = max_body_bytes
+        self.resource_types = resource_types
+        self.started_at = datetime.now().isoformat()
+        self.entries = 0
+        self.failed = 0
+        self.writer = BackgroundLineWriter(path)
+        self._semaphore = asyncio.Semaphore(HAR_CONCURRENCY)
+        self._tasks: set = set()
+
+    def record(self, request, error: Optional[str] = None):
+        if self.resource_types and request.resource_type not in self.resource_types:
+            return
+        task = asyncio.ensure_future(self._record(request, error))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _record(self, request, error: Optional[str]):
+        async with self._semaphore:
+            try:
+                entry = await self._build_entry(request, error)
+            except Exception as e:
+                self.failed += 1  # Page closed mid-request etc.
+                logger.debug(f"HAR entry skipped ({request.url[:80]}): {e}")
+                return
+        if self.writer.write_json(entry):
+            self.entries += 1
+
+    async def _build_entry(self, request, error: Optional[str]) -> Dict[str, Any]:
+        timing = request.timing or {}
+        timings, total = _har_timings(timing)
+        start = timing.get("startTime")
+        started = datetime.fromtimestamp(start / 1000, tz=timezone.utc) if start and start > 0 else datetime.now(timezone.utc)
+
+        response = None if error else await request.response()
+        sizes = {}
+        if not error:
+            try:
+                sizes = await request.sizes()
+            except Exception:
+                pass
+
+        har_request = {
+            "method": request.method,
+            "url": request.url,
+            "httpVersion": "HTTP/1.1",
+            "headers": _har_headers(request.headers),
+            "queryString": [],
+            "cookies": [],
+            "headersSize": sizes.get("requestHeadersSize", -1),
+            "bodySize": sizes.get("requestBodySize", -1),
+        }
+        try:
+            post_data = request.post_data
+        except Exception:
+            post_data = None  # Binary body
+        if post_data:
+            har_request["postData"] = {
+                "mimeType": request.headers.get("content-type", ""),
+                "text": post_data[:self.max_body_bytes],
+            }
+
+        if response:
+            mime = response.headers.get("content-type", "")
+            content: Dict[str, Any] = {"size": sizes.get("responseBodySize", -1), "mimeType": mime}
+            if self.include_bodies and self.max_body_bytes > 0:
+                try:
+                    body = await response.body()
+                    content["size"] = len(body)
+                    if len(body) > self.max_body_bytes:
+                        body = body[:self.max_body_bytes]
+                        content["_truncated"] = True
+                    if mime.startswith("text/") or "json" in mime or "javascript" in mime or "xml" in mime:
+                        content["text"] = body.decode("utf-8", errors="replace")
+                    else:
+                        content["text"] = base64.b64encode(body).decode("ascii")
+                        content["encoding"] = "base64"
+                except Exception:
+                    pass  # Redirects / evicted bodies have none
+            har_response = {
+                "status": response.status,
+                "statusText": response.status_text,
+                "httpVersion": "HTTP/1.1",
+                "headers": _har_headers(response.headers),
+                "cookies": [],
+                "content": content,
+                "redirectURL": response.headers.get("location", ""),
+                "headersSize": sizes.get("responseHeadersSize", -1),
+                "bodySize": sizes.get("responseBodySize", -1),
+            }
+        else:
+            har_response = {
+                "status": 0, "statusText": "", "httpVersion": "", "headers": [], "cookies": [],
+                "content": {"size": 0, "mimeType": ""}, "redirectURL": "", "headersSize": -1, "bodySize": -1,
+            }
+
+        entry = {
+            "startedDateTime": started.isoformat(),
+            "time": total,
+            "request": har_request,
+            "response": har_response,
+            "cache": {},
+            "timings": timings,
+            "_resourceType": request.resource_type,
+        }
+        if error:
+            entry["_failureText"] = error
+        return entry
+
+    async def close(self, timeout: float = 10.0):
+        """Wait for entries still being assembled, then drain the writer"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+        await asyncio.get_running_loop().run_in_executor(None, self.writer.close)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "entries": self.entries,
+            "failed": self.failed,
+            "in_progress": len(self._tasks),
+            "include_bodies": self.include_bodies,
+            "max_body_bytes": self.max_body_bytes,
+            "resource_types": self.resource_types,
+            "writer": self.writer.status(),
+        }
+
+class HarArchive:
+    """
+    HAR recordings by session id, live and finished: a recording stays
+    downloadable after /browser/har/stop and after the session is closed.
+    prune() (on every finish and at startup) deletes finished files older
+    than HAR_RETENTION_SECONDS or beyond the newest HAR_MAX_FILES; files
+    still being recorded are never touched.
+    """
+
+    def __init__(self, directory: Path, retention: float = HAR_RETENTION_SECONDS, max_files: int = HAR_MAX_FILES):
+        self.directory = directory
+        self.retention = retention
+        self.max_files = max_files
+        self._recordings: Dict[str, Dict[str, Any]] = {}  # session_id -> latest recording
+
+    def begin(self, session_id: str, path: Path):
+        self._recordings[session_id] = {"session_id": session_id, "har_file": str(path), "recording": True}
+
+    def finish(self, session_id: str, status: Dict[str, Any]):
+        self._recordings[session_id] = {
+            "session_id": session_id,
+            "har_file": status["writer"]["path"],
+            "recording": False,
+            "started_at": status["started_at"],
+            "finished_at": datetime.now().isoformat(),
+            "entries": status["entries"],
+            "bytes": status["writer"]["bytes"],
+            "dropped": status["writer"]["dropped"],
+        }
+        self.prune()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        info = self._recordings.get(session_id)
+        if info and not info["recording"] and not Path(info["har_file"]).exists():
+            self._recordings.pop(session_id, None)  # Pruned or deleted by hand
+            return None
+        return info
+
+    def delete(self, session_id: str) -> bool:
+        """Delete a finished recording (False if unknown or still recording)"""
+        info = self.get(session_id)
+        if not info or info["recording"]:
+            return False
+        self._recordings.pop(session_id, None)
+        Path(info["har_file"]).unlink(missing_ok=True)
+        return True
+
+    def prune(self) -> int:
+        active = {info["har_file"] for info in self._recordings.values() if info["recording"]}
+        try:
+            files = [(f.stat().st_mtime, f) for f in self.directory.glob("har-*.jsonl") if str(f) not in active]
+        except OSError:
+            return 0
+        files.sort(reverse=True)
+        cutoff = time.time() - self.retention
+        removed = 0
+        for rank, (mtime, f) in enumerate(files):
+            if rank >= self.max_files or mtime < cutoff:
+                try:
+                    f.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+        if removed:
+            logger.info(f"🗂️ HAR retention: {removed} old file(s) deleted")
+        return removed
+
+har_archive = HarArchive(HAR_DIR)
+har_archive.prune()
+
+# ============================================================================
+# v10.18.0: LIVE SCREENCAST (CDP Page.startScreencast)
+# ============================================================================
+
+class ScreencastHub:
+    """
+    One CDP screencast on the session's current page, fanned out to N viewers.
+    Chrome only sends the next frame after Page.screencastFrameAck: delaying
+    the ack caps the FPS, and each viewer has a one-frame slot so a slow viewer
+    drops stale frames instead of queueing them.
+    The first viewer's settings are used until the last viewer leaves.
+    """
+
+    def __init__(self, session: 'BrowserSession', max_fps: int, quality: int, max_width: int, max_height: int):
+        self.session = session
+        self.settings = {
+            "max_fps": max(1, min(max_fps, 60)),
+            "quality": max(1, min(quality, 100)),
+            "max_width": max_width,
+            "max_height": max_height,
+        }
+        self.page = None
+        self.frames = 0
+        self._cdp = None
+        self._viewers: set = set()
+        self._last_ack = 0.0
+
+    @property
+    def viewer_count(self) -> int:
+        return len(self._viewers)
+
+    async def start(self):
+        self.page = self.session.page
+        self._cdp = await self.session.context.new_cdp_session(self.page)
+        self._cdp.on("Page.screencastFrame", lambda params: asyncio.ensure_future(self._on_frame(params)))
+        await self._cdp.send("Page.startScreencast", {
+            "format": "jpeg",
+            "quality": self.settings["quality"],
+            "maxWidth": self.settings["max_width"],
+            "maxHeight": self.settings["max_height"],
+        })
+        logger.info(f"📺 Screencast started: {self.session.session_id} {self.settings}")
+
+    async def stop(self):
+        cdp, self._cdp = self._cdp, None
+        if cdp:
+            try:
+                await cdp.send("Page.stopScreencast")
+                await cdp.detach()
+            except Exception:
+                pass  # Page/context already closed
+            logger.info(f"📺 Screencast stopped: {self.session.session_id} ({self.frames} frames)")
+
+    def subscribe(self) -> asyncio.Queue:
+        viewer: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._viewers.add(viewer)
+        return viewer
+
+    def unsubscribe(self, viewer: asyncio.Queue):
+        self._viewers.discard(viewer)
+
+    async def _on_frame(self, params: Dict[str, Any]):
+        frame = base64.b64decode(params["data"])
+        for viewer in list(self._viewers):
+            if viewer.full():
+                viewer.get_nowait()  # Latest frame wins
+            viewer.put_nowait(frame)
+        self.frames += 1
+
+        # FPS cap: hold the ack until the frame interval has elapsed
+        wait = 1.0 / self.settings["max_fps"] - (time.monotonic() - self._last_ack)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._last_ack = time.monotonic()
+        cdp = self._cdp
+        if cdp:
+            try:
+                await cdp.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]})
+            except Exception:
+                pass
+
+# ============================================================================
+# v10.31.0: SHARED BROWSER POOL
+# ============================================================================
+
+class SharedBrowserPool:
+    """
+    One browser per headless mode shared by all "shared" sessions. Each
+    session gets its own BrowserContext (cookies, storage, cache and pages
+    isolated) instead of a launch_persistent_context on BROWSER_PROFILE_DIR,
+    which only one process can hold. Contexts are seeded from a storage_state
+    exported from the persistent profile so logins still work: from the live
+    profile session when there is one, otherwise from a short headless launch
+    of the profile. The export is reused for STORAGE_STATE_MAX_AGE seconds.
+    SessionManager decides where the export comes from (it knows who holds or
+    is launching on the profile); new_context only consumes the file.
+    """
+
+    def __init__(self):
+        self._playwright = None
+        self._browsers: Dict[bool, "Browser"] = {}
+        self._lock = asyncio.Lock()
+        self._state_lock = asyncio.Lock()
+        self.contexts = 0
+        self.launches = 0
+        self.state_error: Optional[str] = None
+
+    async def _start_playwright(self):
+        """Caller holds self._lock"""
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        return self._playwright
+
+    async def _browser(self, headless: bool) -> "Browser":
+        async with self._lock:
+            browser = self._browsers.get(headless)
+            if browser is not None and browser.is_connected():
+                return browser
+            playwright = await self._start_playwright()
+            browser = await playwright.chromium.launch(channel="msedge", headless=headless, args=BROWSER_LAUNCH_ARGS)
+            self._browsers[headless] = browser
+            self.launches += 1
+            logger.info(f"🌐 Shared browser launched (headless={headless})")
+            return browser
+
+    async def new_context(self, headless: bool = False, storage_state: Optional[str] = None) -> "BrowserContext":
+        browser = await self._browser(headless)
+        context = await browser.new_context(
+            viewport={"width": VIEWPORT_WIDTH, "height": VIEWPORT_HEIGHT},
+            storage_state=storage_state
+        )
+        self.contexts += 1
+
+        def on_close(_context):
+            self.contexts -= 1
+
+        context.on("close", on_close)
+        return context
+
+    async def storage_state(self, source: Optional["BrowserContext"] = None, refresh: bool = False,
+                            launch_profile: bool = False) -> Optional[str]:
+        """
+        Path of the exported profile storage_state (None if there is none yet).
+        source: the context holding the profile when a persistent session is live
+        (the profile is locked then, so it is exported from that context).
+        launch_profile: without a source, export through a headless launch of the
+        profile - only when the caller knows nobody holds or is launching on it.
+        """
+        path = BROWSER_STORAGE_STATE_PATH
+        async with self._state_lock:
+            fresh = path.exists() and time.time() - path.stat().st_mtime < STORAGE_STATE_MAX_AGE
+            if (refresh or not fresh) and (source is not None or launch_profile):
+                await self._export_state(source)
+        return str(path) if path.exists() else None
+
+    async def _export_state(self, source: Optional["BrowserContext"]):
+        path = BROWSER_STORAGE_STATE_PATH
+        tmp = path.with_suffix(".tmp")
+        try:
+            if source is not None:
+                await source.storage_state(path=str(tmp))
+            elif BROWSER_PROFILE_DIR.exists():
+                async with self._lock:
+                    playwright = await self._start_playwright()
+                context = await playwright.chromium.launch_persistent_context(
+                    user_data_dir=str(BROWSER_PROFILE_DIR), channel="msedge", headless=True, args=BROWSER_LAUNCH_ARGS)
+                try:
+                    await context.storage_state(path=str(tmp))
+                finally:
+                    await context.close()
+            else:
+                return  # No profile yet: contexts start logged out
+            os.chmod(tmp, 0o600)  # Cookies and tokens
+            os.replace(tmp, path)
+            self.state_error = None
+            logger.info(f"🔑 Profile storage_state exported: {path}")
+        except Exception as e:
+            # Typically the profile is locked by another process (tasker_service)
+            self.state_error = str(e)
+            logger.warning(f"⚠️ storage_state export failed, using {'previous export' if path.exists() else 'empty state'}: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        path = BROWSER_STORAGE_STATE_PATH
+        return {
+            "browsers": {("headless" if h else "headed"): b.is_connected() for h, b in self._browsers.items()},
+            "contexts": self.contexts,
+            "launches": self.launches,
+            "storage_state": {
+                "path": str(path),
+                "age_s": round(time.time() - path.stat().st_mtime, 1) if path.exists() else None,
+                "error": self.state_error,
+            },
+        }
+
+    async def close(self):
+        for browser in list(self._browsers.values()):
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self._browsers.clear()
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
 
 # ============================================================================
 # BROWSER SESSION
@@ -1015,15 +2942,44 @@ class BrowserSession:
         self.session_id = session_id
         self.playwright = None
         self.context: Optional[BrowserContext] = None
+        self.backend = "persistent"  # v10.31.0: or "shared" (context in SharedBrowserPool)
         self.pages: List[Page] = []
         self.current_page_index = 0
         # v10.0.0: Ref system for element tracking
         self._element_refs: Dict[str, Dict[str, Any]] = {}  # ref -> element info with coordinates
-        self._ref_counter = 0
+        self._refs_url: Optional[str] = None  # v10.9.0: URL the current refs belong to
+        # v10.10.0: Snapshot cache (page, page token, tree) + shared in-flight extraction
+        self._snapshot_cache: Optional[Tuple[Any, Dict[str, Any], Dict[str, Any]]] = None
+        self._snapshot_inflight: Optional[asyncio.Future] = None
+        # v10.11.0: Settle detection - requests in flight (id -> start time) + last activity
+        self._inflight_requests: Dict[int, float] = {}
+        self._last_network_activity = time.monotonic()
+        # v10.12.0: Viewport size per page (id(page) -> (w, h)), avoids an evaluate per capture
+        self._viewport_cache: Dict[int, Tuple[int, int]] = {}
+        # v10.17.0: Last /screenshot per page: id(page) -> (phash, encoded bytes)
+        self._last_screenshot: Dict[int, Tuple[str, bytes]] = {}
+        # v10.18.0: Live screencast shared by all viewers
+        self._screencast: Optional[ScreencastHub] = None
+        self._screencast_lock = asyncio.Lock()
+        # v10.8.0: Versioned snapshots - generation -> {"url", "lines": element key -> text line}
+        self._snapshot_generation = 0
+        self._snapshot_history: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # v10.13.0: Default snapshot policy for actions + last generation shipped to a client
+        self.snapshot_policy: str = "full"
+        self.last_delivered_generation: Optional[int] = None
         # v10.4.0: Tracing and debugging support
         self._tracing_active = False
-        self._console_messages: List[Dict[str, Any]] = []
-        self._network_requests: List[Dict[str, Any]] = []
+        # v10.24.0: Fixed-size ring buffers, entries carry a monotonically increasing seq (cursor)
+        self._console_messages: "deque[Dict[str, Any]]" = deque(maxlen=CONSOLE_BUFFER_SIZE)
+        self._network_requests: "deque[Dict[str, Any]]" = deque(maxlen=NETWORK_BUFFER_SIZE)
+        self._console_seq = 0
+        self._network_seq = 0
+        # id(request) -> (entry, start time) for requests not finished yet
+        self._network_index: Dict[int, Tuple[Dict[str, Any], float]] = {}
+        self.capture_policy: Dict[str, Any] = dict(DEFAULT_CAPTURE_POLICY)
+        # v10.25.0: Opt-in HAR recording (last file kept for download after stop)
+        self._har: Optional[HarRecorder] = None
+        self.har_path: Optional[Path] = None
         self._console_handler = None
         self._request_handler = None
         self._response_handler = None
@@ -1034,31 +2990,126 @@ class BrowserSession:
             return self.pages[self.current_page_index]
         return None
 
-    def _generate_ref(self) -> str:
-        """Generate unique ref ID like 'e1', 'e2', etc."""
-        self._ref_counter += 1
-        return f"e{self._ref_counter}"
+    def _generate_ref(self, identity: str, taken: set) -> str:
+        """
+        Generate a content-addressed ref ID like 'e3f9a1c' (v10.9.0).
+        The same element identity always maps to the same ref, so refs
+        survive re-snapshots; collisions within a snapshot get re-hashed.
+        """
+        salt = 0
+        while True:
+            key = identity if salt == 0 else f"{identity}#{salt}"
+            ref = "e" + hashlib.sha1(key.encode('utf-8')).hexdigest()[:6]
+            if ref not in taken:
+                return ref
+            salt += 1
 
     def get_element_by_ref(self, ref: str) -> Optional[Dict[str, Any]]:
         """Get element info by ref ID"""
         return self._element_refs.get(ref)
 
     def clear_refs(self):
-        """Clear all refs (call before new snapshot)"""
+        """Clear all refs (called when the page navigates to a new URL)"""
         self._element_refs = {}
-        self._ref_counter = 0
+        self._refs_url = None
+
+    async def resolve_ref_point(self, ref: str) -> Optional[Tuple[int, int]]:
+        """
+        Resolve a ref to viewport coordinates (v10.9.0).
+        Refs missing from the latest snapshot (e.g. scrolled out of view) are
+        located via their selector and scrolled into view first.
+        v10.13.0: With snapshot policies none/lazy actions no longer refresh the
+        snapshot, so the cached x/y are only used while the page's dirty token is
+        still the one of the snapshot that produced the ref (no scroll, resize or
+        DOM change since); otherwise the selector path is taken as well.
+        """
+        with span("resolve"):
+            element = self.get_element_by_ref(ref)
+            if not element:
+                return None
+            if element.get('in_snapshot', True) and element.get('token'):
+                try:
+                    token = await self.page.evaluate(PAGE_TOKEN_SCRIPT)
+                except Exception:
+                    token = None
+                if token == element['token']:
+                    return element['x'], element['y']
+
+            locator = self.page.locator(element['selector']).first
+            await locator.scroll_into_view_if_needed(timeout=5000)
+            bbox = await locator.bounding_box()
+            if not bbox:
+                return None
+            return int(bbox['x'] + bbox['width'] / 2), int(bbox['y'] + bbox['height'] / 2)
+
+    @property
+    def snapshot_generation(self) -> int:
+        """Latest snapshot generation recorded for this session"""
+        return self._snapshot_generation
+
+    def _record_snapshot(self, url: str, lines: Dict[str, str]) -> int:
+        """
+        Store snapshot lines under a generation id (v10.8.0).
+        The generation only advances when the content actually changed.
+        """
+        last = self._snapshot_history.get(self._snapshot_generation)
+        if last is not None and last['url'] == url and last['lines'] == lines:
+            return self._snapshot_generation
+
+        self._snapshot_generation += 1
+        self._snapshot_history[self._snapshot_generation] = {'url': url, 'lines': lines}
+        while len(self._snapshot_history) > SNAPSHOT_HISTORY_SIZE:
+            self._snapshot_history.popitem(last=False)
+        return self._snapshot_generation
+
+    def diff_snapshot(self, since: int, generation: int) -> Optional[Dict[str, Any]]:
+        """
+        Diff two snapshot generations (v10.8.0).
+        Returns None when a full snapshot is needed: unknown/evicted base
+        generation or the page navigated to a different URL.
+        """
+        base = self._snapshot_history.get(since)
+        current = self._snapshot_history.get(generation)
+        if base is None or current is None or base['url'] != current['url']:
+            return None
+
+        old, new = base['lines'], current['lines']
+        added = [line for key, line in new.items() if key not in old]
+        removed = [line for key, line in old.items() if key not in new]
+        changed = [
+            {"before": old[key], "after": line}
+            for key, line in new.items()
+            if key in old and old[key] != line
+        ]
+        return {
+            "since": since,
+            "generation": generation,
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "unchanged_count": len(new) - len(added) - len(changed),
+        }
     
-    async def start(self, start_url: Optional[str] = None, headless: bool = False):
-        self.playwright = await async_playwright().start()
-        BROWSER_PROFILE_DIR.mkdir(parents=True, exist_ok=True)
-
-        self.context = await self.playwright.chromium.launch_persistent_context(
-            user_data_dir=str(BROWSER_PROFILE_DIR),
-            channel="msedge",
-            headless=headless,
-            viewport={"width": VIEWPORT_WIDTH, "height": VIEWPORT_HEIGHT},
-            args=["--disable-blink-features=AutomationControlled", "--disable-infobars", "--no-first-run"]
-        )
+    async def start(self, start_url: Optional[str] = None, headless: bool = False,
+                    pool: Optional["SharedBrowserPool"] = None, storage_state: Optional[str] = None):
+        if pool is not None:
+            # v10.31.0: Isolated context in the shared browser (no playwright/process of its own)
+            self.context = await pool.new_context(headless, storage_state)
+            self.backend = "shared"
+        else:
+            self.playwright = await async_playwright().start()
+            BROWSER_PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+
+            self.context = await self.playwright.chromium.launch_persistent_context(
+                user_data_dir=str(BROWSER_PROFILE_DIR),
+                channel="msedge",
+                headless=headless,
+                viewport={"width": VIEWPORT_WIDTH, "height": VIEWPORT_HEIGHT},
+                args=BROWSER_LAUNCH_ARGS
+            )
+
+        # v10.10.0: Dirty-tracking observer on every document (snapshot cache)
+        await self.context.add_init_script(f"({DOM_OBSERVER_SCRIPT})()")
 
         self.pages = list(self.context.pages) if self.context.pages else [await self.context.new_page()]
 
@@ -1069,13 +3120,18 @@ class BrowserSession:
         if start_url and self.page:
             await self.page.goto(start_url, wait_until="domcontentloaded", timeout=30000)
 
-        logger.info(f"✅ Browser started: {self.session_id}")
+        logger.info(f"✅ Browser started: {self.session_id} ({self.backend})")
 
     def _setup_event_handlers(self, page: Page):
         """Setup console and network event handlers for a page"""
         # Console message handler
         def on_console(msg):
-            self._console_messages.append({
+            policy = self.capture_policy
+            if not policy["console"] or (policy["console_types"] and msg.type not in policy["console_types"]):
+                return
+            self._console_seq += 1
+            entry = {
+                "seq": self._console_seq,
                 "type": msg.type,
                 "text": msg.text,
                 "location": {
@@ -1084,47 +3140,98 @@ class BrowserSession:
                     "column": msg.location.get("columnNumber", 0)
                 } if msg.location else None,
                 "timestamp": datetime.now().isoformat()
-            })
-            # Keep only last 1000 messages to prevent memory issues
-            if len(self._console_messages) > 1000:
-                self._console_messages = self._console_messages[-1000:]
+            }
+            # v10.24.0: deque(maxlen) drops the oldest in O(1)
+            self._console_messages.append(entry)
+            # v10.26.0: Persisted by the background sink (no file I/O here)
+            browser_console_sink.write(format_console_line(self.session_id, entry))
+            # v10.28.0: ...and pushed to /logs/stream readers
+            log_broadcaster.publish("browser", msg.type, f"[{self.session_id[:8]}] {msg.text}", entry["timestamp"])
 
         # Network request handler
         def on_request(request):
-            self._network_requests.append({
+            # v10.11.0: Track in-flight requests for settle detection
+            if request.resource_type not in SETTLE_IGNORED_RESOURCE_TYPES:
+                self._inflight_requests[id(request)] = time.monotonic()
+                self._last_network_activity = time.monotonic()
+
+            # v10.24.0: Capture policy (resource types, sampling, headers)
+            policy = self.capture_policy
+            if not policy["network"]:
+                return
+            if policy["resource_types"] and request.resource_type not in policy["resource_types"]:
+                return
+            if policy["sample_rate"] < 1.0 and random.random() >= policy["sample_rate"]:
+                return
+
+            if len(self._network_requests) == self._network_requests.maxlen:
+                evicted = self._network_requests[0]
+                self._network_index.pop(evicted["id"], None)
+            self._network_seq += 1
+            entry = {
+                "seq": self._network_seq,
                 "id": id(request),
                 "method": request.method,
                 "url": request.url,
                 "resource_type": request.resource_type,
-                "headers": dict(request.headers) if request.headers else {},
+                "headers": (dict(request.headers) if request.headers else {}) if policy["capture_headers"] else None,
                 "timestamp": datetime.now().isoformat(),
                 "status": None,  # Will be updated on response
                 "response_headers": None,
-                "duration_ms": None,
+                "duration_ms": None,  # Filled on requestfinished/requestfailed
                 "error": None
-            })
-            # Keep only last 500 requests
-            if len(self._network_requests) > 500:
-                self._network_requests = self._network_requests[-500:]
+            }
+            self._network_requests.append(entry)
+            self._network_index[id(request)] = (entry, time.monotonic())
 
         # Network response handler
         def on_response(response):
-            req_id = id(response.request)
-            for req in reversed(self._network_requests):
-                if req.get("id") == req_id:
-                    req["status"] = response.status
-                    req["response_headers"] = dict(response.headers) if response.headers else {}
-                    break
+            # v10.24.0: O(1) index lookup instead of a reverse scan
+            indexed = self._network_index.get(id(response.request))
+            if indexed:
+                entry = indexed[0]
+                entry["status"] = response.status
+                if self.capture_policy["capture_headers"]:
+                    entry["response_headers"] = dict(response.headers) if response.headers else {}
+
+        # v10.11.0: Request completion (success or failure) ends its in-flight window
+        # v10.24.0: ...and completes the captured entry's timing/error
+        def on_request_done(request, error: Optional[str] = None):
+            if self._inflight_requests.pop(id(request), None) is not None:
+                self._last_network_activity = time.monotonic()
+            indexed = self._network_index.pop(id(request), None)
+            if indexed:
+                entry, started = indexed
+                entry["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+                if error:
+                    entry["error"] = error
+            if self._har:
+                self._har.record(request, error)
+
+        def on_request_failed(request):
+            on_request_done(request, request.failure or "failed")
 
         page.on("console", on_console)
         page.on("request", on_request)
         page.on("response", on_response)
+        page.on("requestfinished", on_request_done)
+        page.on("requestfailed", on_request_failed)
 
         self._console_handler = on_console
         self._request_handler = on_request
         self._response_handler = on_response
     
     async def stop(self):
+        # v10.18.0: Stop the live screencast
+        if self._screencast:
+            await self._screencast.stop()
+            self._screencast = None
+        # v10.25.0: Finish the HAR file while the pages can still answer
+        if self._har:
+            try:
+                await self.stop_har()
+            except Exception:
+                pass
         # Stop tracing if active
         if self._tracing_active:
             try:
@@ -1138,8 +3245,14 @@ class BrowserSession:
         self.context = None
         self.playwright = None
         self.pages = []
-        self._console_messages = []
-        self._network_requests = []
+        self._console_messages.clear()
+        self._network_requests.clear()
+        self._network_index.clear()
+        self._snapshot_history.clear()
+        self._snapshot_cache = None
+        self._inflight_requests.clear()
+        self._viewport_cache.clear()
+        self._last_screenshot.clear()
 
     async def start_tracing(self, screenshots: bool = True, snapshots: bool = True, sources: bool = False):
         """Start tracing browser session"""
@@ -1174,37 +3287,192 @@ class BrowserSession:
         logger.info(f"🎬 Tracing saved to: {output_path}")
         return output_path
 
-    def get_console_messages(self, types: Optional[List[str]] = None, limit: int = 100, clear: bool = False) -> List[Dict]:
-        """Get captured console messages"""
-        messages = self._console_messages
-        if types:
-            messages = [m for m in messages if m["type"] in types]
-        result = messages[-limit:] if limit else messages
+    def start_har(self, include_bodies: bool = False, max_body_bytes: int = HAR_MAX_BODY_BYTES,
+                  resource_types: Optional[List[str]] = None) -> HarRecorder:
+        """Start recording finished requests to a HAR JSONL file (v10.25.0)"""
+        if self._har:
+            raise Exception("HAR recording already active")
+        path = HAR_DIR / f"har-{self.session_id}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl"
+        self._har = HarRecorder(self.session_id, path, include_bodies, max_body_bytes, resource_types)
+        self.har_path = path
+        har_archive.begin(self.session_id, path)
+        logger.info(f"🗂️ HAR recording started: {path}")
+        return self._har
+
+    async def stop_har(self) -> Dict[str, Any]:
+        """Stop HAR recording, returns the recorder's final status"""
+        recorder, self._har = self._har, None
+        if not recorder:
+            raise Exception("HAR recording not active")
+        await recorder.close()
+        status = recorder.status()
+        har_archive.finish(self.session_id, status)
+        logger.info(f"🗂️ HAR recording stopped: {recorder.path} ({recorder.entries} entries)")
+        return status
+
+    def get_console_messages(self, types: Optional[List[str]] = None, limit: int = 100, clear: bool = False,
+                             since: Optional[int] = None) -> Tuple[List[Dict], int, int]:
+        """Get captured console messages -> (messages, cursor, missed)"""
+        match = (lambda m: m["type"] in types) if types else None
+        result, cursor, missed = ring_read(self._console_messages, self._console_seq, since, limit, match)
         if clear:
             if types:
-                self._console_messages = [m for m in self._console_messages if m["type"] not in types]
+                kept = [m for m in self._console_messages if m["type"] not in types]
+                self._console_messages = deque(kept, maxlen=CONSOLE_BUFFER_SIZE)
             else:
-                self._console_messages = []
-        return list(result)
+                self._console_messages.clear()
+        return [dict(m) for m in result], cursor, missed
 
     def get_network_requests(self, types: Optional[List[str]] = None, status_filter: Optional[str] = None,
-                            limit: int = 100, clear: bool = False) -> List[Dict]:
-        """Get captured network requests"""
-        requests = self._network_requests
-        if types:
-            requests = [r for r in requests if r["resource_type"] in types]
-        if status_filter:
-            if status_filter == "success":
-                requests = [r for r in requests if r.get("status") and 200 <= r["status"] < 300]
-            elif status_filter == "error":
-                requests = [r for r in requests if r.get("status") and r["status"] >= 400]
-            elif status_filter.endswith("xx"):
-                prefix = int(status_filter[0])
-                requests = [r for r in requests if r.get("status") and prefix * 100 <= r["status"] < (prefix + 1) * 100]
-        result = requests[-limit:] if limit else requests
+                            limit: int = 100, clear: bool = False,
+                            since: Optional[int] = None) -> Tuple[List[Dict], int, int]:
+        """Get captured network requests -> (requests, cursor, missed)"""
+        status_range = None
+        if status_filter == "success":
+            status_range = (200, 300)
+        elif status_filter == "error":
+            status_range = (400, 1000)
+        elif status_filter and status_filter.endswith("xx"):
+            prefix = int(status_filter[0])
+            status_range = (prefix * 100, (prefix + 1) * 100)
+
+        def match(r: Dict) -> bool:
+            if types and r["resource_type"] not in types:
+                return False
+            if status_range and not (r.get("status") and status_range[0] <= r["status"] < status_range[1]):
+                return False
+            return True
+
+        result, cursor, missed = ring_read(self._network_requests, self._network_seq, since, limit,
+                                           match if (types or status_range) else None)
+        result = [dict(r) for r in result]
         if clear:
-            self._network_requests = []
-        return list(result)
+            self._network_requests.clear()
+            self._network_index.clear()
+        return result, cursor, missed
+
+    def set_capture_policy(self, reset: bool = False, **changes) -> Dict[str, Any]:
+        """Update the console/network capture policy (v10.24.0)"""
+        policy = dict(DEFAULT_CAPTURE_POLICY) if reset else dict(self.capture_policy)
+        policy.update({k: v for k, v in changes.items() if v is not None})
+        policy["sample_rate"] = min(1.0, max(0.0, float(policy["sample_rate"])))
+        self.capture_policy = policy
+        return dict(policy)
+
+    async def get_viewport_size(self) -> Tuple[int, int]:
+        """Viewport size of the current page, cached per page (v10.12.0)"""
+        page = self.page
+        size = self._viewport_cache.get(id(page))
+        if size is None:
+            vp = page.viewport_size
+            if not vp:
+                vp = await page.evaluate("() => ({width: window.innerWidth, height: window.innerHeight})")
+            size = (vp['width'], vp['height'])
+            self._viewport_cache[id(page)] = size
+        return size
+
+    async def screenshot_phash(self, data: bytes) -> str:
+        """Perceptual hash of a frame of the current page (v10.17.0)"""
+        key = id(self.page)
+        last = self._last_screenshot.get(key)
+        if last and last[1] == data:
+            return last[0]  # Byte-identical frame: no decode needed
+        phash = await asyncio.get_running_loop().run_in_executor(_screenshot_executor, compute_dhash, data)
+        self._last_screenshot[key] = (phash, data)
+        return phash
+
+    async def screencast_subscribe(self, max_fps: int = SCREENCAST_MAX_FPS, quality: int = SCREENCAST_QUALITY,
+                                   max_width: int = SCREENCAST_MAX_WIDTH,
+                                   max_height: int = SCREENCAST_MAX_HEIGHT) -> Tuple[ScreencastHub, asyncio.Queue]:
+        """Join the live screencast, starting it if this is the first viewer (v10.18.0)"""
+        async with self._screencast_lock:
+            if self._screencast is None:
+                hub = ScreencastHub(self, max_fps, quality, max_width, max_height)
+                await hub.start()
+                self._screencast = hub
+            return self._screencast, self._screencast.subscribe()
+
+    async def screencast_unsubscribe(self, viewer: asyncio.Queue):
+        """Leave the screencast; the last viewer stops it"""
+        async with self._screencast_lock:
+            hub = self._screencast
+            if hub is None:
+                return
+            hub.unsubscribe(viewer)
+            if hub.viewer_count == 0:
+                self._screencast = None
+                await hub.stop()
+
+    async def screencast_follow_page(self):
+        """Restart the screencast on the current page after a tab switch"""
+        async with self._screencast_lock:
+            hub = self._screencast
+            if hub is None or hub.page is self.page or self.page is None:
+                return
+            await hub.stop()
+            await hub.start()
+
+    def _pending_requests(self) -> int:
+        """Requests still in flight, ignoring long-polls older than SETTLE_MAX_REQUEST_AGE"""
+        cutoff = time.monotonic() - SETTLE_MAX_REQUEST_AGE
+        return sum(1 for started in self._inflight_requests.values() if started >= cutoff)
+
+    async def wait_for_network_idle(self, idle_ms: int = SETTLE_NETWORK_IDLE_MS,
+                                    timeout_ms: int = SETTLE_TIMEOUT_MS) -> Dict[str, Any]:
+        """
+        Wait until no request has been in flight for idle_ms (v10.11.0).
+        Fed by the request/requestfinished/requestfailed hooks - no page round trip.
+        """
+        start = time.monotonic()
+        deadline = start + timeout_ms / 1000
+        idle_s = idle_ms / 1000
+        while True:
+            now = time.monotonic()
+            pending = self._pending_requests()
+            if pending == 0 and now - self._last_network_activity >= idle_s:
+                return {"idle": True, "pending": 0, "elapsed_ms": int((now - start) * 1000)}
+            if now >= deadline:
+                return {"idle": False, "pending": pending, "elapsed_ms": int((now - start) * 1000)}
+            if pending == 0:
+                wait = idle_s - (now - self._last_network_activity)
+            else:
+                wait = 0.02
+            await asyncio.sleep(max(0.005, min(wait, deadline - now)))
+
+    async def wait_for_stable(self, quiet_ms: int = SETTLE_QUIET_MS, timeout_ms: int = SETTLE_TIMEOUT_MS,
+                              network: bool = True, idle_ms: int = SETTLE_NETWORK_IDLE_MS) -> Dict[str, Any]:
+        with span("settle"):
+            return await self._wait_for_stable(quiet_ms, timeout_ms, network, idle_ms)
+
+    async def _wait_for_stable(self, quiet_ms: int, timeout_ms: int, network: bool, idle_ms: int) -> Dict[str, Any]:
+        """
+        Wait until the page settles (v10.11.0): network idle, then no DOM mutation
+        for quiet_ms after a rendered frame. Returns as soon as both hold, or at
+        the deadline with stable=False.
+        """
+        start = time.monotonic()
+        result: Dict[str, Any] = {"stable": False}
+        if network:
+            net = await self.wait_for_network_idle(idle_ms, timeout_ms)
+            result["network_idle"] = net["idle"]
+            result["pending_requests"] = net["pending"]
+
+        remaining_ms = max(0, timeout_ms - int((time.monotonic() - start) * 1000))
+        try:
+            dom = await asyncio.wait_for(
+                self.page.evaluate(DOM_SETTLE_SCRIPT, [quiet_ms, remaining_ms]),
+                timeout=remaining_ms / 1000 + 1.0
+            )
+            result["dom_quiet"] = dom.get("stable", False)
+            result["dom_quiet_ms"] = dom.get("quiet_ms")
+        except Exception as e:
+            # Navigation in progress (context destroyed) or page hung: not stable
+            logger.debug(f"⏭️ DOM settle check skipped: {str(e)[:50]}")
+            result["dom_quiet"] = False
+
+        result["stable"] = result["dom_quiet"] and result.get("network_idle", True)
+        result["elapsed_ms"] = int((time.monotonic() - start) * 1000)
+        return result
 
     def is_alive(self) -> bool:
         try:
@@ -1215,117 +3483,67 @@ class BrowserSession:
     async def get_accessibility_tree(self, include_refs: bool = True):
         """
         Get DOM tree with ref IDs (Playwright MCP style).
-        Each interactive element gets a unique ref like 'e1', 'e2', etc.
+        Each interactive element gets a stable ref like 'e3f9a1c' (v10.9.0),
+        derived from its DOM path, role and test id.
+
+        v10.10.0: Returns the cached tree while the page-side dirty counter is
+        unchanged; concurrent callers share a single in-flight extraction.
         """
         if not self.page:
             return None
 
-        # Clear refs before new snapshot
-        if include_refs:
-            self.clear_refs()
+        if self._snapshot_inflight is None or self._snapshot_inflight.done():
+            self._snapshot_inflight = asyncio.ensure_future(self._extract_accessibility_tree())
+        # shield: a cancelled caller must not cancel the extraction other callers wait on
+        with span("snapshot"):
+            return await asyncio.shield(self._snapshot_inflight)
 
+    async def _extract_accessibility_tree(self) -> Dict[str, Any]:
+        """Run the DOM extraction script (or reuse the cache) and assign refs"""
         try:
             # NOTE: We skip aria_snapshot() because it doesn't generate ref IDs.
-            # Our JavaScript fallback generates refs (e1, e2, etc.) needed for click_by_ref.
+            # Our JavaScript fallback generates the refs needed for click_by_ref.
             # The aria_snapshot is good for accessibility but lacks the ref system we need.
 
             # Extract interactive elements via JavaScript with ref IDs (Playwright MCP style)
-            raw_elements = await self.page.evaluate('''() => {
-                // Get active element for [active] attribute
-                const activeElement = document.activeElement;
-
-                // Get all interactive elements
-                const interactive = document.querySelectorAll(
-                    'a, button, input, select, textarea, ' +
-                    '[role="button"], [role="link"], [role="textbox"], [role="menuitem"], ' +
-                    '[role="tab"], [role="checkbox"], [role="radio"], [role="switch"], ' +
-                    '[role="option"], [role="combobox"], [role="listbox"], ' +
-                    '[onclick], [tabindex]:not([tabindex="-1"]), ' +
-                    'label, img[alt], [aria-label], h1, h2, h3, h4, h5, h6'
-                );
-                const elements = [];
-
-                interactive.forEach((el, index) => {
-                    const rect = el.getBoundingClientRect();
-                    const style = window.getComputedStyle(el);
-                    const isVisible = style.display !== 'none' &&
-                                     style.visibility !== 'hidden' &&
-                                     rect.width > 0 && rect.height > 0;
-
-                    if (isVisible && rect.top < window.innerHeight && rect.bottom > 0) {
-                        const tag = el.tagName.toLowerCase();
-                        const role = el.getAttribute('role') ||
-                                    (tag === 'a' ? 'link' :
-                                     tag === 'button' ? 'button' :
-                                     tag === 'input' ? (el.type === 'checkbox' ? 'checkbox' :
-                                                        el.type === 'radio' ? 'radio' : 'textbox') :
-                                     tag === 'select' ? 'combobox' :
-                                     tag === 'textarea' ? 'textbox' :
-                                     tag.match(/^h[1-6]$/) ? 'heading' : tag);
-
-                        const name = el.getAttribute('aria-label') ||
-                                    el.getAttribute('title') ||
-                                    el.getAttribute('placeholder') ||
-                                    el.getAttribute('alt') ||
-                                    (tag === 'input' && el.type === 'submit' ? el.value : null) ||
-                                    (tag === 'label' ? el.textContent?.trim().slice(0, 50) : null) ||
-                                    (tag === 'button' || tag === 'a' ? el.textContent?.trim().slice(0, 50) : null) ||
-                                    (tag.match(/^h[1-6]$/) ? el.textContent?.trim().slice(0, 50) : null);
-
-                        // Semantic attributes (Playwright MCP style)
-                        const isActive = el === activeElement;
-                        const isDisabled = el.disabled || el.getAttribute('aria-disabled') === 'true';
-                        const isChecked = el.checked === true || el.getAttribute('aria-checked') === 'true';
-                        const isExpanded = el.getAttribute('aria-expanded') === 'true';
-                        const isSelected = el.getAttribute('aria-selected') === 'true';
-                        const isRequired = el.required || el.getAttribute('aria-required') === 'true';
-                        const isReadonly = el.readOnly || el.getAttribute('aria-readonly') === 'true';
-
-                        elements.push({
-                            _index: index,
-                            tag: tag,
-                            role: role,
-                            name: name || null,
-                            text: el.textContent?.trim().slice(0, 100) || null,
-                            x: Math.round(rect.x + rect.width / 2),
-                            y: Math.round(rect.y + rect.height / 2),
-                            width: Math.round(rect.width),
-                            height: Math.round(rect.height),
-                            top: Math.round(rect.top),
-                            left: Math.round(rect.left),
-                            id: el.id || null,
-                            className: el.className || null,
-                            testId: el.getAttribute('data-testid') || null,
-                            value: el.value || null,
-                            type: el.type || null,
-                            href: el.href || null,
-                            // Semantic attributes
-                            active: isActive,
-                            disabled: isDisabled,
-                            checked: isChecked,
-                            expanded: isExpanded,
-                            selected: isSelected,
-                            required: isRequired,
-                            readonly: isReadonly,
-                        });
-                    }
-                });
-
-                return {
-                    url: window.location.href,
-                    title: document.title,
-                    viewport: { width: window.innerWidth, height: window.innerHeight },
-                    elements: elements
-                };
-            }''')
-
-            # Assign refs to each element and store mapping
+            # v10.10.0: Pass the cached token - the page answers "unchanged" without scanning
+            page = self.page
+            started = time.perf_counter()
+            cached = self._snapshot_cache if self._snapshot_cache and self._snapshot_cache[0] is page else None
+            raw_elements = await page.evaluate(DOM_EXTRACTION_SCRIPT, cached[1] if cached else None)
+            if raw_elements.get('unchanged') and cached:
+                SNAPSHOT_SECONDS.labels("cached").observe(time.perf_counter() - started)
+                return {**cached[2], 'cached': True}
+            if not raw_elements.get('token'):
+                # Observer missing (page loaded before the init script) - install for next time
+                await page.evaluate(DOM_OBSERVER_SCRIPT)
+                self._snapshot_cache = None
+
+            # v10.9.0: Refs belong to a URL - a navigation invalidates all of them
+            url = raw_elements.get('url')
+            if url != self._refs_url:
+                self.clear_refs()
+                self._refs_url = url
+
+            # Assign stable refs to each element (v10.8.0: lines keyed by ref for diffs)
             elements_with_refs = []
+            snapshot_lines: Dict[str, str] = {}
             for el in raw_elements.get('elements', []):
-                ref = self._generate_ref()
+                ref = self._generate_ref(self._element_key(el), snapshot_lines.keys())
                 el['ref'] = ref
-                # Store in ref map for later lookup
-                self._element_refs[ref] = {
+                elements_with_refs.append(el)
+                snapshot_lines[ref] = self._format_snapshot_line(el)
+
+            # Build text representation (like Playwright MCP)
+            text_snapshot = "\n".join(snapshot_lines.values())
+            generation = self._record_snapshot(url, snapshot_lines)
+
+            # v10.9.0: Update the ref map incrementally instead of rebuilding it
+            token = raw_elements.get('token')
+            for entry in self._element_refs.values():
+                entry['in_snapshot'] = False
+            for el in elements_with_refs:
+                self._element_refs[el['ref']] = {
                     'x': el['x'],
                     'y': el['y'],
                     'width': el['width'],
@@ -1334,21 +3552,30 @@ class BrowserSession:
                     'role': el['role'],
                     'name': el['name'],
                     'selector': self._build_selector(el),
+                    'in_snapshot': True,
+                    'last_seen': generation,
+                    'token': token,  # v10.13.0: page state the x/y belong to
                 }
-                elements_with_refs.append(el)
-
-            # Build text representation (like Playwright MCP)
-            text_snapshot = self._build_text_snapshot(elements_with_refs)
+            expired = [ref for ref, entry in self._element_refs.items()
+                       if generation - entry['last_seen'] > REF_RETENTION_GENERATIONS]
+            for ref in expired:
+                del self._element_refs[ref]
 
-            return {
+            tree = {
                 'type': 'interactive_elements_with_refs',
                 'url': raw_elements.get('url'),
                 'title': raw_elements.get('title'),
                 'viewport': raw_elements.get('viewport'),
                 'elements': elements_with_refs,
                 'text_snapshot': text_snapshot,
-                'ref_count': len(elements_with_refs)
+                'ref_count': len(elements_with_refs),
+                'generation': generation
             }
+            self._snapshot_cache = (page, token, tree) if token else None
+            # v10.29.0
+            SNAPSHOT_SECONDS.labels("full").observe(time.perf_counter() - started)
+            SNAPSHOT_BYTES.observe(len(text_snapshot.encode("utf-8")))
+            return tree
 
         except Exception as e:
             # Navigation-related errors are expected and not critical
@@ -1361,6 +3588,9 @@ class BrowserSession:
 
     def _build_selector(self, el: Dict) -> str:
         """Build a CSS selector for the element"""
+        # v10.9.0: The DOM path is unique on the page (needed by the ref fallback)
+        if el.get('path'):
+            return el['path']
         if el.get('id'):
             return f"#{el['id']}"
         if el.get('testId'):
@@ -1371,56 +3601,63 @@ class BrowserSession:
             return f"{el['tag']}:has-text(\"{name}\")"
         return f"{el.get('tag', 'div')}"
 
+    def _element_key(self, el: Dict) -> str:
+        """
+        Identity of an element across snapshots (v10.9.0): DOM path, role and test id.
+        The accessible name is deliberately excluded so a relabelled button
+        keeps its ref and shows up as "changed" in snapshot diffs.
+        """
+        return "|".join(str(el.get(k) or '') for k in ('path', 'role', 'testId'))
+
     def _build_text_snapshot(self, elements: List[Dict]) -> str:
         """
         Build text representation of the page (Playwright MCP style).
         Format: - role "name" [attr1] [attr2] [ref=eN]: value
         """
-        lines = []
-        for el in elements:
-            ref = el.get('ref', '?')
-            role = el.get('role', el.get('tag', '?'))
-            name = el.get('name') or ''
-            if name:
-                name = name[:40]
-
-            # Build attributes list (Playwright MCP style)
-            attrs = []
-            if el.get('active'):
-                attrs.append('[active]')
-            if el.get('disabled'):
-                attrs.append('[disabled]')
-            if el.get('checked'):
-                attrs.append('[checked]')
-            if el.get('expanded'):
-                attrs.append('[expanded]')
-            if el.get('selected'):
-                attrs.append('[selected]')
-            if el.get('required'):
-                attrs.append('[required]')
-            if el.get('readonly'):
-                attrs.append('[readonly]')
-
-            # Add ref at the end of attributes
-            attrs.append(f'[ref={ref}]')
-            attrs_str = ' '.join(attrs)
-
-            # Get value for inputs (shown after colon)
-            value = el.get('value', '')
-            if value and role in ('textbox', 'combobox', 'checkbox', 'radio'):
-                value = str(value)[:30]
-
-            # Format: - role "name" [attr1] [ref=eN]: value
-            if name and value:
-                lines.append(f'- {role} "{name}" {attrs_str}: {value}')
-            elif name:
-                lines.append(f'- {role} "{name}" {attrs_str}')
-            elif value:
-                lines.append(f'- {role} {attrs_str}: {value}')
-            else:
-                lines.append(f'- {role} {attrs_str}')
-
-        return "\n".join(lines)
+        return "\n".join(self._format_snapshot_line(el) for el in elements)
+
+    def _format_snapshot_line(self, el: Dict) -> str:
+        """Format a single element as a snapshot line"""
+        ref = el.get('ref', '?')
+        role = el.get('role', el.get('tag', '?'))
+        name = el.get('name') or ''
+        if name:
+            name = name[:40]
+
+        # Build attributes list (Playwright MCP style)
+        attrs = []
+        if el.get('active'):
+            attrs.append('[active]')
+        if el.get('disabled'):
+            attrs.append('[disabled]')
+        if el.get('checked'):
+            attrs.append('[checked]')
+        if el.get('expanded'):
+            attrs.append('[expanded]')
+        if el.get('selected'):
+            attrs.append('[selected]')
+        if el.get('required'):
+            attrs.append('[required]')
+        if el.get('readonly'):
+            attrs.append('[readonly]')
+
+        # Add ref at the end of attributes
+        attrs.append(f'[ref={ref}]')
+        attrs_str = ' '.join(attrs)
+
+        # Get value for inputs (shown after colon)
+        value = el.get('value', '')
+        if value and role in ('textbox', 'combobox', 'checkbox', 'radio'):
+            value = str(value)[:30]
+
+        # Format: - role "name" [attr1] [ref=eN]: value
+        if name and value:
+            return f'- {role} "{name}" {attrs_str}: {value}'
+        elif name:
+            return f'- {role} "{name}" {attrs_str}'
+        elif value:
+            return f'- {role} {attrs_str}: {value}'
+        return f'- {role} {attrs_str}'
     
     async def get_element_rect(self, req: ElementRectRequest) -> ElementRectResponse:
         if not self.page:
@@ -1485,17 +3722,84 @@ class BrowserSession:
             return ElementRectResponse(success=False, error=str(e))
 
 class SessionManager:
-    def __init__(self):
+    def __init__(self, pool: SharedBrowserPool):
         self.sessions: Dict[str, BrowserSession] = {}
         self._lock = asyncio.Lock()
-    
-    async def create_session(self, start_url: Optional[str] = None, headless: bool = False) -> str:
+        # v10.31.0: Shared browser for concurrent sessions + who holds BROWSER_PROFILE_DIR
+        self.pool = pool
+        self._profile_owner: Optional[str] = None
+        # Resolves to the owner's context once it is up (None if its launch failed)
+        self._profile_ready: Optional[asyncio.Future] = None
+        # Held while anything launches on BROWSER_PROFILE_DIR (persistent start, headless export)
+        self._profile_launch_lock = asyncio.Lock()
+
+    @staticmethod
+    def _new_session_id() -> str:
+        # v10.31.0: uuid suffix - sessions started in the same second no longer collide
+        return f"session-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+    async def create_session(self, start_url: Optional[str] = None, headless: bool = False,
+                             snapshot_policy: str = "full", backend: Optional[str] = None) -> str:
+        """
+        v10.31.0: backend "persistent" uses the profile itself (one session at a
+        time), "shared" an isolated context in the shared browser, "auto" (default,
+        SESSION_BACKEND) the profile when it is free. Raises ValueError when the
+        profile is requested but held by another session.
+        """
+        backend = backend or SESSION_BACKEND
         async with self._lock:
-            sid = f"session-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            session = BrowserSession(sid)
-            await session.start(start_url, headless)
-            self.sessions[sid] = session
-            return sid
+            owner = self.sessions.get(self._profile_owner) if self._profile_owner else None
+            if owner is not None and not owner.is_alive():
+                # Profile window closed by hand: release the profile lock
+                self.sessions.pop(owner.session_id, None)
+                await owner.stop()
+                self._profile_owner, self._profile_ready = None, None
+            if backend == "auto":
+                backend = "shared" if self._profile_owner else "persistent"
+            if backend == "persistent" and self._profile_owner:
+                raise ValueError(f"Browser profile in use by {self._profile_owner} - start with backend 'shared'")
+            sid = self._new_session_id()
+            if backend == "persistent":
+                self._profile_owner = sid
+                self._profile_ready = asyncio.get_running_loop().create_future()
+            profile_ready = self._profile_ready
+
+        # Started outside the lock: shared contexts come up in parallel
+        session = BrowserSession(sid)
+        session.snapshot_policy = snapshot_policy
+        try:
+            if backend == "shared":
+                state = await self._shared_storage_state(profile_ready)
+                await session.start(start_url, headless, pool=self.pool, storage_state=state)
+            else:
+                async with self._profile_launch_lock:
+                    await session.start(start_url, headless)
+                profile_ready.set_result(session.context)
+        except BaseException:
+            try:
+                await session.stop()
+            except Exception:
+                pass
+            if self._profile_owner == sid:
+                self._profile_owner, self._profile_ready = None, None
+            if backend == "persistent" and not profile_ready.done():
+                profile_ready.set_result(None)  # Waiting shared sessions fall back to the last export
+            raise
+        self.sessions[sid] = session
+        return sid
+
+    async def _shared_storage_state(self, profile_ready: Optional[asyncio.Future]) -> Optional[str]:
+        """
+        storage_state for a new shared context. The profile is launched headless
+        only when no session holds it or is launching on it; otherwise the export
+        comes from the owner's context, once its launch has finished.
+        """
+        if profile_ready is not None:
+            context = await asyncio.shield(profile_ready)
+            return await self.pool.storage_state(source=context)
+        async with self._profile_launch_lock:
+            # A persistent start reserved meanwhile waits on this lock, but stays off its profile
+            return await self.pool.storage_state(launch_profile=self._profile_owner is None)
     
     def get_session(self, sid: str):
         return self.sessions.get(sid)
@@ -1504,7 +3808,12 @@ class SessionManager:
         async with self._lock:
             session = self.sessions.pop(sid, None)
             if session:
+                if session.backend == "persistent" and session.is_alive():
+                    # v10.31.0: Latest logins for the next shared contexts
+                    await self.pool.storage_state(source=session.context, refresh=True)
                 await session.stop()
+                if self._profile_owner == sid:
+                    self._profile_owner, self._profile_ready = None, None
                 return True
             return False
     
@@ -1517,7 +3826,9 @@ class SessionManager:
     def count(self) -> int:
         return len([s for s in self.sessions.values() if s.is_alive()])
 
-session_manager = SessionManager()
+shared_browsers = SharedBrowserPool()  # v10.31.0
+session_manager = SessionManager(shared_browsers)
+BROWSER_SESSIONS.set_function(session_manager.count)
 
 # ============================================================================
 # FASTAPI APP
@@ -1530,7 +3841,7 @@ app = FastAPI(title="Tool Server", version=SERVICE_VERSION)
 # ──────────────────────────────────────────────────────────────────────────────
 
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response, JSONResponse
+from starlette.responses import Response, JSONResponse, StreamingResponse
 
 # Lista di origini autorizzate - SOLO queste possono fare richieste
 ALLOWED_ORIGINS = [
@@ -1586,7 +3897,13 @@ class SecureCORSMiddleware(BaseHTTPMiddleware):
         cors_headers = {
             "Access-Control-Allow-Origin": origin,  # Echo dell'origine specifica, non *
             "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS, PATCH",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Tool-Token",
+            "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Tool-Token, If-None-Match",
+            # v10.16.0: Screenshot metadata headers of binary responses + snapshot ETag
+            "Access-Control-Expose-Headers": "ETag, X-Success, X-Image-Width, X-Image-Height, X-Source-Width, "
+                                             "X-Source-Height, X-Image-Scale-X, X-Image-Scale-Y, X-Lux-Scale-X, "
+                                             "X-Lux-Scale-Y, X-Capture-Ms, "
+                                             "X-Encode-Ms, X-Snapshot-Generation, X-Phash, X-Unchanged, "
+                                             "X-Phash-Distance, Server-Timing",
             "Access-Control-Allow-Credentials": "true",
             "Access-Control-Max-Age": "86400",
         }
@@ -1629,6 +3946,10 @@ class AuthMiddleware(BaseHTTPMiddleware):
         # TUTTE le richieste a endpoint sensibili richiedono token
         # (protegge da attacchi via curl/ngrok senza Origin header)
         provided_token = request.headers.get("x-tool-token", "")
+        # v10.18.0: <img src> / EventSource cannot set headers - screencast accepts ?token=
+        # v10.28.0: ...and so does /logs/stream, v10.29.0: ...and /metrics (Prometheus scrape params)
+        if not provided_token and (path.startswith("/browser/screencast/") or path in ("/logs/stream", "/metrics")):
+            provided_token = request.query_params.get("token", "")
 
         if not SECURITY_TOKEN:
             # Token non ancora generato (startup race condition) - permetti
@@ -1646,17 +3967,64 @@ class AuthMiddleware(BaseHTTPMiddleware):
 # Aggiungi auth middleware (eseguito DOPO CORS)
 app.add_middleware(AuthMiddleware)
 
+
+class TraceMiddleware:
+    """
+    v10.30.0: Opens the request Trace that span() records into (pure ASGI, so
+    the contextvar is set before the BaseHTTPMiddleware tasks copy the context).
+    With TOOL_SERVER_TRACE_FILE=1 every request that recorded spans is appended
+    to spans.jsonl by trace_writer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = Trace(f"{scope.get('method', '')} {scope.get('path', '')}")
+        token = _current_trace.set(trace)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            if trace_writer is not None and trace.spans:
+                trace_writer.write_json({**trace.to_dict(), "status": status["code"]})
+
+
+app.add_middleware(TraceMiddleware)
+# v10.29.0: Outermost - times every request, 401/403 included
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
 @app.get("/")
 async def root():
     return {"service": "Tool Server", "version": SERVICE_VERSION, "ngrok_url": NGROK_PUBLIC_URL}
 
+@app.get("/metrics")
+async def get_metrics():
+    """v10.29.0: Prometheus metrics (scrape with ?token=<X-Tool-Token> or the header)"""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/status")
 async def get_status():
     return {
         "status": "running",
         "version": SERVICE_VERSION,
         "browser_sessions": session_manager.count(),
+        "shared_browsers": shared_browsers.status(),  # v10.31.0
         "capabilities": {"pyautogui": PYAUTOGUI_AVAILABLE, "pyperclip": PYPERCLIP_AVAILABLE, "playwright": PLAYWRIGHT_AVAILABLE, "pil": PIL_AVAILABLE, "ngrok": PYNGROK_AVAILABLE},
+        "desktop_backend": desktop.backend.name if desktop.available else None,  # v10.19.0
+        "clawdbot": clawdbot_notifier.status(),  # v10.20.0
+        "browser_console_log": browser_console_sink.status(),  # v10.26.0
+        "span_trace_file": trace_writer.status() if trace_writer else None,  # v10.30.0
         "viewport": {"width": VIEWPORT_WIDTH, "height": VIEWPORT_HEIGHT},
         "ngrok_url": NGROK_PUBLIC_URL,
         "references": {"lux_sdk": {"width": LUX_SDK_WIDTH, "height": LUX_SDK_HEIGHT}, "gemini_recommended": {"width": GEMINI_RECOMMENDED_WIDTH, "height": GEMINI_RECOMMENDED_HEIGHT}, "normalized_range": {"min": 0, "max": 999}},
@@ -1728,33 +4096,69 @@ async def auto_pair(req: AutoPairRequest):
         }
 
 @app.post("/screenshot", response_model=ScreenshotResponse)
-async def take_screenshot(req: ScreenshotRequest):
+async def take_screenshot(req: ScreenshotRequest, request: Request = None):
     try:
+        # v10.15.0: Encoding options (format/quality/scale/clip/full_page)
+        opts = ScreenshotOptions(format=req.format, quality=req.quality, scale=req.scale,
+                                 max_width=req.max_width, clip=req.clip, full_page=req.full_page)
+        if req.include_gemini_resize and not opts.max_width:
+            opts.max_width = GEMINI_RECOMMENDED_WIDTH
+
         if req.scope == "browser":
             session = session_manager.get_session(req.session_id) if req.session_id else session_manager.get_active_session()
             if not session or not session.is_alive():
                 return ScreenshotResponse(success=False, error="No active browser session")
             
-            data = await session.page.screenshot(type="png")
-            vp = await session.page.evaluate("() => ({w: window.innerWidth, h: window.innerHeight})")
+            shot = await capture_screenshot(session, "browser", opts)
             
-            resp = ScreenshotResponse(success=True, image_base64=base64.b64encode(data).decode(), width=vp['w'], height=vp['h'])
+            resp = ScreenshotResponse(success=True, width=shot.width, height=shot.height)
             if req.include_lux_metadata:
-                resp.lux_scale_x = resp.lux_scale_y = 1.0
-            logger.info(f"📸 Screenshot: {vp['w']}×{vp['h']}")
-            return resp
+                resp.lux_scale_x, resp.lux_scale_y = VIEWPORT_WIDTH / LUX_SDK_WIDTH, VIEWPORT_HEIGHT / LUX_SDK_HEIGHT
         
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
-            shot = pyautogui.screenshot()
-            buf = io.BytesIO()
-            shot.save(buf, format='PNG')
-            sw, sh = pyautogui.size()
-            return ScreenshotResponse(success=True, image_base64=base64.b64encode(buf.getvalue()).decode(), width=sw, height=sh, lux_scale_x=sw/LUX_SDK_WIDTH, lux_scale_y=sh/LUX_SDK_HEIGHT)
+        elif req.scope == "desktop" and desktop.available:
+            shot = await capture_screenshot(None, "desktop", opts)
+            sw, sh = await desktop.run("size")
+            resp = ScreenshotResponse(success=True, width=shot.width, height=shot.height,
+                                      lux_scale_x=sw/LUX_SDK_WIDTH, lux_scale_y=sh/LUX_SDK_HEIGHT)
+        else:
+            return ScreenshotResponse(success=False, error="Invalid scope or PyAutoGUI not available")
+        # Downscale (scale/max_width) reported apart from the Lux scale
+        resp.image_scale_x, resp.image_scale_y = round(shot.scale_x, 4), round(shot.scale_y, 4)
+
+        # v10.17.0: Perceptual hash + "unchanged" short response
+        if PIL_AVAILABLE:
+            if req.scope == "browser":
+                resp.phash = await session.screenshot_phash(shot.data)
+            else:
+                resp.phash = await asyncio.get_running_loop().run_in_executor(
+                    _screenshot_executor, compute_dhash, shot.data)
+            if req.if_changed_since:
+                resp.distance = dhash_distance(resp.phash, req.if_changed_since)
+                resp.unchanged = resp.distance is not None and resp.distance <= req.change_threshold
+                if resp.unchanged:
+                    logger.info(f"📸 Screenshot unchanged (distance {resp.distance})")
+                    # Raw/multipart clients expect image bytes: 304 + headers, JSON clients the short body
+                    if request is not None and _preferred_transport(request.headers.get("accept", "")) != "json":
+                        return Response(status_code=304, headers={
+                            "X-Phash": resp.phash,
+                            "X-Unchanged": "true",
+                            "X-Phash-Distance": str(resp.distance),
+                        })
+                    return resp
+
+        resp._image = shot  # v10.16.0: encoded by negotiate_response() (JSON/raw/multipart)
+        resp.media_type = shot.media_type
+        resp.bytes = len(shot.data)
+        resp.source_width, resp.source_height = shot.source_width, shot.source_height
+        resp.timings = {"capture": shot.capture_ms, "encode": shot.encode_ms}
+        logger.info(f"📸 Screenshot: {shot.width}×{shot.height} {req.format} {len(shot.data) // 1024}KB "
+                    f"(capture {shot.capture_ms}ms, encode {shot.encode_ms}ms)")
+        return negotiate_response(request, resp)
     except Exception as e:
         return ScreenshotResponse(success=False, error=str(e))
 
 @app.post("/click", response_model=ActionResponse)
-async def do_click(req: ClickRequest):
+async def do_click(req: ClickRequest, request: Request = None):
     try:
         x, y = req.x, req.y
         session = None
@@ -1772,60 +4176,47 @@ async def do_click(req: ClickRequest):
             click_desc = f"{req.click_type} click" if req.click_type != "single" else "click"
             send_clawdbot_message(f"Clicking at ({x}, {y})...")
 
-            if req.click_type == "double":
-                await session.page.mouse.dblclick(x, y)
-            elif req.click_type == "triple":
-                await session.page.mouse.click(x, y, click_count=3)
-            elif req.click_type == "right":
-                await session.page.mouse.click(x, y, button="right")
-            else:
-                await session.page.mouse.click(x, y)
+            with span("action"):
+                if req.click_type == "double":
+                    await session.page.mouse.dblclick(x, y)
+                elif req.click_type == "triple":
+                    await session.page.mouse.click(x, y, click_count=3)
+                elif req.click_type == "right":
+                    await session.page.mouse.click(x, y, button="right")
+                else:
+                    await session.page.mouse.click(x, y)
 
             logger.info(f"🖱️ Click: ({x}, {y}) [{req.click_type}]")
             send_clawdbot_message(f"Clicked at ({x}, {y})", "success")
             response = ActionResponse(success=True, executed_with="playwright", details={"x": x, "y": y, "click_type": req.click_type})
 
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
-            sw, sh = pyautogui.size()
+        elif req.scope == "desktop" and desktop.available:
+            sw, sh = await desktop.run("size")
             if req.coordinate_origin == "normalized":
                 x, y = CoordinateConverter.normalized_to_screen(x, y, sw, sh)
             elif req.coordinate_origin == "lux_sdk":
                 x, y = CoordinateConverter.lux_sdk_to_screen(x, y, sw, sh)
 
-            if req.click_type == "double":
-                pyautogui.doubleClick(x, y)
-            elif req.click_type == "triple":
-                pyautogui.tripleClick(x, y)
-            elif req.click_type == "right":
-                pyautogui.rightClick(x, y)
-            else:
-                pyautogui.click(x, y)
+            with span("action"):
+                await desktop.run("click", x, y, req.click_type)
 
-            response = ActionResponse(success=True, executed_with="pyautogui", details={"x": x, "y": y, "click_type": req.click_type})
+            response = ActionResponse(success=True, executed_with=desktop.backend.name, details={"x": x, "y": y, "click_type": req.click_type})
         else:
             return ActionResponse(success=False, error="Invalid scope or PyAutoGUI not available")
 
         # v9.0.0: Auto-screenshot after action (optional)
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, req.scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
-
         # v10.2.0: ALWAYS include snapshot for browser actions (Playwright MCP style)
-        if session and session.is_alive():
-            snap, snap_url, snap_title, snap_count = await take_auto_snapshot(session)
-            response.snapshot = snap
-            response.snapshot_url = snap_url
-            response.snapshot_title = snap_title
-            response.snapshot_ref_count = snap_count
+        # v10.12.0: One settle, then screenshot + snapshot captured concurrently
+        await capture_after_action(response, session, req.scope, req.include_screenshot,
+                                   screenshot_options=req.screenshot_options,
+                                   snapshot_since=req.snapshot_since, snapshot_policy=req.snapshot)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/type", response_model=ActionResponse)
-async def do_type(req: TypeRequest):
+async def do_type(req: TypeRequest, request: Request = None):
     try:
         session = None
         if req.scope == "browser":
@@ -1838,38 +4229,32 @@ async def do_type(req: TypeRequest):
             text_preview = req.text[:30] + "..." if len(req.text) > 30 else req.text
             send_clawdbot_message(f"Typing: \"{text_preview}\"...")
 
-            if req.selector:
-                await session.page.click(req.selector)
-            await session.page.keyboard.type(req.text, delay=50)
+            with span("action"):
+                if req.selector:
+                    await session.page.click(req.selector)
+                await session.page.keyboard.type(req.text, delay=50)
             logger.info(f"⌨️ Type: '{req.text[:20]}...'")
             send_clawdbot_message(f"Typed {len(req.text)} characters", "success")
             response = ActionResponse(success=True, executed_with="playwright")
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
-            type_via_clipboard(req.text) if req.method == "clipboard" else pyautogui.typewrite(req.text)
-            response = ActionResponse(success=True, executed_with="pyautogui")
+        elif req.scope == "desktop" and desktop.available:
+            with span("action"):
+                await desktop.run("type_text", req.text, req.method)
+            response = ActionResponse(success=True, executed_with=desktop.backend.name)
         else:
             return ActionResponse(success=False, error="Invalid scope")
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, req.scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
-
         # v10.2.0: ALWAYS include snapshot for browser actions (Playwright MCP style)
-        if session and session.is_alive():
-            snap, snap_url, snap_title, snap_count = await take_auto_snapshot(session)
-            response.snapshot = snap
-            response.snapshot_url = snap_url
-            response.snapshot_title = snap_title
-            response.snapshot_ref_count = snap_count
+        # v10.12.0: One settle, then screenshot + snapshot captured concurrently
+        await capture_after_action(response, session, req.scope, req.include_screenshot,
+                                   screenshot_options=req.screenshot_options,
+                                   snapshot_since=req.snapshot_since, snapshot_policy=req.snapshot)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/scroll", response_model=ActionResponse)
-async def do_scroll(req: ScrollRequest):
+async def do_scroll(req: ScrollRequest, request: Request = None):
     try:
         session = None
         if req.scope == "browser":
@@ -1877,80 +4262,68 @@ async def do_scroll(req: ScrollRequest):
             if not session or not session.is_alive():
                 return ActionResponse(success=False, error="No active browser session")
             dx, dy = (0, -req.amount) if req.direction == "up" else (0, req.amount) if req.direction == "down" else (-req.amount, 0) if req.direction == "left" else (req.amount, 0)
-            await session.page.mouse.wheel(dx, dy)
+            with span("action"):
+                await session.page.mouse.wheel(dx, dy)
             logger.info(f"📜 Scroll: {req.direction}")
             response = ActionResponse(success=True, executed_with="playwright")
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
+        elif req.scope == "desktop" and desktop.available:
             clicks = req.amount // 100
-            pyautogui.scroll(clicks if req.direction == "up" else -clicks)
-            response = ActionResponse(success=True, executed_with="pyautogui")
+            with span("action"):
+                await desktop.run("scroll", clicks if req.direction == "up" else -clicks)
+            response = ActionResponse(success=True, executed_with=desktop.backend.name)
         else:
             return ActionResponse(success=False, error="Invalid scope")
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, req.scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
-
         # v10.2.0: ALWAYS include snapshot for browser actions (Playwright MCP style)
-        if session and session.is_alive():
-            snap, snap_url, snap_title, snap_count = await take_auto_snapshot(session)
-            response.snapshot = snap
-            response.snapshot_url = snap_url
-            response.snapshot_title = snap_title
-            response.snapshot_ref_count = snap_count
+        # v10.12.0: One settle, then screenshot + snapshot captured concurrently
+        await capture_after_action(response, session, req.scope, req.include_screenshot,
+                                   screenshot_options=req.screenshot_options,
+                                   snapshot_since=req.snapshot_since, snapshot_policy=req.snapshot)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/keypress", response_model=ActionResponse)
-async def do_keypress(req: KeypressRequest):
+async def do_keypress(req: KeypressRequest, request: Request = None):
     try:
         session = None
         if req.scope == "browser":
             session = session_manager.get_session(req.session_id) if req.session_id else session_manager.get_active_session()
             if not session or not session.is_alive():
                 return ActionResponse(success=False, error="No active browser session")
-            if "+" in req.key:
-                keys = req.key.split("+")
-                for k in keys[:-1]:
-                    await session.page.keyboard.down(k)
-                await session.page.keyboard.press(keys[-1])
-                for k in reversed(keys[:-1]):
-                    await session.page.keyboard.up(k)
-            else:
-                await session.page.keyboard.press(req.key)
+            with span("action"):
+                if "+" in req.key:
+                    keys = req.key.split("+")
+                    for k in keys[:-1]:
+                        await session.page.keyboard.down(k)
+                    await session.page.keyboard.press(keys[-1])
+                    for k in reversed(keys[:-1]):
+                        await session.page.keyboard.up(k)
+                else:
+                    await session.page.keyboard.press(req.key)
             logger.info(f"⌨️ Key: {req.key}")
             response = ActionResponse(success=True, executed_with="playwright")
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
-            pyautogui.hotkey(*req.key.lower().split("+")) if "+" in req.key else pyautogui.press(req.key.lower())
-            response = ActionResponse(success=True, executed_with="pyautogui")
+        elif req.scope == "desktop" and desktop.available:
+            with span("action"):
+                await desktop.run("press", req.key.lower())
+            response = ActionResponse(success=True, executed_with=desktop.backend.name)
         else:
             return ActionResponse(success=False, error="Invalid scope")
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, req.scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
-
         # v10.2.0: ALWAYS include snapshot for browser actions (Playwright MCP style)
-        if session and session.is_alive():
-            snap, snap_url, snap_title, snap_count = await take_auto_snapshot(session)
-            response.snapshot = snap
-            response.snapshot_url = snap_url
-            response.snapshot_title = snap_title
-            response.snapshot_ref_count = snap_count
+        # v10.12.0: One settle, then screenshot + snapshot captured concurrently
+        await capture_after_action(response, session, req.scope, req.include_screenshot,
+                                   screenshot_options=req.screenshot_options,
+                                   snapshot_since=req.snapshot_since, snapshot_policy=req.snapshot)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 # v9.0.0: New endpoints for Claude Computer Use compatibility
 @app.post("/hold_key", response_model=ActionResponse)
-async def do_hold_key(req: HoldKeyRequest):
+async def do_hold_key(req: HoldKeyRequest, request: Request = None):
     """Hold a key down for a specified duration"""
     try:
         session = None
@@ -1961,31 +4334,32 @@ async def do_hold_key(req: HoldKeyRequest):
             session = session_manager.get_session(req.session_id) if req.session_id else session_manager.get_active_session()
             if not session or not session.is_alive():
                 return ActionResponse(success=False, error="No active browser session")
-            await session.page.keyboard.down(req.key)
-            await asyncio.sleep(req.duration)
-            await session.page.keyboard.up(req.key)
+            with span("action"):
+                await session.page.keyboard.down(req.key)
+                await asyncio.sleep(req.duration)
+                await session.page.keyboard.up(req.key)
             logger.info(f"⌨️ Hold key: {req.key} for {req.duration}s")
             response = ActionResponse(success=True, executed_with="playwright", details={"key": req.key, "duration": req.duration})
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
-            pyautogui.keyDown(req.key.lower())
-            await asyncio.sleep(req.duration)
-            pyautogui.keyUp(req.key.lower())
-            response = ActionResponse(success=True, executed_with="pyautogui", details={"key": req.key, "duration": req.duration})
+        elif req.scope == "desktop" and desktop.available:
+            with span("action"):
+                await desktop.run("key_down", req.key.lower())
+                try:
+                    await asyncio.sleep(req.duration)
+                finally:
+                    await desktop.run("key_up", req.key.lower())
+            response = ActionResponse(success=True, executed_with=desktop.backend.name, details={"key": req.key, "duration": req.duration})
         else:
             return ActionResponse(success=False, error="Invalid scope")
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, req.scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+        await capture_after_action(response, session, req.scope, req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/wait", response_model=ActionResponse)
-async def do_wait(req: WaitRequest):
+async def do_wait(req: WaitRequest, request: Request = None):
     """Wait for a specified duration (useful for letting UI settle)"""
     try:
         if req.duration > 100:
@@ -2004,12 +4378,10 @@ async def do_wait(req: WaitRequest):
                 session = session_manager.get_active_session()
 
             scope = "browser" if session and session.is_alive() else "desktop"
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+            await capture_after_action(response, session, scope, include_screenshot=True, include_snapshot=False,
+                                       screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
@@ -2032,7 +4404,7 @@ async def _retry_with_backoff(func, max_retries: int = 3, base_delay: float = 0.
     raise last_error
 
 @app.post("/click_by_ref", response_model=ActionResponse)
-async def do_click_by_ref(req: ClickByRefRequest):
+async def do_click_by_ref(req: ClickByRefRequest, request: Request = None):
     """Click element by ref ID from accessibility snapshot"""
     try:
         session = session_manager.get_session(req.session_id)
@@ -2041,11 +4413,12 @@ async def do_click_by_ref(req: ClickByRefRequest):
             return ActionResponse(success=False, error="Session not found")
 
         element = session.get_element_by_ref(req.ref)
-        if not element:
+        point = await session.resolve_ref_point(req.ref) if element else None
+        if not point:
             send_clawdbot_message(f"Element ref '{req.ref}' not found", "error")
-            return ActionResponse(success=False, error=f"Ref '{req.ref}' not found. Call /browser/dom/tree first to get fresh refs.")
+            return ActionResponse(success=False, error=f"Ref '{req.ref}' not found on the current page. Call /browser/snapshot to get current refs.")
 
-        x, y = element['x'], element['y']
+        x, y = point
 
         # Send Clawdbot message with element info
         element_name = element.get('name', element.get('role', 'element'))[:40]
@@ -2061,7 +4434,8 @@ async def do_click_by_ref(req: ClickByRefRequest):
             else:
                 await session.page.mouse.click(x, y)
 
-        await _retry_with_backoff(click_action)
+        with span("action"):
+            await _retry_with_backoff(click_action)
 
         logger.info(f"🖱️ Click by ref: {req.ref} → ({x}, {y}) [{req.click_type}]")
         send_clawdbot_message(f"Clicked: {element_name}", "success")
@@ -2071,26 +4445,18 @@ async def do_click_by_ref(req: ClickByRefRequest):
             details={"ref": req.ref, "x": x, "y": y, "click_type": req.click_type, "element": element}
         )
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, "browser")
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
-
         # v10.2.0: ALWAYS include snapshot for browser actions (Playwright MCP style)
-        if session and session.is_alive():
-            snap, snap_url, snap_title, snap_count = await take_auto_snapshot(session)
-            response.snapshot = snap
-            response.snapshot_url = snap_url
-            response.snapshot_title = snap_title
-            response.snapshot_ref_count = snap_count
+        # v10.12.0: One settle, then screenshot + snapshot captured concurrently
+        await capture_after_action(response, session, "browser", req.include_screenshot,
+                                   screenshot_options=req.screenshot_options,
+                                   snapshot_since=req.snapshot_since, snapshot_policy=req.snapshot)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/hover", response_model=ActionResponse)
-async def do_hover(req: HoverRequest):
+async def do_hover(req: HoverRequest, request: Request = None):
     """Hover over element by coordinates, ref, or selector"""
     try:
         session = None
@@ -2103,10 +4469,10 @@ async def do_hover(req: HoverRequest):
 
             # Resolve coordinates from ref or selector
             if req.ref:
-                element = session.get_element_by_ref(req.ref)
-                if not element:
+                point = await session.resolve_ref_point(req.ref)
+                if not point:
                     return ActionResponse(success=False, error=f"Ref '{req.ref}' not found")
-                x, y = element['x'], element['y']
+                x, y = point
             elif req.selector:
                 locator = session.page.locator(req.selector)
                 bbox = await locator.bounding_box()
@@ -2116,30 +4482,29 @@ async def do_hover(req: HoverRequest):
             elif x is None or y is None:
                 return ActionResponse(success=False, error="Provide x/y coordinates, ref, or selector")
 
-            await session.page.mouse.move(x, y)
-            logger.info(f"🎯 Hover: ({x}, {y})")
+            with span("action"):
+                await session.page.mouse.move(x, y)
+                logger.info(f"🎯 Hover: ({x}, {y})")
             response = ActionResponse(success=True, executed_with="playwright", details={"x": x, "y": y})
 
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
+        elif req.scope == "desktop" and desktop.available:
             if x is None or y is None:
                 return ActionResponse(success=False, error="Provide x/y coordinates for desktop")
-            pyautogui.moveTo(x, y)
-            response = ActionResponse(success=True, executed_with="pyautogui", details={"x": x, "y": y})
+            with span("action"):
+                await desktop.run("move_to", x, y)
+            response = ActionResponse(success=True, executed_with=desktop.backend.name, details={"x": x, "y": y})
         else:
             return ActionResponse(success=False, error="Invalid scope")
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, req.scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+        await capture_after_action(response, session, req.scope, req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/drag", response_model=ActionResponse)
-async def do_drag(req: DragRequest):
+async def do_drag(req: DragRequest, request: Request = None):
     """Drag from one position to another"""
     try:
         session = None
@@ -2156,17 +4521,18 @@ async def do_drag(req: DragRequest):
                 end_x, end_y = CoordinateConverter.normalized_to_viewport(end_x, end_y)
 
             # Perform drag
-            await session.page.mouse.move(start_x, start_y)
-            await session.page.mouse.down()
-            await session.page.mouse.move(end_x, end_y, steps=10)  # Smooth drag
-            await session.page.mouse.up()
+            with span("action"):
+                await session.page.mouse.move(start_x, start_y)
+                await session.page.mouse.down()
+                await session.page.mouse.move(end_x, end_y, steps=10)  # Smooth drag
+                await session.page.mouse.up()
 
             logger.info(f"🎯 Drag: ({start_x},{start_y}) → ({end_x},{end_y})")
             response = ActionResponse(success=True, executed_with="playwright",
                                       details={"start": {"x": start_x, "y": start_y}, "end": {"x": end_x, "y": end_y}})
 
-        elif req.scope == "desktop" and PYAUTOGUI_AVAILABLE:
-            sw, sh = pyautogui.size()
+        elif req.scope == "desktop" and desktop.available:
+            sw, sh = await desktop.run("size")
             if req.coordinate_origin == "normalized":
                 start_x, start_y = CoordinateConverter.normalized_to_screen(start_x, start_y, sw, sh)
                 end_x, end_y = CoordinateConverter.normalized_to_screen(end_x, end_y, sw, sh)
@@ -2174,25 +4540,22 @@ async def do_drag(req: DragRequest):
                 start_x, start_y = CoordinateConverter.lux_sdk_to_screen(start_x, start_y, sw, sh)
                 end_x, end_y = CoordinateConverter.lux_sdk_to_screen(end_x, end_y, sw, sh)
 
-            pyautogui.moveTo(start_x, start_y)
-            pyautogui.drag(end_x - start_x, end_y - start_y, duration=0.5)
-            response = ActionResponse(success=True, executed_with="pyautogui",
+            with span("action"):
+                await desktop.run("drag", start_x, start_y, end_x, end_y, 0.5)
+            response = ActionResponse(success=True, executed_with=desktop.backend.name,
                                       details={"start": {"x": start_x, "y": start_y}, "end": {"x": end_x, "y": end_y}})
         else:
             return ActionResponse(success=False, error="Invalid scope")
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, req.scope)
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+        await capture_after_action(response, session, req.scope, req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/select_option", response_model=ActionResponse)
-async def do_select_option(req: SelectOptionRequest):
+async def do_select_option(req: SelectOptionRequest, request: Request = None):
     """Select option from dropdown"""
     try:
         session = session_manager.get_session(req.session_id)
@@ -2212,31 +4575,29 @@ async def do_select_option(req: SelectOptionRequest):
             return ActionResponse(success=False, error="Provide ref or selector")
 
         # Select option
-        if req.value is not None:
-            await locator.select_option(value=req.value)
-        elif req.label is not None:
-            await locator.select_option(label=req.label)
-        elif req.index is not None:
-            await locator.select_option(index=req.index)
-        else:
+        if req.value is None and req.label is None and req.index is None:
             return ActionResponse(success=False, error="Provide value, label, or index")
+        with span("action"):
+            if req.value is not None:
+                await locator.select_option(value=req.value)
+            elif req.label is not None:
+                await locator.select_option(label=req.label)
+            else:
+                await locator.select_option(index=req.index)
 
         logger.info(f"📋 Select option: {req.value or req.label or f'index {req.index}'}")
         response = ActionResponse(success=True, executed_with="playwright",
                                   details={"value": req.value, "label": req.label, "index": req.index})
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, "browser")
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+        await capture_after_action(response, session, "browser", req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/file_upload", response_model=ActionResponse)
-async def do_file_upload(req: FileUploadRequest):
+async def do_file_upload(req: FileUploadRequest, request: Request = None):
     """Upload file to input element"""
     try:
         session = session_manager.get_session(req.session_id)
@@ -2261,24 +4622,22 @@ async def do_file_upload(req: FileUploadRequest):
             # Try to find file input
             locator = session.page.locator('input[type="file"]').first
 
-        await locator.set_input_files(str(file_path))
+        with span("action"):
+            await locator.set_input_files(str(file_path))
 
         logger.info(f"📁 File upload: {file_path.name}")
         response = ActionResponse(success=True, executed_with="playwright",
                                   details={"file": str(file_path), "name": file_path.name})
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, "browser")
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+        await capture_after_action(response, session, "browser", req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/wait_for_selector", response_model=ActionResponse)
-async def do_wait_for_selector(req: WaitForSelectorRequest):
+async def do_wait_for_selector(req: WaitForSelectorRequest, request: Request = None):
     """Wait for element to appear/disappear (smart waiting)"""
     try:
         session = session_manager.get_session(req.session_id)
@@ -2291,13 +4650,10 @@ async def do_wait_for_selector(req: WaitForSelectorRequest):
         response = ActionResponse(success=True, executed_with="playwright",
                                   details={"selector": req.selector, "state": req.state})
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, "browser")
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+        await capture_after_action(response, session, "browser", req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
     except Exception as e:
         # Timeout is expected in some cases
         if "Timeout" in str(e):
@@ -2306,7 +4662,7 @@ async def do_wait_for_selector(req: WaitForSelectorRequest):
         return ActionResponse(success=False, error=str(e))
 
 @app.post("/wait_for_load_state", response_model=ActionResponse)
-async def do_wait_for_load_state(req: WaitForLoadStateRequest):
+async def do_wait_for_load_state(req: WaitForLoadStateRequest, request: Request = None):
     """Wait for page load state (smart waiting)"""
     try:
         session = session_manager.get_session(req.session_id)
@@ -2319,21 +4675,161 @@ async def do_wait_for_load_state(req: WaitForLoadStateRequest):
         response = ActionResponse(success=True, executed_with="playwright",
                                   details={"state": req.state})
 
-        if req.include_screenshot:
-            ss_b64, ss_w, ss_h = await take_auto_screenshot(session, "browser")
-            response.screenshot_base64 = ss_b64
-            response.screenshot_width = ss_w
-            response.screenshot_height = ss_h
+        await capture_after_action(response, session, "browser", req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
 
-        return response
+        return negotiate_response(request, response)
+    except Exception as e:
+        return ActionResponse(success=False, error=str(e))
+
+@app.post("/browser/wait_for_stable", response_model=ActionResponse)
+async def do_wait_for_stable(req: WaitForStableRequest, request: Request = None):
+    """Wait until the page is stable: network idle + DOM quiet (adaptive settle)"""
+    try:
+        session = session_manager.get_session(req.session_id)
+        if not session or not session.is_alive():
+            return ActionResponse(success=False, error="Session not found")
+
+        result = await session.wait_for_stable(quiet_ms=req.quiet_ms, timeout_ms=req.timeout, network=req.network)
+        logger.info(f"⏳ Wait for stable: {'stable' if result['stable'] else 'timeout'} in {result['elapsed_ms']}ms")
+
+        response = ActionResponse(
+            success=result["stable"],
+            executed_with="playwright",
+            error=None if result["stable"] else f"Page not stable after {req.timeout}ms",
+            details=result
+        )
+
+        await capture_after_action(response, session, "browser", req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
+
+        return negotiate_response(request, response)
+    except Exception as e:
+        return ActionResponse(success=False, error=str(e))
+
+@app.post("/browser/wait_for_network_idle", response_model=ActionResponse)
+async def do_wait_for_network_idle(req: WaitForNetworkIdleRequest, request: Request = None):
+    """Wait until no request has been in flight for idle_ms"""
+    try:
+        session = session_manager.get_session(req.session_id)
+        if not session or not session.is_alive():
+            return ActionResponse(success=False, error="Session not found")
+
+        result = await session.wait_for_network_idle(idle_ms=req.idle_ms, timeout_ms=req.timeout)
+        logger.info(f"⏳ Wait for network idle: {'idle' if result['idle'] else 'timeout'} in {result['elapsed_ms']}ms")
+
+        response = ActionResponse(
+            success=result["idle"],
+            executed_with="playwright",
+            error=None if result["idle"] else f"Network not idle after {req.timeout}ms ({result['pending']} pending)",
+            details=result
+        )
+
+        await capture_after_action(response, session, "browser", req.include_screenshot, include_snapshot=False,
+                                   screenshot_options=req.screenshot_options)
+
+        return negotiate_response(request, response)
     except Exception as e:
         return ActionResponse(success=False, error=str(e))
 
+# ============================================================================
+# v10.14.0: BATCHED ACTIONS
+# ============================================================================
+
+# action -> (request model, handler). Steps reuse the single-action endpoints
+# unchanged; the batch only suppresses their own screenshot/snapshot.
+BATCH_ACTIONS: Dict[str, Tuple[type, Any]] = {
+    "click": (ClickRequest, do_click),
+    "type": (TypeRequest, do_type),
+    "scroll": (ScrollRequest, do_scroll),
+    "keypress": (KeypressRequest, do_keypress),
+    "hold_key": (HoldKeyRequest, do_hold_key),
+    "wait": (WaitRequest, do_wait),
+    "click_by_ref": (ClickByRefRequest, do_click_by_ref),
+    "hover": (HoverRequest, do_hover),
+    "drag": (DragRequest, do_drag),
+    "select_option": (SelectOptionRequest, do_select_option),
+    "file_upload": (FileUploadRequest, do_file_upload),
+    "wait_for_selector": (WaitForSelectorRequest, do_wait_for_selector),
+    "wait_for_load_state": (WaitForLoadStateRequest, do_wait_for_load_state),
+    "wait_for_stable": (WaitForStableRequest, do_wait_for_stable),
+    "wait_for_network_idle": (WaitForNetworkIdleRequest, do_wait_for_network_idle),
+}
+
+@app.post("/batch", response_model=BatchResponse)
+async def do_batch(req: BatchRequest, request: Request = None):
+    """
+    Execute an ordered list of actions against one session in a single round trip.
+    Per-step results carry no screenshot/snapshot; one final capture is returned.
+    """
+    try:
+        session = session_manager.get_session(req.session_id)
+        if not session or not session.is_alive():
+            return BatchResponse(success=False, error="Session not found")
+
+        logger.info(f"📦 Batch: {len(req.steps)} steps")
+        response = BatchResponse(success=True, executed_with="playwright")
+
+        for i, step in enumerate(req.steps):
+            model, handler = BATCH_ACTIONS[step.action]
+            start = time.monotonic()
+            # Force the batch session, no per-step capture (extra fields are ignored by pydantic)
+            params = {**step.params, "session_id": req.session_id,
+                      "include_screenshot": False, "snapshot": "none"}
+            try:
+                result = await handler(model(**params))
+            except Exception as e:
+                # Validation errors of the step params
+                result = ActionResponse(success=False, error=str(e))
+
+            if result.success:
+                if step.settle_after:
+                    await session.wait_for_stable()
+                if step.wait_after_ms > 0:
+                    await asyncio.sleep(step.wait_after_ms / 1000)
+
+            result.snapshot_policy = None
+            result.timings = {"step": round((time.monotonic() - start) * 1000, 1)}
+            response.results.append(result)
+            response.completed = i + 1
+
+            if not result.success:
+                logger.warning(f"📦 Batch step {i} ({step.action}) failed: {result.error}")
+                if response.failed_step is None:
+                    response.failed_step = i
+                    response.success = False
+                    response.error = f"Step {i} ({step.action}) failed: {result.error}"
+                if req.stop_on_error:
+                    break
+
+        response.details = {"steps": len(req.steps), "completed": response.completed}
+        await capture_after_action(response, session, "browser", req.include_screenshot,
+                                   screenshot_options=req.screenshot_options,
+                                   snapshot_since=req.snapshot_since, snapshot_policy=req.snapshot)
+
+        return negotiate_response(request, response)
+    except Exception as e:
+        return BatchResponse(success=False, error=str(e))
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check: comma-separated list of tags, '*' matches any, W/ ignored (weak comparison)"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
 @app.get("/browser/snapshot")
-async def browser_snapshot(session_id: str = Query(...), format: str = Query("text")):
+async def browser_snapshot(request: Request, response: Response, session_id: str = Query(...),
+                           format: str = Query("text"), since: Optional[int] = Query(None)):
     """
     Get page snapshot in text format (Playwright MCP style).
     Returns a text representation of interactive elements with ref IDs.
+
+    v10.8.0: `since` returns only the diff against that generation
+    (full snapshot if the generation is no longer available).
+    v10.13.0: ETag = snapshot generation + representation (format, since);
+    If-None-Match on an unchanged page -> 304.
     """
     session = session_manager.get_session(session_id)
     if not session or not session.is_alive():
@@ -2344,19 +4840,115 @@ async def browser_snapshot(session_id: str = Query(...), format: str = Query("te
     if not tree:
         return {"success": False, "error": "Failed to get accessibility tree"}
 
+    generation = tree.get('generation')
+    if generation:
+        # The body differs per format and per diff base: each is its own representation
+        etag = f'"{session_id}-{generation}-{format}-{"full" if since is None else since}"'
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        session.last_delivered_generation = generation
+
     if format == "text":
         # Return text snapshot with ref IDs for LLM consumption
+        diff = session.diff_snapshot(since, generation) if since is not None and generation else None
         return {
             "success": True,
             "url": tree.get('url'),
             "title": tree.get('title'),
-            "snapshot": tree.get('text_snapshot', ''),
-            "ref_count": tree.get('ref_count', 0)
+            "snapshot": None if diff is not None else tree.get('text_snapshot', ''),
+            "ref_count": tree.get('ref_count', 0),
+            "generation": generation,
+            "diff": diff,
+            "timings": current_timings()  # v10.30.0
         }
     else:
         return {"success": True, **tree}
 
 # Browser endpoints
+# ============================================================================
+# v10.18.0: LIVE SCREENCAST ENDPOINTS
+# ============================================================================
+# WebSocket: binary messages = JPEG frames, text messages = JSON control
+# ({"type": "hello"|"keepalive"|"error"}). Frames are only sent when the page
+# visually changes. Token via ?token= or X-Tool-Token (AuthMiddleware does
+# not see WebSocket connections, so it is checked here).
+
+@app.websocket("/browser/screencast/{session_id}")
+async def browser_screencast_ws(websocket: WebSocket, session_id: str, token: str = "",
+                                max_fps: int = SCREENCAST_MAX_FPS, quality: int = SCREENCAST_QUALITY,
+                                max_width: int = SCREENCAST_MAX_WIDTH, max_height: int = SCREENCAST_MAX_HEIGHT):
+    provided_token = token or websocket.headers.get("x-tool-token", "")
+    if SECURITY_TOKEN and provided_token != SECURITY_TOKEN:
+        logger.warning(f"🔐 AUTH BLOCKED: Invalid token for screencast {session_id}")
+        await websocket.close(code=1008)
+        return
+
+    session = session_manager.get_session(session_id)
+    if not session or not session.is_alive():
+        await websocket.close(code=1011, reason="Session not found")
+        return
+
+    await websocket.accept()
+    try:
+        hub, viewer = await session.screencast_subscribe(max_fps, quality, max_width, max_height)
+    except Exception as e:
+        await websocket.send_json({"type": "error", "error": f"Screencast failed: {e}"})
+        await websocket.close(code=1011)
+        return
+    try:
+        await websocket.send_json({"type": "hello", "session_id": session_id, **hub.settings})
+        while True:
+            try:
+                frame = await asyncio.wait_for(viewer.get(), timeout=2.0)
+            except asyncio.TimeoutError:
+                if not session.is_alive():
+                    await websocket.send_json({"type": "error", "error": "Session closed"})
+                    break
+                await session.screencast_follow_page()
+                # Detects viewers that went away while the page was static
+                await websocket.send_json({"type": "keepalive", "frames": hub.frames})
+                continue
+            await websocket.send_bytes(frame)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning(f"⚠️ Screencast viewer error: {e}")
+    finally:
+        await session.screencast_unsubscribe(viewer)
+
+@app.get("/browser/screencast/{session_id}/mjpeg")
+async def browser_screencast_mjpeg(request: Request, session_id: str,
+                                   max_fps: int = SCREENCAST_MAX_FPS, quality: int = SCREENCAST_QUALITY,
+                                   max_width: int = SCREENCAST_MAX_WIDTH, max_height: int = SCREENCAST_MAX_HEIGHT):
+    """MJPEG stream (multipart/x-mixed-replace) for <img src=...> viewers"""
+    session = session_manager.get_session(session_id)
+    if not session or not session.is_alive():
+        return JSONResponse(status_code=404, content={"success": False, "error": "Session not found"})
+
+    try:
+        hub, viewer = await session.screencast_subscribe(max_fps, quality, max_width, max_height)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"success": False, "error": f"Screencast failed: {e}"})
+
+    async def frames():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    frame = await asyncio.wait_for(viewer.get(), timeout=2.0)
+                except asyncio.TimeoutError:
+                    if not session.is_alive():
+                        break
+                    await session.screencast_follow_page()
+                    continue
+                yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                       + str(len(frame)).encode() + b"\r\n\r\n" + frame + b"\r\n")
+        finally:
+            await session.screencast_unsubscribe(viewer)
+
+    return StreamingResponse(frames(), media_type="multipart/x-mixed-replace; boundary=frame",
+                             headers={"Cache-Control": "no-store"})
+
 @app.post("/browser/start")
 async def browser_start(req: BrowserStartRequest):
     if not PLAYWRIGHT_AVAILABLE:
@@ -2364,23 +4956,24 @@ async def browser_start(req: BrowserStartRequest):
         raise HTTPException(500, "Playwright not available")
 
     send_clawdbot_message(f"Starting browser session...")
-    sid = await session_manager.create_session(req.start_url, req.headless)
+    try:
+        sid = await session_manager.create_session(req.start_url, req.headless, req.snapshot_policy, req.backend)
+    except ValueError as e:
+        raise HTTPException(409, str(e))
     session = session_manager.get_session(sid)
 
     response = {
         "success": True,
         "session_id": sid,
+        "backend": session.backend if session else None,  # v10.31.0
         "current_url": session.page.url if session and session.page else None,
-        "viewport": {"width": VIEWPORT_WIDTH, "height": VIEWPORT_HEIGHT}
+        "viewport": {"width": VIEWPORT_WIDTH, "height": VIEWPORT_HEIGHT},
+        "snapshot_policy": req.snapshot_policy
     }
 
     # v10.2.0: ALWAYS include snapshot for browser actions
     if session and session.is_alive():
-        snap, snap_url, snap_title, snap_count = await take_auto_snapshot(session)
-        response["snapshot"] = snap
-        response["snapshot_url"] = snap_url
-        response["snapshot_title"] = snap_title
-        response["snapshot_ref_count"] = snap_count
+        response.update(await take_auto_snapshot(session))
 
     start_url = req.start_url or "about:blank"
     send_clawdbot_message(f"Browser ready: {start_url}", "success")
@@ -2391,12 +4984,35 @@ async def browser_start(req: BrowserStartRequest):
 async def browser_stop(session_id: str = Query(...)):
     return {"success": await session_manager.close_session(session_id)}
 
+@app.post("/browser/snapshot_policy")
+async def browser_snapshot_policy(req: SnapshotPolicyRequest):
+    """Set the default snapshot policy for actions on this session (v10.13.0)"""
+    session = session_manager.get_session(req.session_id)
+    if not session:
+        return {"success": False, "error": "Session not found"}
+    session.snapshot_policy = req.policy
+    logger.info(f"📸 Snapshot policy for {req.session_id}: {req.policy}")
+    return {"success": True, "session_id": req.session_id, "policy": req.policy}
+
+@app.post("/browser/capture_policy")
+async def browser_capture_policy(req: CapturePolicyRequest):
+    """Set what console/network events this session records (v10.24.0)"""
+    session = session_manager.get_session(req.session_id)
+    if not session:
+        return {"success": False, "error": "Session not found"}
+    policy = session.set_capture_policy(
+        reset=req.reset, console=req.console, console_types=req.console_types, network=req.network,
+        resource_types=req.resource_types, capture_headers=req.capture_headers, sample_rate=req.sample_rate)
+    logger.info(f"🎛️ Capture policy for {req.session_id}: {policy}")
+    return {"success": True, "session_id": req.session_id, "policy": policy}
+
 @app.get("/browser/status")
 async def browser_status(session_id: Optional[str] = None):
     if session_id:
         s = session_manager.get_session(session_id)
-        return {"session_id": session_id, "is_alive": s.is_alive(), "current_url": s.page.url if s and s.page else None} if s else {"error": "Not found"}
-    return {"sessions": [{"session_id": k, "is_alive": v.is_alive()} for k, v in session_manager.sessions.items()]}
+        return {"session_id": session_id, "is_alive": s.is_alive(), "backend": s.backend, "current_url": s.page.url if s and s.page else None} if s else {"error": "Not found"}
+    return {"sessions": [{"session_id": k, "is_alive": v.is_alive(), "backend": v.backend} for k, v in session_manager.sessions.items()],
+            "shared_browsers": shared_browsers.status()}  # v10.31.0
 
 @app.post("/browser/navigate")
 async def browser_navigate(req: NavigateRequest):
@@ -2409,20 +5025,20 @@ async def browser_navigate(req: NavigateRequest):
     send_clawdbot_message(f"Navigating to {req.url}...")
 
     try:
-        await session.page.goto(req.url, wait_until="domcontentloaded", timeout=30000)
+        with span("action"):
+            await session.page.goto(req.url, wait_until="domcontentloaded", timeout=30000)
         logger.info(f"🌐 Navigate: {req.url}")
 
         response = {"success": True, "url": session.page.url}
 
         # v10.2.0: ALWAYS include snapshot for browser actions
-        snap, snap_url, snap_title, snap_count = await take_auto_snapshot(session)
-        response["snapshot"] = snap
-        response["snapshot_url"] = snap_url
-        response["snapshot_title"] = snap_title
-        response["snapshot_ref_count"] = snap_count
+        # v10.8.0: Navigation always ships the full snapshot (new diff baseline)
+        snap = await take_auto_snapshot(session)
+        response.update(snap)
 
         # Send success message with page title
-        send_clawdbot_message(f"Page loaded: {snap_title or session.page.url}", "success")
+        send_clawdbot_message(f"Page loaded: {snap.get('snapshot_title') or session.page.url}", "success")
+        response["timings"] = current_timings()  # v10.30.0
 
         return response
     except Exception as e:
@@ -2571,6 +5187,81 @@ async def browser_tracing_stop(req: TracingStopRequest):
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# v10.25.0: HAR recording
+@app.post("/browser/har/start")
+async def browser_har_start(req: HarStartRequest):
+    """Start streaming finished requests of the session to a HAR file on disk"""
+    try:
+        session = session_manager.get_session(req.session_id)
+        if not session or not session.is_alive():
+            return {"success": False, "error": "Session not found"}
+        recorder = session.start_har(req.include_bodies, req.max_body_bytes, req.resource_types)
+        return {
+            "success": True,
+            "message": "HAR recording started",
+            "session_id": req.session_id,
+            "har_file": str(recorder.path),
+        }
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@app.post("/browser/har/stop")
+async def browser_har_stop(req: HarStopRequest):
+    """Stop HAR recording; the file stays downloadable from GET /browser/har/{session_id}, also after /browser/stop"""
+    try:
+        session = session_manager.get_session(req.session_id)
+        if not session:
+            return {"success": False, "error": "Session not found"}
+        status = await session.stop_har()
+        return {
+            "success": True,
+            "message": "HAR recording stopped",
+            "har_file": status["writer"]["path"],
+            "entries": status["entries"],
+            "bytes": status["writer"]["bytes"],
+            "dropped": status["writer"]["dropped"],
+            "download": f"/browser/har/{req.session_id}"
+        }
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@app.get("/browser/har/{session_id}")
+async def browser_har_download(session_id: str, format: Literal["har", "jsonl"] = "har"):
+    """
+    Download the session's HAR (v10.25.0), streamed from disk.
+    format=har assembles a HAR 1.2 document, format=jsonl returns one entry per line.
+    While recording, contains the entries written so far; finished recordings
+    stay available after the session is closed, until HAR retention deletes them.
+    """
+    info = har_archive.get(session_id)
+    path = Path(info["har_file"]) if info else None
+    if not path or not path.exists():
+        raise HTTPException(404, "No HAR recorded for this session")
+    if format == "jsonl":
+        return StreamingResponse(_iter_file(path), media_type="application/x-ndjson",
+                                 headers={"Content-Disposition": f'attachment; filename="{path.name}"'})
+    return StreamingResponse(iter_har_file(path), media_type="application/json",
+                             headers={"Content-Disposition": f'attachment; filename="{path.stem}.har"'})
+
+@app.get("/browser/har/{session_id}/status")
+async def browser_har_status(session_id: str):
+    session = session_manager.get_session(session_id)
+    if session and session._har:
+        return {"success": True, "recording": True, **session._har.status()}
+    info = har_archive.get(session_id)
+    if info:
+        return {"success": True, **info}
+    if not session:
+        return {"success": False, "error": "Session not found"}
+    return {"success": True, "recording": False, "har_file": None}
+
+@app.delete("/browser/har/{session_id}")
+async def browser_har_delete(session_id: str):
+    """Delete the session's finished HAR file (recordings in progress are kept)"""
+    if not har_archive.delete(session_id):
+        return {"success": False, "error": "No finished HAR recording for this session"}
+    return {"success": True, "session_id": session_id}
+
 @app.post("/browser/console")
 async def browser_console(req: ConsoleRequest):
     """Get captured console messages from browser session"""
@@ -2579,16 +5270,13 @@ async def browser_console(req: ConsoleRequest):
         if not session or not session.is_alive():
             return {"success": False, "error": "Session not found"}
 
-        messages = session.get_console_messages(
+        messages, cursor, missed = session.get_console_messages(
             types=req.types,
             limit=req.limit,
-            clear=req.clear
+            clear=req.clear,
+            since=req.since
         )
 
-        # v10.6.1: Save to file for external reading (Claude Code)
-        if messages:
-            _save_browser_console_to_file(req.session_id, messages)
-
         # Count by type
         type_counts = {}
         for m in messages:
@@ -2600,6 +5288,8 @@ async def browser_console(req: ConsoleRequest):
             "count": len(messages),
             "type_counts": type_counts,
             "messages": messages,
+            "cursor": cursor,  # v10.24.0: pass back as `since` to read only newer messages
+            "missed": missed,
             "cleared": req.clear
         }
     except Exception as e:
@@ -2613,11 +5303,12 @@ async def browser_network(req: NetworkRequest):
         if not session or not session.is_alive():
             return {"success": False, "error": "Session not found"}
 
-        requests_list = session.get_network_requests(
+        requests_list, cursor, missed = session.get_network_requests(
             types=req.types,
             status_filter=req.status_filter,
             limit=req.limit,
-            clear=req.clear
+            clear=req.clear,
+            since=req.since
         )
 
         # Summary stats
@@ -2637,6 +5328,8 @@ async def browser_network(req: NetworkRequest):
             "status_counts": status_counts,
             "type_counts": type_counts,
             "requests": requests_list,
+            "cursor": cursor,  # v10.24.0: pass back as `since` to read only newer requests
+            "missed": missed,
             "cleared": req.clear
         }
     except Exception as e:
@@ -2652,6 +5345,8 @@ class LogReadRequest(BaseModel):
     lines: int = 200  # Number of lines to return (from end)
     filter_level: Optional[str] = None  # Filter by log level: INFO, WARNING, ERROR
     filter_text: Optional[str] = None  # Filter by text content
+    since: Optional[str] = None  # v10.27.0: ISO date/datetime (offset/Z ok) or HH:MM[:SS] (today) - records at/after
+    until: Optional[str] = None  # v10.27.0: same formats - records at/before (whole day/minute/second given)
 
 class LogReadResponse(BaseModel):
     """Response with log content"""
@@ -2660,44 +5355,221 @@ class LogReadResponse(BaseModel):
     line_counts: Dict[str, int] = {}  # source -> number of lines
     error: Optional[str] = None
 
-def _read_log_file(path: Path, lines: int, filter_level: Optional[str], filter_text: Optional[str]) -> Tuple[str, int]:
-    """Read last N lines from log file with optional filtering"""
-    if not path.exists():
-        return f"Log file not found: {path}", 0
+# v10.27.0: Reverse tail reader + sparse block index over the log and its rotated backups.
+# A record is a header line "[timestamp] [LEVEL] ..." plus its continuation lines (tracebacks).
+LOG_BLOCK_BYTES = 64 * 1024
+LOG_RECORD_RE = re.compile(rb"^\[([^\]]+)\] \[([A-Za-z]+)\]")
+
 
+def _log_ts_key(ts: str) -> Optional[str]:
+    """Comparable timestamp 'YYYY-MM-DDTHH:MM:SS.mmm', None for time-only (pre-v10.27) lines"""
+    if len(ts) < 19 or ts[4] != "-":
+        return None
+    return ts[:10] + "T" + ts[11:23]
+
+
+def _log_filter_ts(value: Optional[str], upper: bool = False) -> Optional[str]:
+    """
+    since/until from the request -> comparable key, bounds inclusive at the
+    precision given (until=2026-10-16 covers the whole day, 10:05 the whole minute).
+    Accepts ISO dates/datetimes - with an offset or Z they are converted to local
+    time, like the log timestamps - and HH:MM[:SS[.fff]] meaning today.
+    Raises ValueError for anything else.
+    """
+    if not value:
+        return None
+    text = value.strip()
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})(?::(\d{2})(\.\d+)?)?", text)
+    if m:
+        hour, minute, second, fraction = m.groups()
+        text = f"{datetime.now():%Y-%m-%d}T{int(hour):02d}:{minute}" + (f":{second}{fraction or ''}" if second else "")
     try:
-        with open(path, 'r', encoding='utf-8', errors='replace') as f:
-            all_lines = f.readlines()
-
-        # Apply filters
-        filtered_lines = all_lines
-        if filter_level:
-            filtered_lines = [l for l in filtered_lines if f"[{filter_level.upper()}]" in l]
-        if filter_text:
-            filtered_lines = [l for l in filtered_lines if filter_text.lower() in l.lower()]
-
-        # Get last N lines
-        result_lines = filtered_lines[-lines:]
-        return "".join(result_lines), len(result_lines)
-    except Exception as e:
-        return f"Error reading log: {e}", 0
+        # Python < 3.11 fromisoformat does not take the Z suffix
+        parsed = datetime.fromisoformat(text[:-1] + "+00:00" if text.endswith(("Z", "z")) else text)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp {value!r}: expected an ISO date/datetime or HH:MM[:SS]")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+
+    if upper:
+        clock = re.split(r"[T ]", text, maxsplit=1)[1] if re.search(r"\d[T ]\d", text) else ""
+        clock = re.sub(r"(Z|z|[+-]\d{2}:?\d{2})$", "", clock)
+        if not clock:
+            parsed += timedelta(days=1, milliseconds=-1)
+        elif clock.count(":") == 1:
+            parsed += timedelta(minutes=1, milliseconds=-1)
+        elif "." not in clock:
+            parsed += timedelta(seconds=1, milliseconds=-1)
+    return parsed.strftime("%Y-%m-%dT%H:%M:%S.") + f"{parsed.microsecond // 1000:03d}"
+
+
+def _log_files(path: Path, backups: int) -> List[Path]:
+    """Current file first, then path.1 .. path.N (newest to oldest)"""
+    files = [path] + [path.with_name(f"{path.name}.{i}") for i in range(1, backups + 1)]
+    return [f for f in files if f.exists()]
+
+
+def _parse_record_header(line: bytes) -> Optional[Tuple[Optional[str], str]]:
+    m = LOG_RECORD_RE.match(line)
+    if not m:
+        return None
+    return _log_ts_key(m.group(1).decode("ascii", "replace")), m.group(2).decode("ascii").upper()
+
+
+def _iter_records_reverse(f, start: int, end: int, block_bytes: int = LOG_BLOCK_BYTES):
+    """Yield (ts, level, lines) records of f[start:end] newest first, reading blocks backwards from end"""
+    pos = end
+    partial = b""
+    continuation: List[bytes] = []
+    while pos > start:
+        size = min(block_bytes, pos - start)
+        pos -= size
+        f.seek(pos)
+        chunk = f.read(size) + partial
+        lines = chunk.split(b"\n")
+        partial = lines.pop(0) if pos > start else b""  # May continue in the previous block
+        for line in reversed(lines):
+            if not line:
+                continue
+            header = _parse_record_header(line)
+            if header is None:
+                continuation.append(line)
+                continue
+            continuation.append(line)
+            yield header[0], header[1], continuation[::-1]
+            continuation = []
+    if partial:
+        continuation.append(partial)
+    if continuation:
+        header = _parse_record_header(continuation[-1]) or (None, "")
+        yield header[0], header[1], continuation[::-1]
+
 
-def _save_browser_console_to_file(session_id: str, messages: List[Dict]) -> None:
-    """Save browser console messages to file for external reading"""
+class LogFileIndex:
+    """
+    Sparse index of one log file: blocks of ~LOG_BLOCK_BYTES that start on a
+    record boundary, each with the levels it contains and its first/last
+    timestamp. Rotated files never change; the active one is extended from its
+    last block as it grows and rebuilt when it is rotated (inode/size shrink).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.inode = None
+        self.size = 0
+        # (offset, end, levels, first_ts, last_ts)
+        self.blocks: List[Tuple[int, int, frozenset, Optional[str], Optional[str]]] = []
+
+    def refresh(self) -> "LogFileIndex":
+        st = self.path.stat()
+        if st.st_ino != self.inode or st.st_size < self.size:
+            self.inode, self.size, self.blocks = st.st_ino, 0, []
+        if st.st_size == self.size:
+            return self
+        # The last block may have ended mid-record at the old EOF: redo it
+        offset = self.blocks.pop()[0] if self.blocks else 0
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            block_start, levels, first_ts, last_ts = offset, set(), None, None
+            pos = offset
+            for line in f:
+                header = _parse_record_header(line)
+                if header is not None:
+                    if pos - block_start >= LOG_BLOCK_BYTES:
+                        self.blocks.append((block_start, pos, frozenset(levels), first_ts, last_ts))
+                        block_start, levels, first_ts, last_ts = pos, set(), None, None
+                    ts, level = header
+                    levels.add(level)
+                    if ts:
+                        first_ts = first_ts or ts
+                        last_ts = ts
+                pos += len(line)
+            if pos > block_start:
+                self.blocks.append((block_start, pos, frozenset(levels), first_ts, last_ts))
+        self.size = pos
+        return self
+
+
+_log_indexes: Dict[Path, LogFileIndex] = {}
+_log_index_lock = threading.Lock()
+
+
+def _read_log_file(path: Path, lines: int, filter_level: Optional[str], filter_text: Optional[str],
+                   since: Optional[str] = None, until: Optional[str] = None,
+                   backups: int = LOG_FILE_BACKUPS) -> Tuple[str, int]:
+    """
+    Last N lines of a log and its rotated backups, with optional filtering.
+    Only whole records are returned: a record (with its traceback lines) that
+    would not fit in N is left out, except the newest one, which is always whole.
+    v10.27.0: reads backwards from EOF and stops at N; level/time filters skip
+    index blocks that cannot match instead of scanning them.
+    """
+    files = _log_files(path, backups)
+    if not files:
+        return f"Log file not found: {path}", 0
+    if lines <= 0:
+        return "", 0
+
+    level = filter_level.upper() if filter_level else None
+    text = filter_text.lower() if filter_text else None
+    since_key, until_key = _log_filter_ts(since), _log_filter_ts(until, upper=True)
+    indexed = bool(level or since_key or until_key)
+
+    collected: List[List[bytes]] = []  # Records, newest first
+    count = 0
+    full = False  # N lines reached (or the next record would not fit)
+    reached_since = False  # Older records (and older backups) cannot match
     try:
-        with open(BROWSER_CONSOLE_LOG_PATH, 'a', encoding='utf-8') as f:
-            for msg in messages:
-                timestamp = msg.get("timestamp", datetime.now().isoformat())
-                msg_type = msg.get("type", "LOG").upper()
-                text = msg.get("text", "")
-                location = msg.get("location", {})
-                loc_str = f"{location.get('url', '')}:{location.get('line', 0)}" if location.get('url') else ""
-                f.write(f"[{timestamp}] [{msg_type}] [{session_id[:8]}] {text}")
-                if loc_str:
-                    f.write(f" @ {loc_str}")
-                f.write("\n")
+        for file_path in files:
+            since_in_file = False
+            if indexed:
+                with _log_index_lock:
+                    index = _log_indexes.get(file_path)
+                    if index is None:
+                        index = _log_indexes[file_path] = LogFileIndex(file_path)
+                    blocks = list(index.refresh().blocks)
+                ranges = []
+                for offset, end, levels, first_ts, last_ts in reversed(blocks):
+                    if since_key and last_ts and last_ts < since_key:
+                        since_in_file = True
+                        break
+                    if level and level not in levels:
+                        continue
+                    if until_key and first_ts and first_ts > until_key:
+                        continue
+                    ranges.append((offset, end))
+            else:
+                ranges = [(0, file_path.stat().st_size)]
+
+            with open(file_path, "rb") as f:
+                for start, end in ranges:
+                    for ts, rec_level, record in _iter_records_reverse(f, start, end):
+                        if since_key and ts and ts < since_key:
+                            reached_since = True
+                            break
+                        if until_key and ts and ts > until_key:
+                            continue
+                        if level and rec_level != level:
+                            continue
+                        if text and not any(text in l.decode("utf-8", "replace").lower() for l in record):
+                            continue
+                        if collected and count + len(record) > lines:
+                            full = True
+                            break
+                        collected.append(record)
+                        count += len(record)
+                        if count >= lines:
+                            full = True
+                            break
+                    if full or reached_since:
+                        break
+            if full or reached_since or since_in_file:
+                break
+
+        result = [l for record in reversed(collected) for l in record]
+        return "".join(l.decode("utf-8", "replace") + "\n" for l in result), len(result)
     except Exception as e:
-        logger.warning(f"Failed to save browser console to file: {e}")
+        return f"Error reading log: {e}", 0
 
 @app.post("/logs/read", response_model=LogReadResponse)
 async def read_logs(req: LogReadRequest):
@@ -2716,14 +5588,25 @@ async def read_logs(req: LogReadRequest):
     logs = {}
     line_counts = {}
 
+    try:
+        # v10.27.0: A since/until that does not parse is an error, not a silently dropped filter
+        _log_filter_ts(req.since)
+        _log_filter_ts(req.until, upper=True)
+    except ValueError as e:
+        return LogReadResponse(success=False, error=str(e))
+
     try:
         if req.source in ["server", "all"]:
-            content, count = _read_log_file(LOG_FILE_PATH, req.lines, req.filter_level, req.filter_text)
+            content, count = await asyncio.get_running_loop().run_in_executor(
+                None, _read_log_file, LOG_FILE_PATH, req.lines, req.filter_level, req.filter_text,
+                req.since, req.until, LOG_FILE_BACKUPS)
             logs["server"] = content
             line_counts["server"] = count
 
         if req.source in ["browser", "all"]:
-            content, count = _read_log_file(BROWSER_CONSOLE_LOG_PATH, req.lines, req.filter_level, req.filter_text)
+            content, count = await asyncio.get_running_loop().run_in_executor(
+                None, _read_log_file, BROWSER_CONSOLE_LOG_PATH, req.lines, req.filter_level, req.filter_text,
+                req.since, req.until, BROWSER_CONSOLE_LOG_BACKUPS)
             logs["browser"] = content
             line_counts["browser"] = count
 
@@ -2736,6 +5619,74 @@ async def read_logs(req: LogReadRequest):
         logger.error(f"Error reading logs: {e}")
         return LogReadResponse(success=False, error=str(e))
 
+@app.get("/logs/stream")
+async def stream_logs(
+    request: Request,
+    source: Literal["server", "browser", "all"] = "all",
+    filter_level: Optional[str] = None,
+    filter_text: Optional[str] = None,
+    cursor: Optional[int] = None,
+    backlog: int = 0,
+):
+    """
+    v10.28.0: Live tail -f of server and browser console logs as Server-Sent Events.
+
+    Each event is "id: <seq>" + "data: {seq, source, level, ts, text}". Resume with
+    ?cursor=<seq> or the Last-Event-ID header (EventSource does it on reconnect);
+    without a cursor the stream starts with the last `backlog` matching lines.
+    Lines that fell out of the in-memory buffer meanwhile are reported as an
+    "event: gap" with the number missed. Filters are applied server-side.
+
+        curl -N -H "X-Tool-Token: ..." "http://localhost:8766/logs/stream?filter_level=ERROR"
+    """
+    if cursor is None:
+        last_event_id = request.headers.get("last-event-id")
+        if last_event_id and last_event_id.isdigit():
+            cursor = int(last_event_id)
+    levels = {l.strip().upper() for l in filter_level.split(",")} if filter_level else None
+    text = filter_text.lower() if filter_text else None
+
+    def match(entry: Dict[str, Any]) -> bool:
+        if source != "all" and entry["source"] != source:
+            return False
+        if levels and entry["level"] not in levels:
+            return False
+        if text and text not in entry["text"].lower():
+            return False
+        return True
+
+    async def events():
+        waiter = log_broadcaster.register()
+        position = cursor
+        try:
+            if position is None:
+                position = log_broadcaster.seq
+                if backlog > 0:
+                    initial, position, _ = log_broadcaster.read(None, backlog, match)
+                    for entry in initial:
+                        yield f"id: {entry['seq']}\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+            yield "retry: 2000\n\n"
+            while True:
+                waiter[1].clear()
+                entries, position, missed = log_broadcaster.read(position, 500, match)
+                if missed:
+                    yield f"event: gap\ndata: {json.dumps({'missed': missed})}\n\n"
+                for entry in entries:
+                    yield f"id: {entry['seq']}\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+                if entries:
+                    continue  # More may be waiting beyond the page
+                if await request.is_disconnected():
+                    break
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), LOG_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            log_broadcaster.unregister(waiter)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/logs/paths")
 async def get_log_paths():
     """Return the paths to log files for direct file access"""
@@ -2908,7 +5859,7 @@ async def browser_verify_title(req: VerifyTitleRequest):
 @app.post("/coordinates/convert")
 async def coordinates_convert(x: int, y: int, from_space: str, to_space: str):
     rx, ry = x, y
-    sw, sh = pyautogui.size() if PYAUTOGUI_AVAILABLE else (1920, 1080)
+    sw, sh = await desktop.run("size") if desktop.available else (1920, 1080)
 
     if from_space == "normalized" and to_space == "viewport":
         rx, ry = CoordinateConverter.normalized_to_viewport(x, y)
@@ -2924,71 +5875,330 @@ async def coordinates_convert(x: int, y: int, from_space: str, to_space: str):
 # ============================================================================
 
 # Local services registry
+# v10.21.0: Per-upstream pool limits and timeouts (route_timeouts: path prefix -> seconds)
+# v10.23.0: health_path + health_fields (JSON field -> default) for the health monitor
 LOCAL_SERVICES = {
-    "claude_launcher": {"port": 3847, "base_path": "/api", "name": "Claude Launcher"},
-    "clawdbot": {"port": 8767, "base_path": "", "name": "Clawdbot Service"},
+    "claude_launcher": {"port": 3847, "base_path": "/api", "name": "Claude Launcher",
+                        "timeout": 30.0, "connect_timeout": 2.0,
+                        "max_connections": 20, "max_keepalive": 10, "route_timeouts": {},
+                        "health_path": "/api/health", "health_fields": {"sessions": 0}},
+    "clawdbot": {"port": 8767, "base_path": "", "name": "Clawdbot Service",
+                 # Longer timeout for browser automation tasks
+                 "timeout": 120.0, "connect_timeout": 2.0,
+                 "max_connections": 20, "max_keepalive": 10, "route_timeouts": {"health": 5.0},
+                 "health_path": "/health",
+                 "health_fields": {"version": "unknown", "browser_connected": False, "active_tasks": 0}},
 }
 
-async def forward_to_service(target_url: str, request: Request, timeout: float = 30.0) -> Response:
-    """Forward a request to a local service and return the response"""
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        # Forward headers (exclude hop-by-hop headers)
-        headers = {
-            k: v for k, v in request.headers.items()
-            if k.lower() not in ['host', 'content-length', 'transfer-encoding', 'connection']
+# v10.23.0: Background health polling of LOCAL_SERVICES
+SERVICE_HEALTH_INTERVAL = 10.0  # s between polls
+SERVICE_HEALTH_TIMEOUT = 3.0    # s per probe
+SERVICE_HEALTH_HISTORY = 30     # probes kept per service
+
+class UpstreamPool:
+    """
+    App-lifetime pooled httpx client for one LOCAL_SERVICES upstream (v10.21.0).
+    Keeps HTTP/1.1 connections alive between proxied requests and tracks
+    latency / in-flight usage for /services/status.
+    """
+
+    def __init__(self, key: str, config: Dict[str, Any]):
+        self.key = key
+        self.config = config
+        self.base_url = f"http://127.0.0.1:{config['port']}"
+        self._client: Optional[httpx.AsyncClient] = None
+        self._latencies: "deque[float]" = deque(maxlen=200)
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.config.get("timeout", 30.0),
+                                      connect=self.config.get("connect_timeout", 2.0)),
+                limits=httpx.Limits(max_connections=self.config.get("max_connections", 20),
+                                    max_keepalive_connections=self.config.get("max_keepalive", 10),
+                                    keepalive_expiry=30.0),
+            )
+        return self._client
+
+    def timeout_for(self, path: str) -> float:
+        """Per-route timeout: longest matching path prefix, else the service default"""
+        best, best_len = self.config.get("timeout", 30.0), -1
+        for prefix, seconds in self.config.get("route_timeouts", {}).items():
+            if path.startswith(prefix) and len(prefix) > best_len:
+                best, best_len = seconds, len(prefix)
+        return best
+
+    def begin(self) -> float:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return time.monotonic()
+
+    def record_latency(self, started: float):
+        """Time to upstream response headers (v10.22.0: bodies are streamed after this)"""
+        elapsed = time.monotonic() - started
+        self._latencies.append(elapsed * 1000)
+        PROXY_UPSTREAM_SECONDS.labels(self.key).observe(elapsed)  # v10.29.0
+
+    def finish(self, error: bool = False):
+        """Request done (body fully streamed or failed)"""
+        self.in_flight -= 1
+        if error:
+            self.errors += 1
+            PROXY_UPSTREAM_ERRORS.labels(self.key).inc()
+
+    def _pool_connections(self) -> Optional[int]:
+        """Open connections in the httpx pool (private API, best effort)"""
+        try:
+            return len(self._client._transport._pool.connections)
+        except Exception:
+            return None
+
+    def status(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        def pct(p: float) -> Optional[float]:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 1) if latencies else None
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "pool_connections": self._pool_connections() if self._client else 0,
+            "max_connections": self.config.get("max_connections", 20),
+            "latency_ms": {"last": round(self._latencies[-1], 1) if self._latencies else None,
+                           "p50": pct(0.5), "p95": pct(0.95)},
         }
 
-        # Forward body if present
-        body = None
-        if request.method in ["POST", "PUT", "PATCH"]:
-            body = await request.body()
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+upstream_pools: Dict[str, UpstreamPool] = {key: UpstreamPool(key, cfg) for key, cfg in LOCAL_SERVICES.items()}
+
+# v10.22.0: Hop-by-hop headers (RFC 7230 6.1) - never forwarded in either direction
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+                      "te", "trailer", "trailers", "transfer-encoding", "upgrade"}
+
+class GuardedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose on_close always runs once the response is done,
+    also when the body generator never started (client gone before the first
+    chunk): its finally would never run and the upstream response and the
+    pool in_flight slot would leak.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
 
+    async def __call__(self, scope, receive, send):
         try:
-            response = await client.request(
-                method=request.method,
-                url=target_url,
-                headers=headers,
-                content=body,
-                params=dict(request.query_params)
-            )
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._on_close()
 
-            # Filter response headers
-            response_headers = {
-                k: v for k, v in response.headers.items()
-                if k.lower() not in ['content-encoding', 'transfer-encoding', 'content-length']
-            }
+async def forward_to_service(service: str, path: str, request: Request) -> Response:
+    """
+    Forward a request to a local service over its pooled client.
+    v10.22.0: Streaming passthrough - the request body is streamed upstream and
+    the upstream body (incl. chunked / SSE) is streamed back as it arrives,
+    undecoded, so memory stays flat regardless of payload size.
+    """
+    pool = upstream_pools[service]
+    target_url = f"{pool.config['base_path']}/{path}"
 
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=response_headers,
-                media_type=response.headers.get('content-type')
-            )
-        except httpx.ConnectError:
-            raise HTTPException(status_code=503, detail=f"Service unavailable: {target_url}")
-        except httpx.TimeoutException:
-            raise HTTPException(status_code=504, detail=f"Service timeout: {target_url}")
+    # Forward headers (exclude hop-by-hop headers; host is set by httpx)
+    headers = {
+        k: v for k, v in request.headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() != 'host'
+    }
+
+    # Stream body if present (Content-Length, when given, is kept: no chunked re-encoding)
+    body = None
+    if request.method in ["POST", "PUT", "PATCH"] or request.headers.get("content-length", "0") != "0":
+        body = request.stream()
+
+    started = pool.begin()
+    try:
+        upstream_request = pool.client.build_request(
+            method=request.method,
+            url=target_url,
+            headers=headers,
+            content=body,
+            params=dict(request.query_params),
+            # Full Timeout: a bare float would also replace the short connect timeout
+            timeout=httpx.Timeout(pool.timeout_for(path), connect=pool.config.get("connect_timeout", 2.0))
+        )
+        response = await pool.client.send(upstream_request, stream=True)
+        pool.record_latency(started)
+    except httpx.ConnectError:
+        pool.finish(error=True)
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {pool.base_url}{target_url}")
+    except httpx.TimeoutException:
+        pool.finish(error=True)
+        raise HTTPException(status_code=504, detail=f"Service timeout: {pool.base_url}{target_url}")
+    except Exception:
+        pool.finish(error=True)
+        raise
+
+    # Filter response headers (raw bytes are relayed: content-encoding/length stay valid)
+    response_headers = {
+        k: v for k, v in response.headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS
+    }
+
+    state = {"error": False, "closed": False}
+
+    async def close():
+        """Idempotent: runs from relay() and again from the response guard"""
+        if state["closed"]:
+            return
+        state["closed"] = True
+        await response.aclose()
+        pool.finish(error=state["error"])
+
+    async def relay():
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        except httpx.HTTPError as e:
+            state["error"] = True
+            logger.warning(f"[Gateway] Upstream stream from {pool.key} interrupted: {e}")
+        finally:
+            await close()
+
+    return GuardedStreamingResponse(
+        relay(),
+        on_close=close,
+        status_code=response.status_code,
+        headers=response_headers,
+        media_type=response.headers.get('content-type')
+    )
+
+@app.on_event("shutdown")
+async def close_gateway_clients():
+    """v10.21.0: Close app-lifetime HTTP clients"""
+    for pool in upstream_pools.values():
+        await pool.close()
+    await clawdbot_notifier.close()
+    # v10.26.0: Drain the console sink
+    await asyncio.get_running_loop().run_in_executor(None, browser_console_sink.close)
+    if trace_writer is not None:
+        await asyncio.get_running_loop().run_in_executor(None, trace_writer.close)
+    # v10.31.0: Shared browser (its contexts close with it)
+    await shared_browsers.close()
 
 @app.api_route("/proxy/claude-launcher/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def proxy_claude_launcher(path: str, request: Request):
     """Proxy requests to Claude Launcher API (porta 3847)"""
-    service = LOCAL_SERVICES["claude_launcher"]
-    target_url = f"http://127.0.0.1:{service['port']}{service['base_path']}/{path}"
     logger.info(f"[Gateway] Proxying to Claude Launcher: {request.method} {path}")
-    return await forward_to_service(target_url, request, timeout=30.0)
+    return await forward_to_service("claude_launcher", path, request)
 
 @app.api_route("/proxy/clawdbot/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def proxy_clawdbot(path: str, request: Request):
     """Proxy requests to Clawdbot Service (porta 8767)"""
-    service = LOCAL_SERVICES["clawdbot"]
-    target_url = f"http://127.0.0.1:{service['port']}/{path}"
     logger.info(f"[Gateway] Proxying to Clawdbot: {request.method} {path}")
-    # Longer timeout for browser automation tasks
-    return await forward_to_service(target_url, request, timeout=120.0)
+    return await forward_to_service("clawdbot", path, request)
+
+class ServiceHealthMonitor:
+    """
+    Polls every LOCAL_SERVICES health endpoint concurrently every
+    SERVICE_HEALTH_INTERVAL seconds (v10.23.0). /services/status answers from
+    the cached results; probe_all() forces a fresh concurrent round
+    (concurrent callers share the same round).
+    """
+
+    def __init__(self):
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._history: Dict[str, "deque[Dict[str, Any]]"] = {
+            key: deque(maxlen=SERVICE_HEALTH_HISTORY) for key in LOCAL_SERVICES
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._round: Optional[asyncio.Future] = None
+
+    async def probe(self, key: str) -> Dict[str, Any]:
+        config = LOCAL_SERVICES[key]
+        result: Dict[str, Any] = {"status": "offline", "port": config["port"]}
+        started = time.monotonic()
+        try:
+            resp = await upstream_pools[key].client.get(config["health_path"], timeout=SERVICE_HEALTH_TIMEOUT)
+            data = resp.json() if resp.status_code == 200 else {}
+            result["status"] = "running" if resp.status_code == 200 else "error"
+            for field, default in config.get("health_fields", {}).items():
+                result[field] = data.get(field, default) if isinstance(data, dict) else default
+        except Exception as e:
+            result["error"] = type(e).__name__
+        result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        result["checked_at"] = datetime.now().isoformat(timespec="seconds")
+
+        previous = self._results.get(key)
+        result["since"] = previous["since"] if previous and previous["status"] == result["status"] else result["checked_at"]
+        self._results[key] = result
+        self._history[key].append({"at": result["checked_at"], "status": result["status"],
+                                   "latency_ms": result["latency_ms"]})
+        return result
+
+    async def probe_all(self) -> Dict[str, Dict[str, Any]]:
+        if self._round is None or self._round.done():
+            self._round = asyncio.ensure_future(asyncio.gather(*(self.probe(key) for key in LOCAL_SERVICES)))
+        await asyncio.shield(self._round)
+        return self._results
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_all()
+            except Exception as e:
+                logger.warning(f"⚠️ Service health poll failed: {e}")
+            await asyncio.sleep(SERVICE_HEALTH_INTERVAL)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self, include_history: bool = True) -> Dict[str, Dict[str, Any]]:
+        results = {}
+        for key, result in self._results.items():
+            entry = dict(result)
+            if include_history:
+                history = list(self._history[key])
+                up = sum(1 for h in history if h["status"] == "running")
+                entry["history"] = history
+                entry["uptime_pct"] = round(up * 100 / len(history), 1) if history else None
+            results[key] = entry
+        return results
+
+service_health = ServiceHealthMonitor()
+
+@app.on_event("startup")
+async def start_service_health_monitor():
+    service_health.start()
+
+@app.on_event("shutdown")
+async def stop_service_health_monitor():
+    await service_health.stop()
 
 @app.get("/services/status")
-async def services_status():
-    """Health check of all desktop apps managed by this gateway"""
+async def services_status(fresh: bool = Query(False), history: bool = Query(True)):
+    """
+    Health check of all desktop apps managed by this gateway.
+    v10.23.0: Served from the background poller cache; fresh=1 re-probes all services concurrently.
+    """
+    if fresh or not service_health.snapshot(include_history=False):
+        await service_health.probe_all()
+
     results = {
         "tool_server": {
             "status": "running",
@@ -2997,39 +6207,10 @@ async def services_status():
             "ngrok_url": NGROK_PUBLIC_URL
         }
     }
+    results.update(service_health.snapshot(include_history=history))
 
-    async with httpx.AsyncClient(timeout=3.0) as client:
-        # Check Claude Launcher
-        try:
-            resp = await client.get(f"http://127.0.0.1:{LOCAL_SERVICES['claude_launcher']['port']}/api/health")
-            data = resp.json() if resp.status_code == 200 else {}
-            results["claude_launcher"] = {
-                "status": "running" if resp.status_code == 200 else "error",
-                "port": LOCAL_SERVICES["claude_launcher"]["port"],
-                "sessions": data.get("sessions", 0) if isinstance(data, dict) else 0
-            }
-        except Exception:
-            results["claude_launcher"] = {
-                "status": "offline",
-                "port": LOCAL_SERVICES["claude_launcher"]["port"]
-            }
-
-        # Check Clawdbot Service
-        try:
-            resp = await client.get(f"http://127.0.0.1:{LOCAL_SERVICES['clawdbot']['port']}/health")
-            data = resp.json() if resp.status_code == 200 else {}
-            results["clawdbot"] = {
-                "status": "running" if resp.status_code == 200 else "error",
-                "port": LOCAL_SERVICES["clawdbot"]["port"],
-                "version": data.get("version", "unknown"),
-                "browser_connected": data.get("browser_connected", False),
-                "active_tasks": data.get("active_tasks", 0)
-            }
-        except Exception:
-            results["clawdbot"] = {
-                "status": "offline",
-                "port": LOCAL_SERVICES["clawdbot"]["port"]
-            }
+    # v10.21.0: Proxy pool usage + latency per upstream
+    results["gateway"] = {key: pool.status() for key, pool in upstream_pools.items()}
 
     return results
 